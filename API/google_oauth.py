@@ -0,0 +1,95 @@
+# this is a cache of Google's OpenID configuration (discovery document) and its signing keys (JWKS)
+# the id_token that Google returns with the access token is verified locally against the cached keys, so the Google login doesn't need to call the userinfo endpoint
+import threading
+import time
+
+import jwt
+
+from API.http_client import outbound_http
+
+# the issuers that Google puts in its id_tokens
+google_issuers = ("https://accounts.google.com", "accounts.google.com")
+
+
+class GoogleProviderConfig:
+    def __init__(self, discovery_url, client_id, ttl_seconds=3600) -> None:
+        self.discovery_url = discovery_url
+        self.client_id = client_id
+        self.ttl_seconds = ttl_seconds
+
+        self.__discovery_document = None
+        self.__signing_keys = {}  # key id -> jwt.PyJWK
+        self.__fetched_at = 0.0
+        self.__lock = threading.Lock()
+        self.__refreshing = False
+
+    # a private method that downloads the discovery document and the keys that it points to
+    def __fetch(self) -> None:
+        discovery_response = outbound_http.get(self.discovery_url)
+        discovery_response.raise_for_status()
+        discovery_document = discovery_response.json()
+
+        jwks_response = outbound_http.get(discovery_document["jwks_uri"])
+        jwks_response.raise_for_status()
+        signing_keys = {
+            key["kid"]: jwt.PyJWK(key) for key in jwks_response.json()["keys"]
+        }
+
+        with self.__lock:
+            self.__discovery_document = discovery_document
+            self.__signing_keys = signing_keys
+            self.__fetched_at = time.monotonic()
+
+    # a private method that refreshes the cache in a background thread, the requests keep using the old values meanwhile
+    def __refresh_in_background(self) -> None:
+        with self.__lock:
+            if self.__refreshing:
+                return
+            self.__refreshing = True
+
+        def refresh():
+            try:
+                self.__fetch()
+            except Exception as error:
+                print(f"Cannot refresh Google's OpenID configuration: {error}")
+            finally:
+                with self.__lock:
+                    self.__refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    # get the cached discovery document, only the first call waits for the download
+    def get_config(self) -> dict:
+        if self.__discovery_document is None:
+            self.__fetch()
+        elif time.monotonic() - self.__fetched_at > self.ttl_seconds:
+            self.__refresh_in_background()
+        return self.__discovery_document
+
+    # a private method that finds the key that signed the token
+    def __get_signing_key(self, key_id):
+        self.get_config()
+        signing_key = self.__signing_keys.get(key_id)
+        # Google rotates its keys -> download them again if the key is not known yet
+        if signing_key is None:
+            self.__fetch()
+            signing_key = self.__signing_keys.get(key_id)
+        if signing_key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key: {key_id}")
+        return signing_key
+
+    # verify the signature, audience, issuer and expiration of the id_token and return its claims
+    def verify_id_token(self, id_token) -> dict:
+        key_id = jwt.get_unverified_header(id_token).get("kid")
+        signing_key = self.__get_signing_key(key_id)
+
+        claims = jwt.decode(
+            id_token,
+            signing_key.key,
+            algorithms=["RS256"],
+            audience=self.client_id,
+            options={"verify_iss": False},
+        )
+        if claims.get("iss") not in google_issuers:
+            raise jwt.InvalidIssuerError(f"Invalid issuer: {claims.get('iss')}")
+        return claims
@@ -0,0 +1,116 @@
+# this is the one HTTP client that every outbound call (AWS, Google, SendGrid, Geocoding) goes through
+# it keeps a pool of keep-alive connections per host so the calls don't pay a new TCP + TLS handshake every time
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from get_env import (
+    http_connect_timeout,
+    http_pool_connections,
+    http_pool_maxsize,
+    http_read_timeout,
+)
+
+
+class OutboundHTTPClient:
+    def __init__(
+        self,
+        pool_connections=10,
+        pool_maxsize=10,
+        connect_timeout=3.05,
+        read_timeout=10,
+    ) -> None:
+        # the timeout that is used when the caller doesn't give one
+        self.default_timeout = (connect_timeout, read_timeout)
+
+        # pool_connections -> how many hosts keep a pool, pool_maxsize -> how many connections are kept per host
+        self.__adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.__session = requests.Session()
+        self.__session.mount("https://", self.__adapter)
+        self.__session.mount("http://", self.__adapter)
+
+        # host -> number of requests, errors and the total and maximum latency in seconds
+        self.__latency = {}
+        self.__lock = threading.Lock()
+
+    # a private method that adds the latency of one call to the counters of the host
+    def __record(self, host, elapsed, failed) -> None:
+        with self.__lock:
+            host_latency = self.__latency.setdefault(
+                host,
+                {"requests": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+            )
+            host_latency["requests"] += 1
+            host_latency["errors"] += int(failed)
+            host_latency["total_seconds"] += elapsed
+            host_latency["max_seconds"] = max(host_latency["max_seconds"], elapsed)
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.default_timeout)
+        host = urlsplit(url).netloc
+
+        start_time = time.perf_counter()
+        failed = True
+        try:
+            response = self.__session.request(method, url, **kwargs)
+            failed = response.status_code >= 500
+            return response
+        finally:
+            self.__record(host, time.perf_counter() - start_time, failed)
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    # latency and connection reuse counters per host
+    # new_connections counts the handshakes, reused_requests counts the requests that went through an open connection
+    def stats(self) -> dict:
+        connections = {}
+        pools = self.__adapter.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            host = pool.host
+            if pool.port not in (None, 80, 443):
+                host = f"{pool.host}:{pool.port}"
+            host_connections = connections.setdefault(
+                host, {"new_connections": 0, "pooled_requests": 0}
+            )
+            host_connections["new_connections"] += pool.num_connections
+            host_connections["pooled_requests"] += pool.num_requests
+
+        with self.__lock:
+            host_stats = {}
+            for host, host_latency in self.__latency.items():
+                host_connections = connections.get(
+                    host, {"new_connections": 0, "pooled_requests": 0}
+                )
+                host_stats[host] = {
+                    **host_latency,
+                    "average_seconds": host_latency["total_seconds"]
+                    / host_latency["requests"],
+                    "new_connections": host_connections["new_connections"],
+                    "reused_requests": max(
+                        host_connections["pooled_requests"]
+                        - host_connections["new_connections"],
+                        0,
+                    ),
+                }
+            return host_stats
+
+
+# the shared client of this process
+outbound_http = OutboundHTTPClient(
+    pool_connections=http_pool_connections,
+    pool_maxsize=http_pool_maxsize,
+    connect_timeout=http_connect_timeout,
+    read_timeout=http_read_timeout,
+)
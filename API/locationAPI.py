@@ -1,8 +1,7 @@
 # this function will create and send a Geocoding Google Map API to the google maps database to check if the user entered an acceptable address, city, country and postal code
 
 # _*_ coding: utf-8 _*_
-import requests
-
+from API.http_client import outbound_http
 from get_env import google_api_secret_key
 
 
@@ -32,7 +31,7 @@ class LocationValidator:
         url = "https://maps.googleapis.com/maps/api/geocode/json"
         # need to implement the api key
         params = {"address": address_string, "key": google_api_secret_key}
-        response = requests.get(url, params=params)
+        response = outbound_http.get(url, params=params)
 
         # check if the Geocoding API returned any results
         if response.status_code == 200:
@@ -0,0 +1,384 @@
+# this is the push notification delivery of the "Device Push Notification" verification method
+# the device tokens of every user are kept in the device_token table, a message to a user fans out to every device they registered
+# the requests put the messages in a queue and return right away, a background thread sends them to the provider in batches (up to 500 per call)
+# without a configured provider no notification is accepted at all (the requests get a 503 instead of a code that is never delivered)
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http import HTTPStatus
+
+from sqlalchemy import text
+
+from database.users_models import DeviceToken, Users, db
+from get_env import (
+    fcm_credentials_file,
+    push_batch_size,
+    push_flush_interval,
+    push_max_queue,
+    push_provider_name,
+)
+
+
+################################# PROVIDERS #################################
+# every provider sends a batch of (device token, title, body, data) messages
+# and returns (the messages that could not be sent, the device tokens that are not valid anymore)
+
+
+# Firebase Cloud Messaging, send_each sends up to 500 messages in one call
+# firebase-admin is only imported when this provider is used so the stub provider doesn't need it
+class FCMPushProvider:
+    max_batch_size = 500
+
+    def __init__(self, credentials_file) -> None:
+        import firebase_admin
+        from firebase_admin import credentials, messaging
+
+        self.messaging = messaging
+        self.app = firebase_admin.initialize_app(
+            credentials.Certificate(credentials_file), name="studyhub-push"
+        )
+
+    def send_batch(self, messages):
+        batch_response = self.messaging.send_each(
+            [
+                self.messaging.Message(
+                    token=device_token,
+                    notification=self.messaging.Notification(title=title, body=body),
+                    data=data,
+                )
+                for device_token, title, body, data in messages
+            ],
+            app=self.app,
+        )
+
+        failed_messages, invalid_tokens = [], []
+        for message, response in zip(messages, batch_response.responses):
+            if response.success:
+                continue
+            # the app has been uninstalled or the token has expired -> never send to it again
+            if isinstance(response.exception, self.messaging.UnregisteredError):
+                invalid_tokens.append(message[0])
+            else:
+                failed_messages.append(message)
+        return failed_messages, invalid_tokens
+
+
+# a provider that keeps the last messages in memory instead of sending them, only for local development and tests (PUSH_PROVIDER=stub)
+# the bodies hold the OTP codes and the verification links -> they are never printed, and only the last max_messages are kept
+class StubPushProvider:
+    max_batch_size = 500
+
+    def __init__(self, latency_seconds=0.0, max_messages=100) -> None:
+        self.latency_seconds = latency_seconds  # simulated time of a provider call
+        # (device token, title, body, data)
+        self.sent_messages = deque(maxlen=max_messages)
+        self.batch_sizes = deque(maxlen=max_messages)
+        self.__lock = threading.Lock()
+
+    def send_batch(self, messages):
+        time.sleep(self.latency_seconds)
+        with self.__lock:
+            self.sent_messages.extend(messages)
+            self.batch_sizes.append(len(messages))
+        return [], []
+
+
+# a function that creates the provider that is chosen in the environment variables, None if FCM is chosen but not configured
+def create_push_provider(provider_name):
+    if provider_name == "stub":
+        return StubPushProvider()
+    elif provider_name == "fcm":
+        if not fcm_credentials_file:
+            print("FCM is not configured, the push notifications are disabled!")
+            return None
+        return FCMPushProvider(credentials_file=fcm_credentials_file)
+    else:
+        raise ValueError(f"Unknown push provider: {provider_name}")
+
+
+################################# DEVICE TOKENS #################################
+class DeviceTokenRegistry:
+    def __init__(self, db, DeviceToken, Users) -> None:
+        self.db = db
+        self.table_name = DeviceToken.__tablename__
+        self.users_table_name = Users.__tablename__
+        self.__engine = None
+
+    # a private method that returns the engine, the first call has to come from a request (the background thread has no app context)
+    def __get_engine(self):
+        if self.__engine is None:
+            self.__engine = self.db.engine
+        return self.__engine
+
+    # register a device of a user, return False if the device belongs to another account
+    # a token that another user registered, or that is the verification of another user, is never moved (it would take over their OTP codes)
+    # with a session the device is registered in its transaction (a new user that is not committed yet)
+    def register(self, user_id, device_token, platform=None, session=None) -> bool:
+        statement = text(
+            f"""
+            INSERT INTO {self.table_name} (token, user_id, platform, created_at, last_seen_at)
+            SELECT :token, CAST(:user_id AS uuid), :platform, :now, :now
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {self.users_table_name}
+                WHERE verification_method = 'Device Push Notification'
+                AND verification = :token
+                AND user_id <> CAST(:user_id AS uuid)
+            )
+            ON CONFLICT (token) DO UPDATE
+            SET platform = EXCLUDED.platform, last_seen_at = EXCLUDED.last_seen_at
+            WHERE {self.table_name}.user_id = EXCLUDED.user_id
+            """
+        )
+        parameters = {
+            "token": device_token,
+            "user_id": str(user_id),
+            "platform": platform,
+            "now": datetime.utcnow(),
+        }
+        if session is not None:
+            return session.execute(statement, parameters).rowcount > 0
+        with self.__get_engine().begin() as connection:
+            return connection.execute(statement, parameters).rowcount > 0
+
+    # unregister a device of a user, return False if the user didn't have this device
+    def unregister(self, user_id, device_token) -> bool:
+        with self.__get_engine().begin() as connection:
+            result = connection.execute(
+                text(
+                    f"DELETE FROM {self.table_name} WHERE token = :token AND user_id = CAST(:user_id AS uuid)"
+                ),
+                {"token": device_token, "user_id": str(user_id)},
+            )
+        return result.rowcount > 0
+
+    # every device of the user, in one query
+    # a user who never registered a device in the table (older accounts) gets the message on their verification device, unless another account owns it
+    def user_tokens(self, user_id, device_token) -> list:
+        with self.__get_engine().connect() as connection:
+            rows = connection.execute(
+                text(
+                    f"""
+                    SELECT token FROM {self.table_name} WHERE user_id = CAST(:user_id AS uuid)
+                    UNION ALL
+                    SELECT CAST(:token AS varchar) WHERE NOT EXISTS (
+                        SELECT 1 FROM {self.table_name}
+                        WHERE user_id = CAST(:user_id AS uuid) OR token = :token
+                    )
+                    """
+                ),
+                {"user_id": str(user_id), "token": device_token},
+            )
+            return [row.token for row in rows]
+
+    # remove the tokens that the provider rejected as unregistered
+    def remove(self, device_tokens) -> None:
+        if not device_tokens:
+            return
+        with self.__get_engine().begin() as connection:
+            connection.execute(
+                text(
+                    f"DELETE FROM {self.table_name} WHERE token = ANY(CAST(:tokens AS varchar[]))"
+                ),
+                {"tokens": list(device_tokens)},
+            )
+
+
+################################# DISPATCHER #################################
+class PushDispatcher:
+    def __init__(
+        self,
+        provider,
+        batch_size=500,
+        max_queue=50000,
+        flush_interval=0.5,
+        max_retries=2,
+        on_invalid_tokens=None,
+    ) -> None:
+        self.provider = provider
+        self.batch_size = (
+            min(batch_size, provider.max_batch_size) if provider else batch_size
+        )
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.on_invalid_tokens = on_invalid_tokens  # a function (device tokens) -> None
+
+        self.__queue = queue.Queue(maxsize=max_queue)
+        self.__worker = None
+        self.__lock = threading.Lock()
+        self.__metrics = {
+            "queued": 0,
+            "dropped": 0,
+            "sent": 0,
+            "failed": 0,
+            "invalid_tokens": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "last_batch_latency_seconds": 0.0,
+            "batch_latency_total_seconds": 0.0,
+            "batch_latency_max_seconds": 0.0,
+        }
+
+    # a private method that starts the background thread the first time a message is queued
+    def __start_worker(self) -> None:
+        with self.__lock:
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__run, daemon=True)
+                self.__worker.start()
+
+    # a private method that waits for the first message, then collects the next ones until the batch is full or the flush interval is over
+    def __next_batch(self) -> list:
+        batch = [self.__queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.__queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    # a private method that records the size and the latency of one provider call
+    def __record_batch(self, batch_size, sent, latency) -> None:
+        with self.__lock:
+            self.__metrics["batches"] += 1
+            self.__metrics["sent"] += sent
+            self.__metrics["last_batch_size"] = batch_size
+            self.__metrics["last_batch_latency_seconds"] = latency
+            self.__metrics["batch_latency_total_seconds"] += latency
+            self.__metrics["batch_latency_max_seconds"] = max(
+                self.__metrics["batch_latency_max_seconds"], latency
+            )
+
+    # a private method that runs in the background thread and sends the batches
+    def __run(self) -> None:
+        while True:
+            batch = self.__next_batch()
+            messages = [message for message, _ in batch]
+
+            start_time = time.perf_counter()
+            try:
+                failed_messages, invalid_tokens = self.provider.send_batch(messages)
+            except Exception as error:
+                print(
+                    f"There was an error while sending a batch of push notifications: {error}"
+                )
+                failed_messages, invalid_tokens = messages, []
+            self.__record_batch(
+                len(messages),
+                len(messages) - len(failed_messages) - len(invalid_tokens),
+                time.perf_counter() - start_time,
+            )
+
+            if invalid_tokens:
+                with self.__lock:
+                    self.__metrics["invalid_tokens"] += len(invalid_tokens)
+                if self.on_invalid_tokens is not None:
+                    try:
+                        self.on_invalid_tokens(invalid_tokens)
+                    except Exception as error:
+                        print(f"Cannot remove the invalid device tokens: {error}")
+
+            # try the failed messages again in a next batch
+            failed_ids = {id(message) for message in failed_messages}
+            for message, attempt in batch:
+                if id(message) not in failed_ids:
+                    continue
+                if attempt + 1 > self.max_retries:
+                    with self.__lock:
+                        self.__metrics["failed"] += 1
+                    continue
+                try:
+                    self.__queue.put_nowait((message, attempt + 1))
+                except queue.Full:
+                    with self.__lock:
+                        self.__metrics["dropped"] += 1
+
+    # queue one message for each device token, return False if there is no provider or the queue is full (the request doesn't wait for the provider)
+    def enqueue(self, device_tokens, title, body, data=None) -> bool:
+        if self.provider is None:
+            return False
+
+        queued = 0
+        for device_token in device_tokens:
+            try:
+                self.__queue.put_nowait(((device_token, title, body, data or {}), 0))
+                queued += 1
+            except queue.Full:
+                break
+
+        with self.__lock:
+            self.__metrics["queued"] += queued
+            self.__metrics["dropped"] += len(device_tokens) - queued
+        if queued:
+            self.__start_worker()
+        return queued == len(device_tokens)
+
+    # the counters and the batch latency of the dispatcher and the number of messages waiting in the queue
+    def stats(self) -> dict:
+        with self.__lock:
+            metrics = dict(self.__metrics)
+        metrics["queue_size"] = self.__queue.qsize()
+        metrics["batch_latency_average_seconds"] = (
+            metrics["batch_latency_total_seconds"] / metrics["batches"]
+            if metrics["batches"]
+            else 0.0
+        )
+        return metrics
+
+
+# the device tokens of the users and the push dispatcher of this process
+device_tokens = DeviceTokenRegistry(db=db, DeviceToken=DeviceToken, Users=Users)
+push_dispatcher = PushDispatcher(
+    provider=create_push_provider(push_provider_name),
+    batch_size=push_batch_size,
+    max_queue=push_max_queue,
+    flush_interval=push_flush_interval,
+    on_invalid_tokens=device_tokens.remove,
+)
+
+
+# function send the OTP code of a login to every device of the user who logs in
+def send_otp_push(device_token, otp_code, user_id=None) -> bool:
+    return push_dispatcher.enqueue(
+        device_tokens.user_tokens(user_id, device_token),
+        title="StudyHub login",
+        body=f"Your StudyHub OTP code is {otp_code}. It will be valid for only 10 minutes!",
+        data={"type": "login_otp"},
+    )
+
+
+# function send the link for the user to verify their device with StudyHub (token made by create_verification_token)
+# with a session the device is registered in its transaction, the caller commits it once the notification has been queued
+def send_verification_push(
+    user_id, device_token, token, platform=None, session=None
+) -> any:
+    if not device_tokens.register(user_id, device_token, platform, session=session):
+        return (
+            HTTPStatus.CONFLICT,
+            "This device is registered to another account!",
+            token,
+        )
+
+    if push_dispatcher.enqueue(
+        [device_token],
+        title="Verify your device with StudyHub",
+        body="Tap to verify this device with your StudyHub account",
+        data={
+            "type": "verify_device",
+            "url": f"http://127.0.0.1:5000/studyhub/confirm-email?token={token}",
+        },
+    ):
+        return (
+            HTTPStatus.CREATED,
+            "The verification notification has been queued!",
+            token,
+        )
+    return (
+        HTTPStatus.SERVICE_UNAVAILABLE,
+        "The notification can't be sent right now! Please try again later!",
+        token,
+    )
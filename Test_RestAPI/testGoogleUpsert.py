@@ -0,0 +1,90 @@
+# test the number of statements that the Google sign in sends to the database (run it from the root folder: python -m Test_RestAPI.testGoogleUpsert)
+# the first sign in (new user) and the next sign ins (existing user) must both take exactly 2 statements
+# a Google user whose email verifies an account registered with a password gets a Conflict and nothing is written
+import uuid
+
+from sqlalchemy import event
+from werkzeug.exceptions import Conflict
+
+from app import app
+from database.users_models import Permission, Users, db
+from helper_functions.upsert_google_user import upsert_google_user
+
+google_user_data = {
+    "google_id": f"test-google-id-{uuid.uuid4()}",
+    "google_user_name": "Kent",
+    "google_profile_image": "https://lh3.googleusercontent.com/a/test-picture",
+    "email": f"test-google-{uuid.uuid4()}@studyhub.test",
+    "permission_names": [
+        "can_view_dashboard",
+        "can_use_geolocation_api",
+        "can_view_profile",
+        "can_change_profile",
+    ],
+}
+
+with app.app_context():
+    statements = []
+
+    # count every statement that is sent to the database
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count_statement)
+
+    print("\n\n")
+    print("-" * 10)
+    print("GOOGLE SIGN IN QUERY COUNT TEST")
+    for sign_in in ["first sign in", "second sign in"]:
+        statements.clear()
+        user_id, permissions = upsert_google_user(
+            **google_user_data, db=db, Users=Users, Permission=Permission
+        )
+        print(f"{sign_in}: {len(statements)} statements, permissions: {permissions}")
+        assert len(statements) == 2, statements
+        assert sorted(permissions) == sorted(google_user_data["permission_names"])
+
+    event.remove(db.engine, "before_cursor_execute", count_statement)
+
+    # remove the test user
+    Permission.query.filter_by(user_id=user_id).delete()
+    Users.query.filter_by(user_id=user_id).delete()
+    db.session.commit()
+
+    print("\n\n")
+    print("-" * 10)
+    print("GOOGLE SIGN IN EMAIL CONFLICT TEST")
+    # an account registered with a password and the same email as the Google user
+    registered_user = Users(
+        username=f"test-registered-{uuid.uuid4()}",
+        password="test-password",
+        verification_method="Email",
+        verification=f"test-registered-{uuid.uuid4()}@studyhub.test",
+        account_verified=True,
+        is_active=True,
+    )
+    db.session.add(registered_user)
+    db.session.commit()
+    registered_user_id = registered_user.user_id
+
+    try:
+        upsert_google_user(
+            **{
+                **google_user_data,
+                "google_id": f"test-google-id-{uuid.uuid4()}",
+                "email": registered_user.verification,
+            },
+            db=db,
+            Users=Users,
+            Permission=Permission,
+        )
+        raise AssertionError(
+            "the Google user has been linked to the registered account"
+        )
+    except Conflict as conflict_error:
+        print(f"conflict: {conflict_error}")
+    assert Users.query.filter_by(verification=registered_user.verification).count() == 1
+
+    # remove the registered test user
+    Users.query.filter_by(user_id=registered_user_id).delete()
+    db.session.commit()
@@ -21,10 +21,21 @@ uuid_str = str(new_uuid)
 
 BASE = "http://127.0.0.1:5000/"
 
+# sign in first, the server keeps the pending login in the "login_session" cookie of this session
+session = requests.Session()
+login_response = session.post(
+    BASE + "/studyhub/validateuser/",
+    data={
+        "signIn_username": "kenttran2302",
+        "signIn_password": "Duykhang230204$@",
+    },
+)
+print(login_response.json())
+
 # verifying otp and store the token into cookies
 otp_code = int(input("Please enter the OTP code: "))
 
-response = requests.get(BASE + "/studyhub/verify-otp/" + f"{otp_code}")
+response = session.get(BASE + "/studyhub/verify-otp/" + f"{otp_code}")
 print(response.json())
 
 # include cookies in the request headers
@@ -0,0 +1,110 @@
+# test that every hot query of the rest api uses an index (run it from the root folder: python -m Test_RestAPI.testQueryPlans)
+# the sequential scans are disabled for the test -> a query that still plans a "Seq Scan" on its table has no index that it can use
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app import app
+from database.users_models import (
+    EmailOutbox,
+    Permission,
+    StudyPreferences,
+    UserInformation,
+    Users,
+    db,
+)
+
+# (name of the query, SQL, parameters) -> the same filters as the queries of the routes
+hot_queries = [
+    (
+        "login and password change (username)",
+        f"SELECT * FROM {Users.__tablename__} WHERE username = :username",
+        {"username": "kenttran2302"},
+    ),
+    (
+        "login OTP and confirm routes (verification)",
+        f"SELECT * FROM {Users.__tablename__} WHERE verification = :verification",
+        {"verification": "duykhang2302@gmail.com"},
+    ),
+    (
+        "registration (verification method and verification)",
+        f"SELECT * FROM {Users.__tablename__} WHERE verification_method = :verification_method AND verification = :verification",
+        {"verification_method": "Email", "verification": "duykhang2302@gmail.com"},
+    ),
+    (
+        "users list (keyset pagination)",
+        f"SELECT * FROM {Users.__tablename__} WHERE (created_at, user_id) > (:created_at, :user_id) ORDER BY created_at, user_id LIMIT 50",
+        {"created_at": datetime(2026, 1, 1), "user_id": uuid.uuid4()},
+    ),
+    (
+        "account purge (deleted accounts)",
+        f"SELECT user_id FROM {Users.__tablename__} WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT 100",
+        {},
+    ),
+    (
+        "account purge (never verified accounts)",
+        f"SELECT user_id FROM {Users.__tablename__} WHERE account_verified = false AND imported = false AND deleted_at IS NULL AND created_at < :cutoff LIMIT 100",
+        {"cutoff": datetime(2026, 1, 1)},
+    ),
+    (
+        "user's profile (user_id)",
+        f"SELECT * FROM {UserInformation.__tablename__} WHERE user_id = :user_id",
+        {"user_id": uuid.uuid4()},
+    ),
+    (
+        "study preferences (user_id)",
+        f"SELECT * FROM {StudyPreferences.__tablename__} WHERE user_id = :user_id",
+        {"user_id": uuid.uuid4()},
+    ),
+    (
+        "user's permissions (user_id)",
+        f"SELECT * FROM {Permission.__tablename__} WHERE user_id = :user_id",
+        {"user_id": uuid.uuid4()},
+    ),
+    (
+        "grant a permission (user_id and name)",
+        f"SELECT 1 FROM {Permission.__tablename__} WHERE user_id = :user_id AND name = :name",
+        {"user_id": uuid.uuid4(), "name": "can_view_profile"},
+    ),
+    (
+        "email outbox claim (due emails)",
+        f"SELECT id FROM {EmailOutbox.__tablename__} WHERE status IN ('pending', 'sending') AND next_attempt_at <= :now ORDER BY next_attempt_at LIMIT 100",
+        {"now": datetime.utcnow()},
+    ),
+    (
+        "email outbox prune (sent emails)",
+        f"SELECT id FROM {EmailOutbox.__tablename__} WHERE status = 'sent' AND sent_at < :cutoff",
+        {"cutoff": datetime.utcnow()},
+    ),
+]
+
+
+# the node types of a plan (EXPLAIN FORMAT JSON) and of all its sub plans
+def plan_node_types(plan) -> list:
+    node_types = [plan["Node Type"]]
+    for sub_plan in plan.get("Plans", []):
+        node_types += plan_node_types(sub_plan)
+    return node_types
+
+
+with app.app_context():
+    print("\n\n")
+    print("-" * 10)
+    print("HOT QUERIES PLAN TEST")
+    failures = []
+    with db.engine.connect() as connection:
+        transaction = connection.begin()
+        # only for this transaction: a sequential scan is the last resort of the planner
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, query, parameters in hot_queries:
+            plan = connection.execute(
+                text(f"EXPLAIN (FORMAT JSON) {query}"), parameters
+            ).scalar()[0]["Plan"]
+            node_types = plan_node_types(plan)
+            print(f"{name}: {' -> '.join(node_types)}")
+            if "Seq Scan" in node_types:
+                failures.append(name)
+        transaction.rollback()
+
+    assert not failures, f"sequential scans: {failures}"
@@ -0,0 +1,55 @@
+# this is the registry of the HTML templates of the emails in Twilio/templates
+# every template is loaded and compiled by Jinja once when the registry is created, a send only renders the compiled template (no file I/O)
+# in development the templates can be reloaded when their file changes (auto_reload compares the modification time of the file on each render)
+import os
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+from get_env import email_templates_auto_reload
+
+# the folder of the templates, next to this file so it doesn't depend on the working directory
+template_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+# the template of each type of email (the request type of the account API)
+email_template_files = {
+    "post": "twilio_post_template.html",  # register new user
+    "patch": "twilio_update_template.html",  # update the password
+    "delete": "twilio_delete_template.html",  # confirm the account deletion
+}
+
+
+class EmailTemplateRegistry:
+    def __init__(self, template_folder, template_files, auto_reload=False) -> None:
+        self.template_files = template_files
+        self.environment = Environment(
+            loader=FileSystemLoader(template_folder),
+            autoescape=select_autoescape(["html"]),
+            # a variable that is missing from render() is an error instead of an empty string in the email
+            undefined=StrictUndefined,
+            auto_reload=auto_reload,
+        )
+        # compile every template now, a template with a syntax error fails at startup instead of at the first send
+        self.__templates = {
+            name: self.environment.get_template(file_name)
+            for name, file_name in template_files.items()
+        }
+        self.auto_reload = auto_reload
+
+    # render a template with its variables, e.g. render("post", token=token)
+    def render(self, name, **variables) -> str:
+        if name not in self.template_files:
+            raise KeyError(f"Unknown email template: {name}")
+        if self.auto_reload:
+            # get_template returns the cached template unless its file has changed
+            template = self.environment.get_template(self.template_files[name])
+        else:
+            template = self.__templates[name]
+        return template.render(**variables)
+
+
+# the email templates of this process
+email_templates = EmailTemplateRegistry(
+    template_folder=template_folder,
+    template_files=email_template_files,
+    auto_reload=email_templates_auto_reload,
+)
@@ -1,34 +1,115 @@
 # this is a function using Twilio SendGrid Web API in order to send the email verification towards user's email address for verification method
+# every email goes through one SendGrid email service that reuses the shared keep-alive connections of the outbound HTTP client
+# the emails that share a template are sent together: one API call carries up to 1000 recipients (personalizations)
+import html
 from datetime import datetime, timedelta
 
 import jwt
 import pytz
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-from http import HTTPStatus
 
+from API.http_client import outbound_http
+from Twilio.email_templates import email_templates
 from get_env import secret_key, twilio_api_key
 
+# SendGrid Web API v3 endpoint, the request goes through the shared keep-alive connection pool
+sendgrid_mail_send_url = "https://api.sendgrid.com/v3/mail/send"
+studyhub_from_email = "studyhub2302@gmail.com"
+verification_email_subject = "Verify your email address with StudyHub"
 
-# function send the verification email along with the link for the user to verify their email address with StudyHub resource
-def sendgrid_verification_email(
-    user_email, studyhub_code, request_type, new_password=None, user_id=None
-) -> any:
-    # read the HTML template file
-    if request_type == "post":  # template for register new user
-        with open("Twilio/templates/twilio_post_template.html", "r") as f:
-            template = f.read()
 
-    elif request_type == "patch":  # template for user to update their password
-        with open("Twilio/templates/twilio_update_template.html", "r") as f:
-            template = f.read()
+class SendGridEmailService:
+    # the largest number of personalizations that SendGrid accepts in one mail send request
+    max_personalizations = 1000
 
-    else:  # template to user to confirm if they want to delete their account
-        with open("Twilio/templates/twilio_delete_template.html", "r") as f:
-            template = f.read()
+    def __init__(self, http_client, api_key, from_email, mail_send_url) -> None:
+        self.http_client = http_client
+        self.from_email = from_email
+        self.mail_send_url = mail_send_url
+        self.headers = {"Authorization": f"Bearer {api_key}"}
 
-    # generate a JWT token that stores the user email address and the random otp string and valid for 10 minutes
-    token = jwt.encode(
+    # a private method that sends one mail send request, raise an error if SendGrid didn't accept it
+    def __post(self, personalizations, subject, html_content):
+        response = self.http_client.post(
+            self.mail_send_url,
+            json={
+                "personalizations": personalizations,
+                "from": {"email": self.from_email},
+                "subject": subject,
+                "content": [{"type": "text/html", "value": html_content}],
+            },
+            headers=self.headers,
+        )
+        response.raise_for_status()
+        return response
+
+    # send one email to one recipient
+    def send(self, recipient, subject, html_content):
+        return self.__post([{"to": [{"email": recipient}]}], subject, html_content)
+
+    # a private method that sends one template to up to 1000 recipients in one request
+    # the template is rendered once with a substitution tag (-name-) in place of each variable, SendGrid puts the values of each recipient in
+    def __send_personalized(self, template_name, subject, recipients):
+        variable_names = {name for _, _, variables in recipients for name in variables}
+        html_content = email_templates.render(
+            template_name, **{name: f"-{name}-" for name in variable_names}
+        )
+        personalizations = [
+            {
+                "to": [{"email": recipient}],
+                # the values are escaped like the template engine would have done
+                "substitutions": {
+                    f"-{name}-": html.escape(str(value))
+                    for name, value in variables.items()
+                },
+            }
+            for _, recipient, variables in recipients
+        ]
+        return self.__post(personalizations, subject, html_content)
+
+    # send a template to many recipients, the recipients are (key, email address, template variables)
+    # return the errors of the recipients that could not be sent by key
+    def send_template_batch(self, template_name, subject, recipients) -> dict:
+        errors = {}
+        for start in range(0, len(recipients), self.max_personalizations):
+            chunk = recipients[start : start + self.max_personalizations]
+            try:
+                self.__send_personalized(template_name, subject, chunk)
+                continue
+            except Exception as error:
+                if len(chunk) == 1:
+                    errors[chunk[0][0]] = f"{error}"
+                    continue
+                print(
+                    f"There was an error while sending {len(chunk)} {template_name} emails together, sending them one by one: {error}"
+                )
+
+            # one bad address fails the whole request -> send every recipient of the failed request on its own
+            for key, recipient, variables in chunk:
+                try:
+                    self.send(
+                        recipient,
+                        subject,
+                        email_templates.render(template_name, **variables),
+                    )
+                except Exception as error:
+                    errors[key] = f"{error}"
+        return errors
+
+
+# the SendGrid email service of this process
+sendgrid_email_service = SendGridEmailService(
+    http_client=outbound_http,
+    api_key=twilio_api_key,
+    from_email=studyhub_from_email,
+    mail_send_url=sendgrid_mail_send_url,
+)
+
+
+# generate a JWT token that stores the user email address (or phone number, device) and the random otp string and valid for 10 minutes
+def create_verification_token(
+    user_email, studyhub_code, new_password=None, user_id=None
+) -> str:
+    return jwt.encode(
         {
             "email": user_email,
             "studyhub_code": studyhub_code,
@@ -40,25 +121,39 @@ def sendgrid_verification_email(
         algorithm="HS256",
     )
 
-    # replace the placeholders with the actual email and the studyhub_code value
-    template = template.replace("{{token}}", token)
 
-    # send the email using Twilio SendGrid
-    message = Mail(
-        from_email="studyhub2302@gmail.com",
-        to_emails=user_email,
-        subject="Verify your email address with StudyHub",
-        html_content=template,
-    )
+# function send a batch of emails of the email outbox, the messages are (outbox id, recipient, template, token)
+# the messages of the same template go out together, return the errors of the messages that could not be sent by outbox id
+def sendgrid_send_outbox_batch(messages) -> dict:
+    recipients_by_template = {}
+    for outbox_id, recipient, template, token in messages:
+        recipients_by_template.setdefault(template, []).append(
+            (outbox_id, recipient, {"token": token})
+        )
+
+    errors = {}
+    for template, recipients in recipients_by_template.items():
+        errors.update(
+            sendgrid_email_service.send_template_batch(
+                template, verification_email_subject, recipients
+            )
+        )
+    return errors
+
+
+# function send the OTP code of a login to the user's email address (same email as the one that AWS SES used to send)
+def sendgrid_otp_email(user_email, otp_code, user_id=None) -> bool:
+    body = f"""Please use this 6 digits OTP code to verify your login at StudyHub<br>
+            {otp_code}
+        """
 
     try:
-        sg = SendGridAPIClient(twilio_api_key)
-        response = sg.send(message)
-        return (
-            HTTPStatus.CREATED,
-            response,
-            token,
-        )  # return True indicated that the message has been sent successfully!
+        sendgrid_email_service.send(
+            user_email,
+            "Your OTP verification code will be valid for only 10 minutes!",
+            body,
+        )
+        return True
     except Exception as e:
-        # return false indicates there was an error when send a verification email along with the error message and the status code
-        return 500, f"{e}", token
+        print(f"There was an error while sending the OTP code to {user_email}: {e}")
+        return False
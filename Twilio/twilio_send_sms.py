@@ -0,0 +1,251 @@
+# this is the SMS delivery of the "Phone number" verification method: the requests put the messages in a queue and return right away
+# a background thread takes the messages from the queue in batches and sends them to the SMS provider (Twilio, or a fake provider for local tests)
+# every phone number is throttled so a user (or an attacker) can't make the server send an SMS again and again to the same number
+# without a configured provider no SMS is accepted at all (the requests get a 503 instead of a code that is never delivered)
+import queue
+import threading
+import time
+from collections import deque
+from http import HTTPStatus
+
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from API.http_client import outbound_http
+from get_env import (
+    sms_batch_size,
+    sms_max_queue,
+    sms_provider_name,
+    sms_throttle_limit,
+    sms_throttle_window,
+    twilio_account_sid,
+    twilio_auth_token,
+    twilio_sms_from,
+)
+from helper_functions.rate_limiting import (
+    ShardedMemoryRateLimitStore,
+    SlidingWindowPolicy,
+)
+
+
+# raised when the phone number received too many SMS in the throttle window
+class SMSThrottled(TooManyRequests):
+    description = (
+        "Too many SMS have been sent to this phone number! Please try again later!"
+    )
+
+
+# raised when no SMS provider is configured or the queue is full
+class SMSUnavailable(ServiceUnavailable):
+    description = "The SMS can't be sent right now! Please try again later!"
+
+
+################################# PROVIDERS #################################
+# every provider sends a batch of (phone number, body) messages and returns the messages that could not be sent
+
+
+# Twilio Programmable Messaging -> one request per message (the API has no batch endpoint) over the shared keep-alive connections
+class TwilioSMSProvider:
+    def __init__(self, http_client, account_sid, auth_token, from_number) -> None:
+        self.http_client = http_client
+        self.auth = (account_sid, auth_token)
+        self.from_number = from_number
+        self.messages_url = (
+            f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
+        )
+
+    def send_batch(self, messages) -> list:
+        failed_messages = []
+        for phone_number, body in messages:
+            try:
+                response = self.http_client.post(
+                    self.messages_url,
+                    data={"To": phone_number, "From": self.from_number, "Body": body},
+                    auth=self.auth,
+                )
+                response.raise_for_status()
+            except Exception as error:
+                print(
+                    f"There was an error while sending an SMS to {phone_number}: {error}"
+                )
+                failed_messages.append((phone_number, body))
+        return failed_messages
+
+
+# a provider that keeps the last messages in memory instead of sending them, only for local development and tests (SMS_PROVIDER=fake)
+# the bodies hold the OTP codes and the verification links -> they are never printed, and only the last max_messages are kept
+class FakeSMSProvider:
+    def __init__(self, max_messages=100) -> None:
+        self.sent_messages = deque(maxlen=max_messages)  # (phone number, body)
+        self.batches = 0
+        self.__lock = threading.Lock()
+
+    def send_batch(self, messages) -> list:
+        with self.__lock:
+            self.sent_messages.extend(messages)
+            self.batches += 1
+        return []
+
+
+# a function that creates the provider that is chosen in the environment variables, None if Twilio is chosen but not configured
+def create_sms_provider(provider_name):
+    if provider_name == "fake":
+        return FakeSMSProvider()
+    elif provider_name == "twilio":
+        if not (twilio_account_sid and twilio_auth_token and twilio_sms_from):
+            print("Twilio is not configured, the SMS are disabled!")
+            return None
+        return TwilioSMSProvider(
+            http_client=outbound_http,
+            account_sid=twilio_account_sid,
+            auth_token=twilio_auth_token,
+            from_number=twilio_sms_from,
+        )
+    else:
+        raise ValueError(f"Unknown SMS provider: {provider_name}")
+
+
+################################# DISPATCHER #################################
+class SMSDispatcher:
+    def __init__(
+        self,
+        provider,
+        batch_size=50,
+        max_queue=10000,
+        flush_interval=0.2,
+        max_retries=2,
+        throttle_policy=None,
+    ) -> None:
+        self.provider = provider
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        # 3 messages per phone number in any 10 minutes by default
+        self.throttle_policy = throttle_policy or SlidingWindowPolicy(
+            limit=3, window_seconds=600
+        )
+
+        self.__queue = queue.Queue(maxsize=max_queue)
+        self.__throttles = ShardedMemoryRateLimitStore()
+        self.__worker = None
+        self.__lock = threading.Lock()
+        self.__metrics = {
+            "queued": 0,
+            "throttled": 0,
+            "dropped": 0,
+            "sent": 0,
+            "failed": 0,
+            "batches": 0,
+        }
+
+    # a private method that increases a counter of the metrics
+    def __count(self, name, value=1) -> None:
+        with self.__lock:
+            self.__metrics[name] += value
+
+    # a private method that starts the background thread the first time a message is queued
+    def __start_worker(self) -> None:
+        with self.__lock:
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__run, daemon=True)
+                self.__worker.start()
+
+    # a private method that waits for the first message, then collects the next ones until the batch is full or the flush interval is over
+    def __next_batch(self) -> list:
+        batch = [self.__queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.__queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    # a private method that runs in the background thread and sends the batches
+    def __run(self) -> None:
+        while True:
+            batch = self.__next_batch()
+            messages = [(phone_number, body) for phone_number, body, _ in batch]
+            attempts = {
+                (phone_number, body): attempt for phone_number, body, attempt in batch
+            }
+            try:
+                failed_messages = self.provider.send_batch(messages)
+            except Exception as error:
+                print(f"There was an error while sending a batch of SMS: {error}")
+                failed_messages = messages
+
+            self.__count("batches")
+            self.__count("sent", len(messages) - len(failed_messages))
+            # try the failed messages again in a next batch
+            for phone_number, body in failed_messages:
+                attempt = attempts.get((phone_number, body), 0) + 1
+                if attempt > self.max_retries:
+                    self.__count("failed")
+                    continue
+                try:
+                    self.__queue.put_nowait((phone_number, body, attempt))
+                except queue.Full:
+                    self.__count("dropped")
+
+    # queue a message (the request doesn't wait for the provider)
+    # raise SMSUnavailable if there is no provider or the queue is full, SMSThrottled if the phone number is throttled
+    def enqueue(self, phone_number, body) -> None:
+        if self.provider is None:
+            raise SMSUnavailable()
+
+        allowed, _ = self.__throttles.hit(
+            phone_number, self.throttle_policy, time.time()
+        )
+        if not allowed:
+            self.__count("throttled")
+            raise SMSThrottled()
+
+        try:
+            self.__queue.put_nowait((phone_number, body, 0))
+        except queue.Full:
+            self.__count("dropped")
+            raise SMSUnavailable()
+
+        self.__count("queued")
+        self.__start_worker()
+
+    # the counters of the dispatcher and the number of messages waiting in the queue
+    def stats(self) -> dict:
+        with self.__lock:
+            metrics = dict(self.__metrics)
+        metrics["queue_size"] = self.__queue.qsize()
+        return metrics
+
+
+# the SMS dispatcher of this process
+sms_dispatcher = SMSDispatcher(
+    provider=create_sms_provider(sms_provider_name),
+    batch_size=sms_batch_size,
+    max_queue=sms_max_queue,
+    throttle_policy=SlidingWindowPolicy(
+        limit=sms_throttle_limit, window_seconds=sms_throttle_window
+    ),
+)
+
+
+# function send the OTP code of a login to the user's phone number (SMSThrottled and SMSUnavailable go up to the route)
+def send_otp_sms(phone_number, otp_code, user_id=None) -> bool:
+    body = (
+        f"Your StudyHub OTP code is {otp_code}. It will be valid for only 10 minutes!"
+    )
+    sms_dispatcher.enqueue(phone_number, body)
+    return True
+
+
+# function send the link for the user to verify their phone number with StudyHub (token made by create_verification_token)
+def send_verification_sms(phone_number, token) -> any:
+    body = f"Verify your phone number with StudyHub: http://127.0.0.1:5000/studyhub/confirm-email?token={token}"
+
+    try:
+        sms_dispatcher.enqueue(phone_number, body)
+    except (SMSThrottled, SMSUnavailable) as sms_error:
+        return HTTPStatus(sms_error.code), sms_error.description, token
+    return HTTPStatus.CREATED, "The verification SMS has been queued!", token
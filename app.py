@@ -12,12 +12,16 @@ from get_env import (
     database_port,
     database_type,
     database_username,
+    scheduled_prune_interval,
 )
 from login import (
+    RefreshTokenResource,
     SignInResource,
     login_routes,
+    otp_store,
+    pending_logins,
     verifyOTP,
-)  # REST API for login and verifying OTP code
+)  # REST API for login, verifying OTP code and refreshing the access token
 
 # import the REST APIs
 from register import (  # -> REST API for registration
@@ -31,6 +35,32 @@ from user_profile import (
 from study_preferences import (
     StudyPreferencesResource,  # -> REST API for user to post their study preferences
 )
+from devices import (
+    DeviceTokenResource,  # -> REST API for user to register the devices that receive their push notifications
+)
+from bulk_import import (
+    BulkImportResource,  # -> REST API and command line to import the students of a partner university
+    grant_import_permission_command,
+    import_users_command,
+)
+from helper_functions.email_outbox import (
+    email_outbox,  # -> sends the emails written in the outbox by the REST APIs
+)
+from helper_functions.account_purge import (
+    account_purger,  # -> deletes the deleted and never verified accounts in the background
+)
+from helper_functions.password_hashing import (
+    start_password_hashing_services,  # -> forks the bcrypt worker processes
+)
+from helper_functions.refresh_tokens import (
+    refresh_tokens,  # -> keeps the refresh tokens of the logins
+)
+from helper_functions.rate_limiting import (
+    rate_limiter,  # -> keeps the state of the rate limits of the REST APIs
+)
+from helper_functions.scheduled_jobs import (
+    scheduled_jobs,  # -> removes the expired rows in the background
+)
 
 app = Flask(__name__)
 app.config["SERVER_NAME"] = "127.0.0.1:5000"
@@ -49,9 +79,23 @@ app.config[
 ] = f"{database_type}://{database_username}:{database_password}@{database_host}:{database_port}/{database_name}"
 db.init_app(app)
 
+# fork the password hashing workers before any background thread of this process is started
+start_password_hashing_services()
+
 # create all the tables inside the database
+# and start the email outbox dispatcher so the emails left by a previous run are sent
+# and the account purger so the accounts marked for deletion by a previous run are deleted
 with app.app_context():
     db.create_all()
+    email_outbox.start(db.engine)
+    account_purger.start(db.engine)
+
+# the prune jobs of the stores that keep expiring rows
+scheduled_jobs.add("pending logins", pending_logins.prune, scheduled_prune_interval)
+scheduled_jobs.add("OTP codes", otp_store.prune, scheduled_prune_interval)
+scheduled_jobs.add("refresh tokens", refresh_tokens.prune, scheduled_prune_interval)
+scheduled_jobs.add("rate limit buckets", rate_limiter.prune, scheduled_prune_interval)
+scheduled_jobs.start(app)
 
 migrate = Migrate(app, db)
 
@@ -60,8 +104,15 @@ api = Api(app)
 api.add_resource(RegistrationResource, "/studyhub/user-account/")
 api.add_resource(SignInResource, "/studyhub/validateuser/")
 api.add_resource(verifyOTP, "/studyhub/verify-otp/<int:otp_code>/")
+api.add_resource(RefreshTokenResource, "/studyhub/refresh-token/")
 api.add_resource(UserInformationResource, "/studyhub/user-profile/user-information/")
 api.add_resource(StudyPreferencesResource, "/studyhub/user-profile/study-preferences/")
+api.add_resource(DeviceTokenResource, "/studyhub/user-profile/devices/")
+api.add_resource(BulkImportResource, "/studyhub/user-account/import/")
+
+# command line commands
+app.cli.add_command(import_users_command)
+app.cli.add_command(grant_import_permission_command)
 
 # blueprint routes
 app.register_blueprint(registration_routes)
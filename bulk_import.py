@@ -0,0 +1,115 @@
+############## BULK IMPORT OF THE STUDENTS OF A PARTNER UNIVERSITY (REST API AND COMMAND LINE) ##############
+# import libraries
+import codecs
+import json
+from http import HTTPStatus
+
+import click
+from flask import Response, current_app, request
+from flask.cli import with_appcontext
+from flask_restful import Resource, abort
+from werkzeug.exceptions import BadRequest
+
+# import other files in the root directory
+from database.users_models import Permission, Users, db
+from get_env import secret_key
+from helper_functions.bulk_user_import import bulk_user_importer, read_import_rows
+from helper_functions.grant_permission import grant_permissions_to_user
+from helper_functions.middleware_functions import token_required
+
+# the format of the rows for each content type of the request body
+import_content_types = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+# REST API for the StudyHub staff to import the students of a partner university from a CSV or NDJSON file
+# the staff accounts get can_import_users with the command line: flask grant-import-permission <username>
+class BulkImportResource(Resource):
+    # a POST method that streams the rows of the request body (the file is never loaded in memory at once)
+    # ?send_verification_emails=false imports the users without sending them the verification email
+    @token_required(permission_list=["can_import_users"], secret_key=secret_key)
+    def post(self):
+        with current_app.app_context():
+            try:
+                file_format = request.args.get(
+                    "format", import_content_types.get(request.mimetype)
+                )
+                if file_format is None:
+                    raise BadRequest(
+                        "The body must be a CSV (text/csv) or NDJSON (application/x-ndjson) file!"
+                    )
+
+                # the lines of the body are decoded as they are read from the stream
+                lines = codecs.iterdecode(request.stream, "utf-8")
+                report = bulk_user_importer.run(
+                    read_import_rows(lines, file_format),
+                    send_verification_emails=request.args.get(
+                        "send_verification_emails", "true"
+                    ).lower()
+                    != "false",
+                )
+
+                response_json = json.dumps(report)
+                response = Response(
+                    response=response_json,
+                    status=HTTPStatus.OK,
+                    mimetype="application/json",
+                )
+                return response
+
+            # catch the 400 bad request error (unknown format or a body that is not UTF-8)
+            except (BadRequest, ValueError) as bad_request_error:
+                abort(HTTPStatus.BAD_REQUEST, message=f"{bad_request_error}")
+
+            except Exception as server_error:
+                abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{server_error}")
+
+
+# command line: flask import-users students.csv (the format is given by the extension of the file unless --format is used)
+@click.command("import-users")
+@click.argument("file_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "file_format", type=click.Choice(["csv", "ndjson"]))
+@click.option(
+    "--send-verification-emails/--no-verification-emails",
+    default=True,
+    help="Send the verification email to the users whose verification method is Email",
+)
+@with_appcontext
+def import_users_command(file_path, file_format, send_verification_emails):
+    if file_format is None:
+        file_format = "csv" if file_path.lower().endswith(".csv") else "ndjson"
+
+    with open(file_path, "r", encoding="utf-8", newline="") as import_file:
+        report = bulk_user_importer.run(
+            read_import_rows(import_file, file_format),
+            send_verification_emails=send_verification_emails,
+        )
+
+    for error in report["errors"]:
+        click.echo(f"row {error['row']}: {json.dumps(error['errors'])}")
+    click.echo(f"{report['imported']} users imported, {report['failed']} rows failed")
+
+
+# command line: flask grant-import-permission <username> gives a StudyHub staff account the permission to use the import endpoint
+# the permission is in the token of the user's next login
+@click.command("grant-import-permission")
+@click.argument("username")
+@with_appcontext
+def grant_import_permission_command(username):
+    user = Users.query.filter(
+        Users.username == username, Users.deleted_at.is_(None)
+    ).first()
+    if user is None:
+        raise click.ClickException(f"No user found with the username {username}!")
+
+    if not grant_permissions_to_user(
+        user_id=user.user_id,
+        permission_names=["can_import_users"],
+        db=db,
+        Permission=Permission,
+    ):
+        raise click.ClickException("Cannot grant the permission!")
+    click.echo(f"{username} can import users after their next login (can_import_users)")
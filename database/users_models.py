@@ -17,12 +17,31 @@ db = SQLAlchemy()
 # Define a registration table to store the user's id, username (email), password, phone_number (for more authentication)
 class Users(db.Model):
     __tablename__ = "users"
+    __table_args__ = (
+        # an email, phone number or device can only verify one account
+        # the verification comes first -> the confirm routes and the login OTP look up the verification alone with the same index
+        db.UniqueConstraint(
+            "verification", "verification_method", name="uq_users_verification"
+        ),
+        # the order of the keyset pagination of the users list
+        db.Index("ix_users_created_at_user_id", "created_at", "user_id"),
+        # the accounts that the purge deletes: the deleted ones and the ones that were never verified
+        db.Index(
+            "ix_users_deleted_at",
+            "deleted_at",
+            postgresql_where=db.text("deleted_at IS NOT NULL"),
+        ),
+        db.Index(
+            "ix_users_unverified_created_at",
+            "created_at",
+            postgresql_where=db.text("account_verified = false AND imported = false"),
+        ),
+    )
 
     user_id = db.Column(
         UUID(as_uuid=True),
         primary_key=True,
         default=uuid.uuid4,
-        unique=True,
         nullable=False,
     )  # using universal unique identifier for best security practice
     google_id = db.Column(
@@ -35,7 +54,7 @@ class Users(db.Model):
         db.String(10000), nullable=True
     )  # if the user chooses to login with their Google account
     username = db.Column(db.String(500), nullable=True, unique=True)
-    password = db.Column(db.String(500), nullable=True, unique=True)
+    password = db.Column(db.String(500), nullable=True)
     verification_method = db.Column(
         db.Enum(
             "--select--",
@@ -62,8 +81,15 @@ class Users(db.Model):
     permissions = db.relationship(
         "Permission", backref="users", lazy=True
     )  # perform a 1 to many relationship with the user's permission model
+    deleted_at = db.Column(
+        db.DateTime, nullable=True
+    )  # in UTC, when the user confirmed the deletion of the account (the account purge deletes it)
+    imported = db.Column(
+        db.Boolean, nullable=False, default=False, server_default="false"
+    )  # created by the bulk import of a partner university -> never deleted by the purge of the unverified accounts
+    # the time of the registration (not of the start of the server) -> the purge of the unverified accounts relies on it
     created_at = db.Column(
-        db.DateTime, default=datetime.now(pytz.timezone("EST")), nullable=False
+        db.DateTime, default=lambda: datetime.now(pytz.timezone("EST")), nullable=False
     )
     updated_at = db.Column(
         db.DateTime,
@@ -79,7 +105,12 @@ class Users(db.Model):
 # Define a permission table to have one-to-many relationship to registration table
 class Permission(db.Model):
     __tablename__ = "permission"
-    id = db.Column(db.Integer, primary_key=True, autoincrement=True, unique=True)
+    __table_args__ = (
+        # a user has a permission once, the permissions of a user are loaded and granted by (user_id, name)
+        db.UniqueConstraint("user_id", "name", name="uq_permission_user_id_name"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(1000), nullable=False)
     user_id = db.Column(
         UUID(as_uuid=True), db.ForeignKey("users.user_id"), nullable=False
@@ -89,6 +120,141 @@ class Permission(db.Model):
         return "<Permission %r>" % self.name
 
 
+################################## DEVICE TOKENS ##################################
+# Define a table that stores the push notification tokens of the devices of each user
+class DeviceToken(db.Model):
+    __tablename__ = "device_token"
+    token = db.Column(db.String(500), primary_key=True)  # given by the push provider
+    user_id = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("users.user_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    platform = db.Column(db.String(50), nullable=True)  # android, ios or web
+    created_at = db.Column(db.DateTime, nullable=False)  # in UTC
+    last_seen_at = db.Column(db.DateTime, nullable=False)  # in UTC
+
+    def __repr__(self) -> str:
+        return "<Device Token %r>" % self.user_id
+
+
+################################## PENDING LOGIN SESSIONS ##################################
+# Define a table that stores the logins that are waiting for the OTP verification so every worker process can read them
+class PendingLogin(db.Model):
+    __tablename__ = "pending_login"
+    session_id = db.Column(db.String(100), primary_key=True)
+    data = db.Column(db.JSON, nullable=False)  # the token and the user's id and email
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # in UTC
+
+    def __repr__(self) -> str:
+        return "<Pending Login %r>" % self.session_id
+
+
+################################## OTP CODES ##################################
+# Define a table that stores the login OTP codes when the OTP engine uses the database store (one active code per destination)
+class OTPCode(db.Model):
+    __tablename__ = "otp_code"
+    destination = db.Column(db.String(500), primary_key=True)  # email or phone number
+    code_hash = db.Column(db.String(128), nullable=False)  # HMAC of the code
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # in UTC
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return "<OTP Code %r>" % self.destination
+
+
+################################## REFRESH TOKENS ##################################
+# Define a table that stores the hashes of the refresh tokens, every token that is rotated from the same login belongs to the same family
+class RefreshToken(db.Model):
+    __tablename__ = "refresh_token"
+    token_hash = db.Column(db.String(64), primary_key=True)  # sha256 of the token
+    family_id = db.Column(UUID(as_uuid=True), nullable=False, index=True)
+    user_id = db.Column(
+        UUID(as_uuid=True),
+        db.ForeignKey("users.user_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    claims = db.Column(db.Text, nullable=False)  # json claims of the access tokens
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # in UTC
+    # in UTC, the end of the family (the login), a rotation never goes past it
+    family_expires_at = db.Column(db.DateTime, nullable=False)
+    used = db.Column(db.Boolean, nullable=False, default=False)
+
+    def __repr__(self) -> str:
+        return "<Refresh Token %r>" % self.family_id
+
+
+################################## REVOKED TOKENS ##################################
+# Define a table that stores the ids (jti claim) of the access tokens that have been revoked before they expire
+class RevokedToken(db.Model):
+    __tablename__ = "revoked_token"
+    jti = db.Column(db.String(64), primary_key=True)
+    expires_at = db.Column(
+        db.DateTime, nullable=False, index=True
+    )  # in UTC, the expiration time of the token -> the row can be pruned after it
+
+    def __repr__(self) -> str:
+        return "<Revoked Token %r>" % self.jti
+
+
+################################## EMAIL OUTBOX ##################################
+# Define a table that stores the emails to send, the rows are written in the same transaction as the change they announce
+# the email outbox dispatcher sends them in the background and records the delivery status
+class EmailOutbox(db.Model):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # the dispatcher claims the due rows in this order, the sent emails (most of the table) are not in the index
+        db.Index(
+            "ix_email_outbox_due_next_attempt_at",
+            "next_attempt_at",
+            postgresql_where=db.text("status IN ('pending', 'sending')"),
+        ),
+        # the sent emails that are pruned
+        db.Index(
+            "ix_email_outbox_sent_at",
+            "sent_at",
+            postgresql_where=db.text("status = 'sent'"),
+        ),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    recipient = db.Column(db.String(500), nullable=False)
+    template = db.Column(db.String(20), nullable=False)  # post, patch or delete
+    token = db.Column(
+        db.Text, nullable=False
+    )  # the verification token of the link, emptied once the email is sent or has failed
+    expires_at = db.Column(
+        db.DateTime, nullable=True
+    )  # in UTC, when the token expires -> the email is not sent (or retried) after that
+    status = db.Column(
+        db.String(20), nullable=False, default="pending"
+    )  # pending, sending, sent or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False)  # in UTC
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)  # in UTC
+    sent_at = db.Column(db.DateTime, nullable=True)  # in UTC
+
+    def __repr__(self) -> str:
+        return "<Email Outbox %r>" % self.id
+
+
+################################## RATE LIMITING ##################################
+# Define a table that stores the state of the rate limits when they are shared by every worker process
+class RateLimitBucket(db.Model):
+    __tablename__ = "rate_limit_bucket"
+    key = db.Column(db.String(500), primary_key=True)  # rule name + client key
+    state = db.Column(db.Text, nullable=False)  # json state of the rate limit policy
+    expires_at = db.Column(
+        db.Float, nullable=False, index=True
+    )  # unix time when the state can be forgotten
+
+    def __repr__(self) -> str:
+        return "<Rate Limit Bucket %r>" % self.key
+
+
 ################################### USER'S PROFILE MODEL ###################################
 # a list of majors in university
 with open("database/json/majors.json", "r") as f:
@@ -108,7 +274,6 @@ class UserInformation(db.Model):
         UUID(as_uuid=True),
         primary_key=True,
         default=uuid.uuid4,
-        unique=True,
         nullable=False,
     )
     profile_image = db.Column(
@@ -203,7 +368,7 @@ class UserInformation(db.Model):
 
     # relationship
     user_id = db.Column(
-        UUID(as_uuid=True), db.ForeignKey("users.user_id"), nullable=False
+        UUID(as_uuid=True), db.ForeignKey("users.user_id"), nullable=False, index=True
     )  # form a one-to-one relationship with the user's id in the users table (using foreign key contraint)
 
     study_preferences = db.relationship(
@@ -273,12 +438,14 @@ class StudyPreferences(db.Model):
         UUID(as_uuid=True),
         primary_key=True,
         default=uuid.uuid4,
-        unique=True,
         nullable=False,
     )
 
     user_id = db.Column(
-        UUID(as_uuid=True), db.ForeignKey("user_information.id"), nullable=False
+        UUID(as_uuid=True),
+        db.ForeignKey("user_information.id"),
+        nullable=False,
+        index=True,
     )  # form a one to one relationship with the user's profile
 
     # study environment preferences
@@ -335,7 +502,6 @@ class AvailabilitySchedule(db.Model):
         UUID(as_uuid=True),
         primary_key=True,
         default=uuid.uuid4,
-        unique=True,
         nullable=False,
     )
     user_id = db.Column(
@@ -0,0 +1,110 @@
+############## REST API FOR USERS TO REGISTER THE DEVICES THAT RECEIVE THEIR PUSH NOTIFICATIONS ##############
+# import libraries
+import json
+from http import HTTPStatus
+
+from flask import Response, current_app, g
+from flask_restful import Resource, abort, reqparse
+from werkzeug.exceptions import BadRequest, Conflict, NotFound
+
+# import other files in the root directory
+from API.push_notifications import device_tokens
+from get_env import secret_key
+from helper_functions.middleware_functions import token_required
+
+
+# REST API for the user to add or remove a device (push notification token) of their account
+class DeviceTokenResource(Resource):
+    # a private method to add arguments into the form data
+    def __device_form_data_add_arguments(self, device_form_data, with_platform) -> None:
+        device_form_data.add_argument(
+            "device_token",
+            type=str,
+            help="The push notification token of the device is required",
+            required=True,
+        )
+        if with_platform:
+            device_form_data.add_argument(
+                "platform", type=str, choices=("android", "ios", "web"), required=False
+            )
+
+    # a POST method to register a device of the user (registering the same device again refreshes it)
+    @token_required(
+        permission_list=["can_view_profile", "can_change_profile"],
+        secret_key=secret_key,
+    )
+    def post(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
+        with current_app.app_context():
+            try:
+                device_form_data = reqparse.RequestParser()
+                self.__device_form_data_add_arguments(
+                    device_form_data, with_platform=True
+                )
+                args = device_form_data.parse_args()
+
+                # a device of another account can't be moved to this one
+                if not device_tokens.register(
+                    decoded_token["id"], args["device_token"], args["platform"]
+                ):
+                    raise Conflict("This device is registered to another account!")
+
+                response_data = {"message": "The device has been registered!"}
+                response_json = json.dumps(response_data)
+                response = Response(
+                    response=response_json,
+                    status=HTTPStatus.CREATED,
+                    mimetype="application/json",
+                )
+                return response
+
+            # catch the 400 bad request error (missing device token or unknown platform)
+            except BadRequest as bad_request_error:
+                abort(HTTPStatus.BAD_REQUEST, message=f"{bad_request_error}")
+
+            except Conflict as conflict_error:
+                abort(HTTPStatus.CONFLICT, message=f"{conflict_error}")
+
+            except Exception as server_error:
+                abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{server_error}")
+
+    # a DELETE method to stop sending push notifications to a device of the user
+    @token_required(
+        permission_list=["can_view_profile", "can_change_profile"],
+        secret_key=secret_key,
+    )
+    def delete(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
+        with current_app.app_context():
+            try:
+                device_form_data = reqparse.RequestParser()
+                self.__device_form_data_add_arguments(
+                    device_form_data, with_platform=False
+                )
+                args = device_form_data.parse_args()
+
+                # the user can only remove their own devices
+                if not device_tokens.unregister(
+                    decoded_token["id"], args["device_token"]
+                ):
+                    raise NotFound("No such device found!")
+
+                response_data = {"message": "The device has been removed!"}
+                response_json = json.dumps(response_data)
+                response = Response(
+                    response=response_json,
+                    status=HTTPStatus.OK,
+                    mimetype="application/json",
+                )
+                return response
+
+            except BadRequest as bad_request_error:
+                abort(HTTPStatus.BAD_REQUEST, message=f"{bad_request_error}")
+
+            except NotFound as not_found_error:
+                abort(HTTPStatus.NOT_FOUND, message=f"{not_found_error}")
+
+            except Exception as server_error:
+                abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{server_error}")
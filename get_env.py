@@ -26,11 +26,125 @@ database_name = os.getenv("DB_NAME")
 aws_sending_otp = os.getenv("AWS_EMAIL_SEND_OTP")
 aws_verify_otp = os.getenv("AWS_EMAIL_VERIFY_OTP")
 
+# refresh token stuffs
+# how long a refresh token can be used to get a new access token without signing in again
+refresh_token_ttl = int(os.getenv("REFRESH_TOKEN_TTL", "1209600"))  # 14 days
+# how long the refresh tokens of one login can be rotated before the user has to sign in again
+refresh_token_family_lifetime = int(
+    os.getenv("REFRESH_TOKEN_FAMILY_LIFETIME", "2592000")
+)  # 30 days
+
+# OTP stuffs
+# "engine" generates and verifies the OTP codes in the backend, "lambda" keeps using the 2 AWS Lambda functions above
+otp_backend = os.getenv("OTP_BACKEND", "engine")
+# where the engine stores the codes: "memory" (one process) or "database" (shared by every worker)
+otp_store_backend = os.getenv("OTP_STORE", "memory")
+otp_ttl = int(os.getenv("OTP_TTL", "600"))  # 10 minutes
+otp_max_attempts = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+
 # Google Cloud stuffs
 google_api_secret_key = os.getenv("GOOGLE_GEOLOCATION_API")
 google_client_id = os.getenv("GOOGLE_CLIENT_ID")
 google_client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
 google_discovery_url = os.getenv("GOOGLE_DISCOVERY_URL")
+# how long (in seconds) Google's discovery document and signing keys are cached before they are refreshed
+google_discovery_ttl = int(os.getenv("GOOGLE_DISCOVERY_TTL", "3600"))
 
 # TWILIO stuffs
 twilio_api_key = os.getenv("TWILIO_API_KEY")
+# reload the email templates when their file changes (development only, every render checks the modification time of the file)
+email_templates_auto_reload = (
+    os.getenv("EMAIL_TEMPLATES_AUTO_RELOAD", "false").lower() == "true"
+)
+# Twilio Programmable Messaging account and the phone number the SMS are sent from
+twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+twilio_sms_from = os.getenv("TWILIO_SMS_FROM")
+
+# SMS stuffs
+# "twilio" sends the SMS (they are disabled until the Twilio account is configured), "fake" only keeps the last ones in memory (local development and tests)
+sms_provider_name = os.getenv("SMS_PROVIDER", "twilio")
+# maximum number of SMS sent to the provider in one batch and waiting in the queue
+sms_batch_size = int(os.getenv("SMS_BATCH_SIZE", "50"))
+sms_max_queue = int(os.getenv("SMS_MAX_QUEUE", "10000"))
+# maximum number of SMS sent to one phone number in any window of SMS_THROTTLE_WINDOW seconds
+sms_throttle_limit = int(os.getenv("SMS_THROTTLE_LIMIT", "3"))
+sms_throttle_window = int(os.getenv("SMS_THROTTLE_WINDOW", "600"))
+
+# Push notification stuffs
+# "fcm" sends the notifications with Firebase Cloud Messaging (they are disabled until FCM_CREDENTIALS_FILE is configured), "stub" only keeps the last ones in memory (local development and tests)
+push_provider_name = os.getenv("PUSH_PROVIDER", "fcm")
+fcm_credentials_file = os.getenv("FCM_CREDENTIALS_FILE")
+# maximum number of notifications in one provider call (FCM accepts up to 500) and waiting in the queue
+push_batch_size = int(os.getenv("PUSH_BATCH_SIZE", "500"))
+push_max_queue = int(os.getenv("PUSH_MAX_QUEUE", "50000"))
+# how long (in seconds) the dispatcher waits to fill a batch
+push_flush_interval = float(os.getenv("PUSH_FLUSH_INTERVAL", "0.5"))
+
+# Email outbox stuffs
+# maximum number of emails claimed by the dispatcher at once and how often (in seconds) it looks for due emails when it isn't woken up
+email_outbox_batch_size = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "1000"))
+email_outbox_poll_interval = float(os.getenv("EMAIL_OUTBOX_POLL_INTERVAL", "5"))
+# number of attempts before an email is marked as failed, the first retry delay (doubled after every attempt) and the longest delay
+email_outbox_max_attempts = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+email_outbox_backoff = float(os.getenv("EMAIL_OUTBOX_BACKOFF", "30"))
+email_outbox_max_backoff = float(os.getenv("EMAIL_OUTBOX_MAX_BACKOFF", "3600"))
+
+# Account purge stuffs
+# number of accounts deleted in one transaction, the time (in seconds) a purge run can spend and how often (in seconds) it runs when it isn't woken up
+account_purge_batch_size = int(os.getenv("ACCOUNT_PURGE_BATCH_SIZE", "100"))
+account_purge_time_budget = float(os.getenv("ACCOUNT_PURGE_TIME_BUDGET", "5"))
+account_purge_poll_interval = float(os.getenv("ACCOUNT_PURGE_POLL_INTERVAL", "300"))
+# number of days after which an account that was never verified is deleted (0 keeps them, the default)
+# the accounts registered before created_at was fixed hold the start time of the server -> only turn it on once they are older than the number of days
+account_purge_unverified_days = int(os.getenv("ACCOUNT_PURGE_UNVERIFIED_DAYS", "0"))
+
+# User listing stuffs
+# number of users in a page of GET /studyhub/user-account/ when the client doesn't ask for a page size, and the largest page size allowed
+user_list_page_size = int(os.getenv("USER_LIST_PAGE_SIZE", "100"))
+user_list_max_page_size = int(os.getenv("USER_LIST_MAX_PAGE_SIZE", "1000"))
+
+# Bulk import stuffs
+# number of rows that are validated, hashed and loaded together
+bulk_import_batch_size = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "1000"))
+
+# Token stuffs
+# maximum number of verified tokens whose claims are cached in memory
+token_cache_size = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# how often (in seconds) the Bloom filter of the revoked tokens is rebuilt from the database
+token_revocation_rebuild_interval = int(
+    os.getenv("TOKEN_REVOCATION_REBUILD_INTERVAL", "30")
+)
+# number of revoked tokens the Bloom filter is sized for and its false positive rate
+token_revocation_capacity = int(os.getenv("TOKEN_REVOCATION_CAPACITY", "100000"))
+token_revocation_error_rate = float(os.getenv("TOKEN_REVOCATION_ERROR_RATE", "0.001"))
+
+# Login session stuffs
+# where the logins waiting for the OTP verification are stored: "memory" (one process) or "database" (shared by every worker)
+login_session_backend = os.getenv("LOGIN_SESSION_BACKEND", "memory")
+login_session_ttl = int(os.getenv("LOGIN_SESSION_TTL", "600"))  # 10 minutes
+
+# Scheduled jobs stuffs
+# how often (in seconds) the expired rows (pending logins, OTP codes, refresh tokens, rate limit buckets) are removed
+scheduled_prune_interval = int(os.getenv("SCHEDULED_PRUNE_INTERVAL", "3600"))
+
+# Outbound HTTP stuffs
+# number of hosts that keep a pool of connections and number of keep-alive connections per host
+http_pool_connections = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+http_pool_maxsize = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+# default timeouts (in seconds) of the outbound calls
+http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+http_read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+
+# Password hashing stuffs
+# number of worker processes that run bcrypt, number of jobs that can wait for a worker and how long (in seconds) a request waits for its job
+password_hash_workers = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+password_hash_max_queue = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+password_hash_timeout = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+# the hasher of the stored passwords and its cost factor (run helper_functions/bcrypt_benchmark.py to choose it)
+password_hasher_name = os.getenv("PASSWORD_HASHER", "bcrypt")
+bcrypt_rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Rate limiting stuffs
+# where the state of the rate limits is stored: "memory" (one process) or "database" (shared by every worker)
+rate_limit_backend = os.getenv("RATE_LIMIT_BACKEND", "memory")
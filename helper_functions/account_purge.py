@@ -0,0 +1,292 @@
+# this is the purge of the deleted accounts and of the accounts that were never verified
+# confirming an account deletion only marks the user (deleted_at) and revokes their tokens, a background purger deletes the user and every row that depends on it
+# (permissions, profile, study preferences, availability schedule, devices and refresh tokens) later, then removes the uploaded files of the profile
+# the accounts are deleted in small batches (one short transaction each) until the time budget of a run is spent -> a large purge never holds long locks
+# the purger claims the users with FOR UPDATE SKIP LOCKED so every worker process can run one without deleting the same account twice
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from sqlalchemy import text
+
+from database.users_models import (
+    AvailabilitySchedule,
+    Permission,
+    RefreshToken,
+    StudyPreferences,
+    UserInformation,
+    Users,
+    db,
+)
+from get_env import (
+    account_purge_batch_size,
+    account_purge_poll_interval,
+    account_purge_time_budget,
+    account_purge_unverified_days,
+)
+from helper_functions.token_revocation import token_revocation_list, user_revocation_id
+from helper_functions.validate_users_information import UPLOAD_FOLDER
+
+
+class AccountPurger:
+    def __init__(
+        self,
+        db,
+        Users,
+        UserInformation,
+        StudyPreferences,
+        AvailabilitySchedule,
+        Permission,
+        RefreshToken,
+        token_revocation_list,
+        upload_folder,
+        batch_size=100,
+        time_budget=5.0,
+        poll_interval=300.0,
+        unverified_days=0,
+        pause=1.0,
+        lock_timeout_ms=2000,
+        access_token_lifetime=1800,
+    ) -> None:
+        self.db = db
+        self.users_table = Users.__tablename__
+        self.profiles_table = UserInformation.__tablename__
+        self.study_preferences_table = StudyPreferences.__tablename__
+        self.schedules_table = AvailabilitySchedule.__tablename__
+        self.permissions_table = Permission.__tablename__
+        self.refresh_tokens_table = RefreshToken.__tablename__
+        self.token_revocation_list = token_revocation_list
+        self.upload_folder = os.path.abspath(upload_folder)
+        self.batch_size = batch_size
+        # a run stops starting new batches after time_budget seconds
+        self.time_budget = time_budget
+        self.poll_interval = poll_interval
+        # the accounts that are still not verified unverified_days after their registration are deleted (0 -> never)
+        self.unverified_days = unverified_days
+        # the wait between two runs when accounts were left by the previous run
+        self.pause = pause
+        # a batch gives up (and is retried by the next run) instead of queueing behind the locks of a request
+        self.lock_timeout_ms = lock_timeout_ms
+        # the longest lifetime of an access token (30 minutes) -> how long the tokens of a marked user stay revoked
+        self.access_token_lifetime = access_token_lifetime
+
+        self.__engine = None
+        self.__worker = None
+        self.__wake_up = threading.Event()
+        self.__lock = threading.Lock()
+        self.__metrics = {
+            "runs": 0,
+            "batches": 0,
+            "deleted": 0,
+            "unverified": 0,
+            "files": 0,
+        }
+
+    # a private method that increases a counter of the metrics
+    def __count(self, name, value=1) -> None:
+        with self.__lock:
+            self.__metrics[name] += value
+
+    # mark the user for deletion in the transaction of the session, the user can't sign in anymore and is deleted by the next run
+    # their refresh token families are deleted and every access token they hold is revoked until it has expired
+    def mark(self, session, user_id) -> None:
+        session.execute(
+            text(
+                f"""
+                UPDATE {self.users_table}
+                SET deleted_at = :now, is_active = false, temp_token = NULL
+                WHERE user_id = CAST(:user_id AS uuid) AND deleted_at IS NULL
+                """
+            ),
+            {"now": datetime.utcnow(), "user_id": str(user_id)},
+        )
+        session.execute(
+            text(
+                f"DELETE FROM {self.refresh_tokens_table} WHERE user_id = CAST(:user_id AS uuid)"
+            ),
+            {"user_id": str(user_id)},
+        )
+        self.token_revocation_list.revoke(
+            user_revocation_id(user_id),
+            time.time() + self.access_token_lifetime,
+            session=session,
+        )
+
+    # start the background purger, the engine has to come from a thread with an app context
+    def start(self, engine) -> None:
+        with self.__lock:
+            if self.__engine is None:
+                self.__engine = engine
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__run, daemon=True)
+                self.__worker.start()
+
+    # wake the purger up after the transaction that marked users has committed
+    def notify(self) -> None:
+        self.start(self.db.engine)
+        self.__wake_up.set()
+
+    # a private method that claims and deletes one batch of users in one transaction, return the paths of their uploaded files
+    def __purge_batch(self, claim_query, parameters) -> tuple:
+        with self.__engine.begin() as connection:
+            connection.execute(text(f"SET LOCAL lock_timeout = {self.lock_timeout_ms}"))
+            user_ids = [
+                str(row.user_id)
+                for row in connection.execute(
+                    text(claim_query), {**parameters, "batch_size": self.batch_size}
+                )
+            ]
+            if not user_ids:
+                return [], []
+
+            # the children of the profiles first, then the profiles and the permissions, then the users
+            # the devices and the refresh tokens are deleted with the users (ON DELETE CASCADE)
+            user_parameters = {"user_ids": user_ids}
+            for table_name in [self.schedules_table, self.study_preferences_table]:
+                connection.execute(
+                    text(
+                        f"""
+                        DELETE FROM {table_name}
+                        WHERE user_id IN (
+                            SELECT id FROM {self.profiles_table}
+                            WHERE user_id = ANY(CAST(:user_ids AS uuid[]))
+                        )
+                        """
+                    ),
+                    user_parameters,
+                )
+            profiles = connection.execute(
+                text(
+                    f"""
+                    DELETE FROM {self.profiles_table}
+                    WHERE user_id = ANY(CAST(:user_ids AS uuid[]))
+                    RETURNING profile_image, identification_material
+                    """
+                ),
+                user_parameters,
+            ).fetchall()
+            connection.execute(
+                text(
+                    f"DELETE FROM {self.permissions_table} WHERE user_id = ANY(CAST(:user_ids AS uuid[]))"
+                ),
+                user_parameters,
+            )
+            connection.execute(
+                text(
+                    f"DELETE FROM {self.users_table} WHERE user_id = ANY(CAST(:user_ids AS uuid[]))"
+                ),
+                user_parameters,
+            )
+
+        file_paths = [
+            path
+            for profile in profiles
+            for path in (profile.profile_image, profile.identification_material)
+            if path
+        ]
+        return user_ids, file_paths
+
+    # a private method that removes the uploaded files of the deleted profiles (only the files inside the upload folder)
+    def __remove_files(self, file_paths) -> None:
+        for file_path in file_paths:
+            absolute_path = os.path.abspath(file_path)
+            if os.path.dirname(absolute_path) != self.upload_folder:
+                continue
+            try:
+                os.remove(absolute_path)
+                self.__count("files")
+            except FileNotFoundError:
+                pass
+            except OSError as error:
+                print(f"There was an error while removing {file_path}: {error}")
+
+    # delete one batch of the users marked for deletion, return the number of users deleted
+    def purge_deleted_once(self) -> int:
+        user_ids, file_paths = self.__purge_batch(
+            f"""
+            SELECT user_id FROM {self.users_table}
+            WHERE deleted_at IS NOT NULL
+            ORDER BY deleted_at
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+            """,
+            {},
+        )
+        # the files are removed after the commit -> a rolled back batch keeps its files
+        self.__remove_files(file_paths)
+        self.__count("deleted", len(user_ids))
+        return len(user_ids)
+
+    # delete one batch of the users that are still not verified unverified_days after their registration (not the imported ones), return the number of users deleted
+    def purge_unverified_once(self) -> int:
+        if not self.unverified_days:
+            return 0
+        # created_at is stored in EST like in the registration
+        cutoff = datetime.now(pytz.timezone("EST")) - timedelta(
+            days=self.unverified_days
+        )
+        user_ids, file_paths = self.__purge_batch(
+            f"""
+            SELECT user_id FROM {self.users_table}
+            WHERE account_verified = false AND imported = false AND deleted_at IS NULL AND created_at < :cutoff
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+            """,
+            {"cutoff": cutoff},
+        )
+        self.__remove_files(file_paths)
+        self.__count("unverified", len(user_ids))
+        return len(user_ids)
+
+    # delete batches (the deleted accounts first) until there is nothing left or the time budget is spent
+    # return True when accounts may be left for the next run
+    def run_once(self) -> bool:
+        self.__count("runs")
+        deadline = time.monotonic() + self.time_budget
+        for purge_once in [self.purge_deleted_once, self.purge_unverified_once]:
+            while True:
+                if time.monotonic() >= deadline:
+                    return True
+                purged = purge_once()
+                self.__count("batches")
+                if purged < self.batch_size:
+                    break
+        return False
+
+    # a private method that runs in the background thread: purge, then wait to be woken up or for the next poll
+    def __run(self) -> None:
+        while True:
+            try:
+                has_more = self.run_once()
+            except Exception as error:
+                # a batch that hit the lock timeout is rolled back and retried by the next run
+                print(f"There was an error in the account purger: {error}")
+                has_more = False
+
+            self.__wake_up.wait(self.pause if has_more else self.poll_interval)
+            self.__wake_up.clear()
+
+    # the counters of the purger
+    def stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__metrics)
+
+
+# the account purger of this process
+account_purger = AccountPurger(
+    db=db,
+    Users=Users,
+    UserInformation=UserInformation,
+    StudyPreferences=StudyPreferences,
+    AvailabilitySchedule=AvailabilitySchedule,
+    Permission=Permission,
+    RefreshToken=RefreshToken,
+    token_revocation_list=token_revocation_list,
+    upload_folder=UPLOAD_FOLDER,
+    batch_size=account_purge_batch_size,
+    time_budget=account_purge_time_budget,
+    poll_interval=account_purge_poll_interval,
+    unverified_days=account_purge_unverified_days,
+)
@@ -0,0 +1,74 @@
+# this is a command that measures how long bcrypt takes on this host for each cost factor and recommends the cost for a target login latency
+# usage: python -m helper_functions.bcrypt_benchmark --target-ms 250 --min-rounds 10 --max-rounds 14 --samples 5
+import argparse
+import statistics
+import time
+
+import bcrypt
+
+from get_env import bcrypt_rounds
+
+
+# measure the hashing time (in milliseconds) of one cost factor
+def measure_rounds(rounds, samples) -> list:
+    password = b"StudyHub-benchmark-password1$"
+    timings = []
+    for _ in range(samples):
+        start_time = time.perf_counter()
+        bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return timings
+
+
+# the highest cost factor whose median hashing time stays under the target latency
+def recommend_rounds(results, target_ms):
+    recommended_rounds = None
+    for rounds, timings in sorted(results.items()):
+        if statistics.median(timings) <= target_ms:
+            recommended_rounds = rounds
+    return recommended_rounds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure the bcrypt hashing time for each cost factor on this host"
+    )
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    print(
+        f"{'cost':>4} {'median ms':>10} {'min ms':>10} {'max ms':>10} {'logins/s/core':>14}"
+    )
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        timings = measure_rounds(rounds, args.samples)
+        results[rounds] = timings
+        median_ms = statistics.median(timings)
+        print(
+            f"{rounds:>4} {median_ms:>10.1f} {min(timings):>10.1f} {max(timings):>10.1f} {1000 / median_ms:>14.1f}"
+        )
+
+        # every extra round doubles the time -> stop once the cost is far above the target
+        if median_ms > args.target_ms * 4:
+            break
+
+    recommended_rounds = recommend_rounds(results, args.target_ms)
+    print(f"\nConfigured cost (BCRYPT_ROUNDS): {bcrypt_rounds}")
+    if recommended_rounds is None:
+        print(
+            f"Every measured cost is slower than {args.target_ms} ms, try a lower --min-rounds"
+        )
+    else:
+        print(
+            f"Recommended cost for a target of {args.target_ms} ms per hash: {recommended_rounds}"
+        )
+        print(
+            "Set BCRYPT_ROUNDS to the recommended cost, the stored passwords are rehashed when their users log in"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,606 @@
+# this is the bulk import of the users of a partner university: one row per student with their account, and optionally their profile and study preferences
+# the rows are streamed from a CSV or NDJSON file, so the whole file is never in memory, and are imported in batches:
+# every batch is validated at once (one query for the usernames and verifications that are already taken), the passwords of the batch are hashed
+# by the shared pool of worker processes (half of its workers at most), then the rows are loaded with Postgres COPY into temporary tables and inserted from there in one transaction
+# a row that is not valid (or that loses a race on a unique constraint) is reported with its errors, the other rows of the batch are still imported
+# the imported accounts are marked (users.imported): they may have no way to be verified (phone numbers, devices, or no verification email),
+# so the purge of the unverified accounts skips them
+import csv
+import io
+import itertools
+import json
+import random
+import uuid
+from datetime import date, datetime
+
+import pytz
+from sqlalchemy import text, types
+
+from database.users_models import (
+    Permission,
+    StudyPreferences,
+    UserInformation,
+    Users,
+    db,
+)
+from get_env import (
+    bulk_import_batch_size,
+)
+from helper_functions.email_outbox import email_outbox
+from helper_functions.password_hashing import password_hasher
+from helper_functions.registerformValidation import (
+    registered_verification,
+    registration_schema,
+)
+from helper_functions.validate_study_preferences import study_preferences_schema
+from helper_functions.validate_users_information import user_information_schema
+from Twilio.twilio_send_email import create_verification_token
+
+
+################################# READERS #################################
+# every reader yields (row number, row, error of the row that could not be read)
+# a row is {"username": .., "password": .., "verification_method": .., "verification": .., "areacode_id": .., "profile": {..}, "study_preferences": {..}}
+
+
+# the columns of the profile and of the study preferences are prefixed with their section in the header ("profile.first_name")
+def read_csv_rows(lines):
+    for row_number, record in enumerate(csv.DictReader(lines), start=1):
+        # the cells after the last column of the header are put under the None key
+        if None in record:
+            yield row_number, None, "The row has more cells than the header!"
+            continue
+
+        row = {}
+        for column, value in record.items():
+            section, _, field = column.partition(".")
+            if field:
+                row.setdefault(section, {})[field] = value or None
+            else:
+                row[column] = value or None
+        # an empty profile or study preferences section means that the row has none
+        for section in [name for name, value in row.items() if isinstance(value, dict)]:
+            if all(value is None for value in row[section].values()):
+                del row[section]
+        yield row_number, row, None
+
+
+# one JSON object per line, the profile and the study preferences are nested objects
+def read_ndjson_rows(lines):
+    for row_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield row_number, None, f"Invalid JSON: {error}"
+            continue
+        if not isinstance(row, dict):
+            yield row_number, None, "Every line must be a JSON object!"
+            continue
+        yield row_number, row, None
+
+
+import_readers = {"csv": read_csv_rows, "ndjson": read_ndjson_rows}
+
+
+# a function that reads the rows of a file (an iterable of text lines) in the given format
+def read_import_rows(lines, file_format):
+    if file_format not in import_readers:
+        raise ValueError(f"Unknown import format: {file_format}")
+    return import_readers[file_format](lines)
+
+
+################################# IMPORTER #################################
+class BulkUserImporter:
+    # the fields of the account in a row
+    user_fields = (
+        "username",
+        "password",
+        "verification_method",
+        "verification",
+        "areacode_id",
+    )
+    # the columns of the profile and of the study preferences that the importer sets itself
+    generated_columns = ("id", "user_id", "created_at", "updated_at")
+    # the permissions that a user gets with their profile (same as POST /studyhub/user-profile/user-information/)
+    profile_permissions = (
+        "can_view_study_preferences",
+        "can_change_study_preferences",
+        "can_view_availability_schedule",
+        "can_change_availability_schedule",
+    )
+
+    def __init__(
+        self,
+        db,
+        Users,
+        UserInformation,
+        StudyPreferences,
+        Permission,
+        email_outbox,
+        password_hasher,
+        batch_size=1000,
+    ) -> None:
+        self.db = db
+        self.Users = Users
+        self.UserInformation = UserInformation
+        self.StudyPreferences = StudyPreferences
+        self.Permission = Permission
+        self.email_outbox = email_outbox
+        self.password_hasher = password_hasher
+        self.batch_size = batch_size
+
+    # a private method that converts a value to the type of its column, raise ValueError if it can't
+    def __convert(self, column, value):
+        column_type = column.type
+        # an Enum is a String -> it is checked first
+        if isinstance(column_type, types.Enum):
+            if value not in column_type.enums or value == "--select--":
+                raise ValueError(f"{value!r} is not one of the options!")
+            return value
+        if isinstance(column_type, types.Date):
+            return value if isinstance(value, date) else date.fromisoformat(str(value))
+        if isinstance(column_type, types.Integer):
+            if isinstance(value, bool):
+                raise ValueError(f"{value!r} is not a number!")
+            return int(value)
+        if isinstance(column_type, types.String):
+            value = str(value)
+            if column_type.length and len(value) > column_type.length:
+                raise ValueError(
+                    f"Must be at most {column_type.length} characters long!"
+                )
+            return value
+        return value
+
+    # a private method that validates the fields of a section (profile or study preferences) against the columns of its model
+    def __validate_columns(self, Model, values, section, errors):
+        if not isinstance(values, dict):
+            errors[section] = f"The {section} must be an object!"
+            return None
+
+        columns = {
+            column.name: column
+            for column in Model.__table__.columns
+            if column.name not in self.generated_columns
+        }
+        for name in values:
+            if name not in columns:
+                errors[f"{section}.{name}"] = "Unknown field!"
+
+        cleaned_values = {}
+        for name, column in columns.items():
+            value = values.get(name)
+            if value is None or value == "":
+                if column.default is not None and column.default.is_scalar:
+                    cleaned_values[name] = column.default.arg
+                elif column.nullable:
+                    cleaned_values[name] = None
+                else:
+                    errors[f"{section}.{name}"] = "This field is required!"
+                continue
+            try:
+                cleaned_values[name] = self.__convert(column, value)
+            except (TypeError, ValueError) as error:
+                errors[f"{section}.{name}"] = f"{error}"
+        return cleaned_values
+
+    # a private method that validates one section (profile or study preferences) of every row of a batch with the rules of its form at once
+    # return the errors of each row in the same order, keyed by "<section>.<error key>" (a section that is not an object is reported by __validate_row)
+    def __validate_sections(self, schema, rows, section) -> list:
+        sections = [row.get(section) for row in rows]
+        section_errors = iter(
+            schema.validate_many(
+                [values for values in sections if values and isinstance(values, dict)]
+            )
+        )
+        return [
+            {
+                f"{section}.{error_key}": message
+                for error_key, message in next(section_errors).items()
+            }
+            if values and isinstance(values, dict)
+            else {}
+            for values in sections
+        ]
+
+    # a private method that validates one row with the rules of the models
+    # the errors of the account (registration form rules), of the profile and of the study preferences (their form rules) are already in errors
+    def __validate_row(self, row, errors):
+        for name in row:
+            if name not in self.user_fields and name not in (
+                "profile",
+                "study_preferences",
+            ):
+                errors[name] = "Unknown field!"
+        if errors:
+            return None
+
+        profile = row.get("profile")
+        study_preferences = row.get("study_preferences")
+        if study_preferences and not profile:
+            errors["study_preferences"] = "The study preferences need a profile!"
+        if profile:
+            profile = self.__validate_columns(
+                self.UserInformation, profile, "profile", errors
+            )
+        if study_preferences:
+            study_preferences = self.__validate_columns(
+                self.StudyPreferences, study_preferences, "study_preferences", errors
+            )
+        if errors:
+            return None
+
+        return {
+            "username": row["username"],
+            "password": row["password"],
+            "verification_method": row["verification_method"],
+            "verification": registered_verification(
+                row["verification_method"], row["verification"], row.get("areacode_id")
+            ),
+            "profile": profile or None,
+            "study_preferences": study_preferences or None,
+        }
+
+    # a private method that returns the usernames and the verifications of a batch that are already taken in the database, in one query
+    def __taken(self, candidates):
+        if not candidates:
+            return set(), set()
+        with self.db.engine.connect() as connection:
+            rows = connection.execute(
+                text(
+                    f"""
+                    SELECT username, verification_method, verification FROM {self.Users.__tablename__}
+                    WHERE username = ANY(CAST(:usernames AS varchar[]))
+                    OR verification = ANY(CAST(:verifications AS varchar[]))
+                    """
+                ),
+                {
+                    "usernames": [candidate["username"] for candidate in candidates],
+                    "verifications": [
+                        candidate["verification"] for candidate in candidates
+                    ],
+                },
+            ).fetchall()
+        return (
+            {row.username for row in rows},
+            {(row.verification_method, row.verification) for row in rows},
+        )
+
+    # a private method that validates a batch, return (the valid rows, the errors of the other rows)
+    # the usernames and verifications of the previous batches are in seen_usernames and seen_verifications (duplicates inside the file)
+    def __validate_batch(self, batch, seen_usernames, seen_verifications):
+        candidates, errors = [], []
+        for row_number, row, read_error in batch:
+            if read_error is not None:
+                errors.append({"row": row_number, "errors": {"row": read_error}})
+        readable_rows = [
+            (row_number, row) for row_number, row, _ in batch if row is not None
+        ]
+        # the accounts of the whole batch are checked with the compiled rules of the registration form at once
+        account_errors = registration_schema.validate_many(
+            [
+                {
+                    "username": row.get("username"),
+                    "password": row.get("password"),
+                    "password_confirmation": row.get("password"),
+                    "verification_method": row.get("verification_method"),
+                    "verification": row.get("verification"),
+                }
+                for _, row in readable_rows
+            ]
+        )
+
+        # the profiles and the study preferences with the compiled rules of their forms
+        profile_errors = self.__validate_sections(
+            user_information_schema, [row for _, row in readable_rows], "profile"
+        )
+        study_preferences_errors = self.__validate_sections(
+            study_preferences_schema,
+            [row for _, row in readable_rows],
+            "study_preferences",
+        )
+
+        for (row_number, row), row_errors, row_profile_errors, row_study_errors in zip(
+            readable_rows, account_errors, profile_errors, study_preferences_errors
+        ):
+            row_errors.update(row_profile_errors)
+            row_errors.update(row_study_errors)
+            candidate = self.__validate_row(row, row_errors)
+            if candidate is not None:
+                verification_key = (
+                    candidate["verification_method"],
+                    candidate["verification"],
+                )
+                if candidate["username"] in seen_usernames:
+                    row_errors["username"] = "The username is used by another row!"
+                elif verification_key in seen_verifications:
+                    row_errors[
+                        "verification"
+                    ] = "The verification is used by another row!"
+                else:
+                    seen_usernames.add(candidate["username"])
+                    seen_verifications.add(verification_key)
+            if row_errors:
+                errors.append({"row": row_number, "errors": row_errors})
+                continue
+
+            candidate["row"] = row_number
+            candidates.append(candidate)
+
+        taken_usernames, taken_verifications = self.__taken(candidates)
+        valid_rows = []
+        for candidate in candidates:
+            if candidate["username"] in taken_usernames:
+                errors.append(
+                    {
+                        "row": candidate["row"],
+                        "errors": {"username": "The username is already taken!"},
+                    }
+                )
+            elif (
+                candidate["verification_method"],
+                candidate["verification"],
+            ) in taken_verifications:
+                errors.append(
+                    {
+                        "row": candidate["row"],
+                        "errors": {
+                            "verification": "The verification is already used by another account!"
+                        },
+                    }
+                )
+            else:
+                valid_rows.append(candidate)
+        return valid_rows, errors
+
+    # a private method that copies rows into a temporary table shaped like the table of the model (dropped at the end of the transaction)
+    def __copy_to_staging(self, cursor, Model, columns, rows) -> str:
+        staging_table = f"import_{Model.__tablename__}"
+        cursor.execute(
+            f"CREATE TEMP TABLE {staging_table} (LIKE {Model.__tablename__} INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        self.__copy(cursor, staging_table, columns, rows)
+        return staging_table
+
+    # a private method that loads rows into a table with COPY (CSV format, None is NULL)
+    def __copy(self, cursor, table_name, columns, rows) -> None:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(
+                [
+                    ("true" if value else "false")
+                    if isinstance(value, bool)
+                    else value.isoformat()
+                    if isinstance(value, (date, datetime))
+                    else value
+                    for value in row
+                ]
+            )
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+
+    # a private method that loads the valid rows of a batch in one transaction, return the rows that were rejected by a unique constraint
+    def __load_batch(self, valid_rows, hashed_passwords, send_verification_emails):
+        # the users, profiles and study preferences are stored in EST like in the registration, the outbox in UTC
+        now = datetime.now(pytz.timezone("EST"))
+        outbox_now = datetime.utcnow()
+        user_columns = (
+            "user_id",
+            "username",
+            "password",
+            "verification_method",
+            "verification",
+            "account_verified",
+            "temp_token",
+            "is_active",
+            "imported",
+            "created_at",
+            "updated_at",
+        )
+        user_rows, profile_rows, study_preferences_rows = [], [], []
+        profile_columns = study_preferences_columns = None
+        for candidate, hashed_password in zip(valid_rows, hashed_passwords):
+            candidate["user_id"] = str(uuid.uuid4())
+            candidate["temp_token"] = create_verification_token(
+                candidate["verification"], f"{random.randint(0, 999999):06d}"
+            )
+            user_rows.append(
+                (
+                    candidate["user_id"],
+                    candidate["username"],
+                    hashed_password,
+                    candidate["verification_method"],
+                    candidate["verification"],
+                    False,
+                    candidate["temp_token"],
+                    False,
+                    True,
+                    now,
+                    now,
+                )
+            )
+
+            if candidate["profile"]:
+                profile_id = str(uuid.uuid4())
+                profile_columns = self.generated_columns + tuple(candidate["profile"])
+                profile_rows.append(
+                    (profile_id, candidate["user_id"], now, now)
+                    + tuple(candidate["profile"].values())
+                )
+                if candidate["study_preferences"]:
+                    study_preferences_columns = self.generated_columns + tuple(
+                        candidate["study_preferences"]
+                    )
+                    study_preferences_rows.append(
+                        (str(uuid.uuid4()), profile_id, now, now)
+                        + tuple(candidate["study_preferences"].values())
+                    )
+
+        connection = self.db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            users_staging = self.__copy_to_staging(
+                cursor, self.Users, user_columns, user_rows
+            )
+            # the rows that lost a race with another registration since the validation are skipped instead of failing the batch
+            cursor.execute(
+                f"""
+                INSERT INTO {self.Users.__tablename__} ({', '.join(user_columns)})
+                SELECT {', '.join(user_columns)} FROM {users_staging}
+                ON CONFLICT DO NOTHING
+                RETURNING user_id
+                """
+            )
+            inserted_user_ids = [str(row[0]) for row in cursor.fetchall()]
+
+            if profile_rows:
+                profiles_staging = self.__copy_to_staging(
+                    cursor, self.UserInformation, profile_columns, profile_rows
+                )
+                cursor.execute(
+                    f"""
+                    INSERT INTO {self.UserInformation.__tablename__} ({', '.join(profile_columns)})
+                    SELECT {', '.join(profile_columns)} FROM {profiles_staging}
+                    WHERE user_id = ANY(%s::uuid[])
+                    """,
+                    (inserted_user_ids,),
+                )
+                cursor.execute(
+                    f"""
+                    INSERT INTO {self.Permission.__tablename__} (name, user_id)
+                    SELECT permissions.name, profiles.user_id
+                    FROM {profiles_staging} AS profiles
+                    CROSS JOIN unnest(%s::varchar[]) AS permissions(name)
+                    WHERE profiles.user_id = ANY(%s::uuid[])
+                    """,
+                    (list(self.profile_permissions), inserted_user_ids),
+                )
+
+                if study_preferences_rows:
+                    study_preferences_staging = self.__copy_to_staging(
+                        cursor,
+                        self.StudyPreferences,
+                        study_preferences_columns,
+                        study_preferences_rows,
+                    )
+                    cursor.execute(
+                        f"""
+                        INSERT INTO {self.StudyPreferences.__tablename__} ({', '.join(study_preferences_columns)})
+                        SELECT {', '.join(study_preferences_columns)} FROM {study_preferences_staging}
+                        WHERE user_id IN (
+                            SELECT id FROM {profiles_staging} WHERE user_id = ANY(%s::uuid[])
+                        )
+                        """,
+                        (inserted_user_ids,),
+                    )
+
+            # the verification emails are added to the outbox in the same transaction, the dispatcher sends them in bulk after the commit
+            inserted = set(inserted_user_ids)
+            outbox_rows = [
+                (
+                    candidate["verification"],
+                    "post",
+                    candidate["temp_token"],
+                    self.email_outbox.token_expires_at(candidate["temp_token"]),
+                    "pending",
+                    0,
+                    outbox_now,
+                    outbox_now,
+                )
+                for candidate in valid_rows
+                if candidate["user_id"] in inserted
+                and candidate["verification_method"] == "Email"
+            ]
+            if send_verification_emails and outbox_rows:
+                self.__copy(
+                    cursor,
+                    self.email_outbox.table_name,
+                    (
+                        "recipient",
+                        "template",
+                        "token",
+                        "expires_at",
+                        "status",
+                        "attempts",
+                        "next_attempt_at",
+                        "created_at",
+                    ),
+                    outbox_rows,
+                )
+
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+        if send_verification_emails and outbox_rows:
+            self.email_outbox.notify()
+
+        return [
+            {
+                "row": candidate["row"],
+                "errors": {
+                    "row": "The username or the verification has been taken during the import!"
+                },
+            }
+            for candidate in valid_rows
+            if candidate["user_id"] not in inserted
+        ]
+
+    # import the rows given by a reader, return the number of users imported and the errors of every row that was not imported
+    def run(self, rows, send_verification_emails=True) -> dict:
+        report = {"imported": 0, "failed": 0, "errors": []}
+        seen_usernames, seen_verifications = set(), set()
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+
+            valid_rows, errors = self.__validate_batch(
+                batch, seen_usernames, seen_verifications
+            )
+            if valid_rows:
+                try:
+                    hashed_passwords = self.password_hasher.hash_many(
+                        [candidate["password"] for candidate in valid_rows]
+                    )
+                    errors.extend(
+                        self.__load_batch(
+                            valid_rows, hashed_passwords, send_verification_emails
+                        )
+                    )
+                # the batch has been rolled back -> its rows are reported and the next batches are still imported
+                except Exception as error:
+                    errors.extend(
+                        {"row": candidate["row"], "errors": {"row": f"{error}"}}
+                        for candidate in valid_rows
+                    )
+
+            report["failed"] += len(errors)
+            report["imported"] += len(batch) - len(errors)
+            report["errors"].extend(errors)
+
+        report["errors"].sort(key=lambda error: error["row"])
+        return report
+
+
+# the importer of this process, the passwords are hashed on the shared pool (an import only takes half of its workers)
+# a pool of its own would fork idle worker processes in every web worker for a feature that is rarely used
+bulk_user_importer = BulkUserImporter(
+    db=db,
+    Users=Users,
+    UserInformation=UserInformation,
+    StudyPreferences=StudyPreferences,
+    Permission=Permission,
+    email_outbox=email_outbox,
+    password_hasher=password_hasher,
+    batch_size=bulk_import_batch_size,
+)
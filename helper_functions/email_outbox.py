@@ -0,0 +1,273 @@
+# this is the transactional outbox of the verification, password change and account deletion emails
+# a request only adds a row to the email_outbox table in the same transaction as its change, so the email exists if and only if the change is committed
+# a background dispatcher claims the due rows with FOR UPDATE SKIP LOCKED (every worker process can run one without sending an email twice),
+# sends them in batches outside of the transaction, then records the delivery status or schedules a retry with an exponential backoff
+# a link is useless once its token has expired -> such an email is marked as failed instead of being sent or retried, and the token is emptied once the email is done
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import jwt
+from sqlalchemy import text
+
+from database.users_models import EmailOutbox, db
+from get_env import (
+    email_outbox_backoff,
+    email_outbox_batch_size,
+    email_outbox_max_attempts,
+    email_outbox_max_backoff,
+    email_outbox_poll_interval,
+)
+from Twilio.twilio_send_email import sendgrid_send_outbox_batch
+
+
+class EmailOutboxDispatcher:
+    def __init__(
+        self,
+        db,
+        EmailOutbox,
+        send_batch,
+        batch_size=1000,
+        poll_interval=5.0,
+        max_attempts=8,
+        backoff=30.0,
+        max_backoff=3600.0,
+        lease_seconds=300,
+        retention_seconds=604800,
+    ) -> None:
+        self.db = db
+        self.EmailOutbox = EmailOutbox
+        self.table_name = EmailOutbox.__tablename__
+        self.send_batch = send_batch  # a function (messages) -> {outbox id: error}
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # a claimed email that is still "sending" after the lease (the process died) can be claimed again
+        self.lease_seconds = lease_seconds
+        # how long the sent emails are kept before they are pruned (7 days)
+        self.retention_seconds = retention_seconds
+
+        self.__engine = None
+        self.__worker = None
+        self.__wake_up = threading.Event()
+        self.__lock = threading.Lock()
+        self.__pruned_at = 0.0
+        self.__metrics = {
+            "batches": 0,
+            "claimed": 0,
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "expired": 0,
+        }
+
+    # a private method that increases a counter of the metrics
+    def __count(self, name, value=1) -> None:
+        with self.__lock:
+            self.__metrics[name] += value
+
+    # when the token of the link expires (in UTC like the outbox), None if it never expires
+    # the token was signed by this server -> only its expiration is read here, the confirm routes verify it
+    def token_expires_at(self, token):
+        expiration = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        return datetime.utcfromtimestamp(expiration) if expiration else None
+
+    # add an email to the outbox in the transaction of the session, nothing is sent until the transaction commits
+    def add(self, session, recipient, template, token) -> None:
+        now = datetime.utcnow()
+        session.add(
+            self.EmailOutbox(
+                recipient=recipient,
+                template=template,
+                token=token,
+                expires_at=self.token_expires_at(token),
+                status="pending",
+                attempts=0,
+                next_attempt_at=now,
+                created_at=now,
+            )
+        )
+
+    # start the background dispatcher, the engine has to come from a thread with an app context
+    def start(self, engine) -> None:
+        with self.__lock:
+            if self.__engine is None:
+                self.__engine = engine
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__run, daemon=True)
+                self.__worker.start()
+
+    # wake the dispatcher up after the transaction that added emails has committed, so they don't wait for the next poll
+    def notify(self) -> None:
+        self.start(self.db.engine)
+        self.__wake_up.set()
+
+    # a private method that claims the next due emails, the rows locked by another dispatcher are skipped
+    # the due emails whose token has expired are marked as failed first so they are never sent
+    def __claim_batch(self, now) -> list:
+        with self.__engine.begin() as connection:
+            expired = connection.execute(
+                text(
+                    f"""
+                    UPDATE {self.table_name}
+                    SET status = 'failed', token = '', last_error = 'The token has expired before the email could be sent'
+                    WHERE status IN ('pending', 'sending') AND next_attempt_at <= :now AND expires_at <= :now
+                    """
+                ),
+                {"now": now},
+            )
+            if expired.rowcount:
+                self.__count("expired", expired.rowcount)
+            rows = connection.execute(
+                text(
+                    f"""
+                    UPDATE {self.table_name}
+                    SET status = 'sending', attempts = attempts + 1, next_attempt_at = :lease_until
+                    WHERE id IN (
+                        SELECT id FROM {self.table_name}
+                        WHERE status IN ('pending', 'sending') AND next_attempt_at <= :now
+                        ORDER BY next_attempt_at
+                        LIMIT :batch_size
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, recipient, template, token, attempts, expires_at
+                    """
+                ),
+                {
+                    "now": now,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "batch_size": self.batch_size,
+                },
+            )
+            return rows.fetchall()
+
+    # a private method that returns the delay before the next attempt (exponential backoff with jitter)
+    def __retry_delay(self, attempts) -> float:
+        delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    # a private method that records the delivery status of a batch
+    def __record_results(self, rows, errors) -> None:
+        now = datetime.utcnow()
+        sent_ids = [row.id for row in rows if row.id not in errors]
+        retries, failures = [], []
+        for row in rows:
+            if row.id not in errors:
+                continue
+            next_attempt_at = now + timedelta(seconds=self.__retry_delay(row.attempts))
+            # no retry after the last attempt or after the token has expired
+            if row.attempts >= self.max_attempts or (
+                row.expires_at is not None and next_attempt_at >= row.expires_at
+            ):
+                failures.append({"id": row.id, "error": errors[row.id]})
+            else:
+                retries.append(
+                    {
+                        "id": row.id,
+                        "error": errors[row.id],
+                        "next_attempt_at": next_attempt_at,
+                    }
+                )
+
+        with self.__engine.begin() as connection:
+            if sent_ids:
+                connection.execute(
+                    text(
+                        f"""
+                        UPDATE {self.table_name}
+                        SET status = 'sent', sent_at = :now, token = '', last_error = NULL
+                        WHERE id = ANY(CAST(:ids AS bigint[]))
+                        """
+                    ),
+                    {"now": now, "ids": sent_ids},
+                )
+            if retries:
+                connection.execute(
+                    text(
+                        f"""
+                        UPDATE {self.table_name}
+                        SET status = 'pending', next_attempt_at = :next_attempt_at, last_error = :error
+                        WHERE id = :id
+                        """
+                    ),
+                    retries,
+                )
+            if failures:
+                connection.execute(
+                    text(
+                        f"UPDATE {self.table_name} SET status = 'failed', token = '', last_error = :error WHERE id = :id"
+                    ),
+                    failures,
+                )
+
+        self.__count("sent", len(sent_ids))
+        self.__count("retried", len(retries))
+        self.__count("failed", len(failures))
+
+    # claim and send one batch, return the number of emails that were claimed
+    def dispatch_once(self) -> int:
+        rows = self.__claim_batch(datetime.utcnow())
+        if not rows:
+            return 0
+        self.__count("batches")
+        self.__count("claimed", len(rows))
+
+        # the emails are sent after the claim has committed -> no database connection is held while the provider answers
+        messages = [(row.id, row.recipient, row.template, row.token) for row in rows]
+        try:
+            errors = self.send_batch(messages)
+        except Exception as error:
+            print(f"There was an error while sending a batch of emails: {error}")
+            errors = {row.id: f"{error}" for row in rows}
+
+        self.__record_results(rows, errors)
+        return len(rows)
+
+    # delete the emails that were sent more than retention_seconds ago, return the number of rows deleted
+    def prune(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention_seconds)
+        with self.__engine.begin() as connection:
+            result = connection.execute(
+                text(
+                    f"DELETE FROM {self.table_name} WHERE status = 'sent' AND sent_at < :cutoff"
+                ),
+                {"cutoff": cutoff},
+            )
+        return result.rowcount
+
+    # a private method that runs in the background thread: send while there are full batches, otherwise wait to be woken up or for the next poll
+    def __run(self) -> None:
+        while True:
+            try:
+                claimed = self.dispatch_once()
+                if time.monotonic() - self.__pruned_at > 3600:
+                    self.__pruned_at = time.monotonic()
+                    self.prune()
+            except Exception as error:
+                print(f"There was an error in the email outbox dispatcher: {error}")
+                claimed = 0
+
+            if claimed < self.batch_size:
+                self.__wake_up.wait(self.poll_interval)
+                self.__wake_up.clear()
+
+    # the counters of the dispatcher
+    def stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__metrics)
+
+
+# the email outbox dispatcher of this process
+email_outbox = EmailOutboxDispatcher(
+    db=db,
+    EmailOutbox=EmailOutbox,
+    send_batch=sendgrid_send_outbox_batch,
+    batch_size=email_outbox_batch_size,
+    poll_interval=email_outbox_poll_interval,
+    max_attempts=email_outbox_max_attempts,
+    backoff=email_outbox_backoff,
+    max_backoff=email_outbox_max_backoff,
+)
@@ -1,20 +1,29 @@
-# this is a helper function that will grant the permission for the users to access to limited resources after they have verified their account with AWS SNS
-def grant_permission_to_verified_users(permission_name, db, Users, Permission) -> bool:
-    # query to get all the users who have verified their account
-    verified_users = Users.query.filter_by(account_verified=True).all()
+# this is a helper function that will grant the permissions for one user to access to limited resources after they have verified their account
+# only the permissions that the user doesn't have yet are inserted, all in one INSERT ... SELECT statement (no per-permission or per-user queries)
+# the unique constraint on (user_id, name) skips the permissions that are granted at the same time by another request
+from sqlalchemy import text
 
-    try:
-        for user in verified_users:
-            permission = Permission.query.filter_by(
-                user_id=user.user_id, name=permission_name
-            ).first()
-            if not permission:
-                permission = Permission(name=permission_name, user_id=user.user_id)
-                db.session.add(permission)
 
+def grant_permissions_to_user(user_id, permission_names, db, Permission) -> bool:
+    # insert every requested permission name that is missing for this user in a single round trip
+    grant_missing_permissions = text(
+        f"""
+        INSERT INTO {Permission.__tablename__} (name, user_id)
+        SELECT DISTINCT requested.name, CAST(:user_id AS uuid)
+        FROM unnest(CAST(:permission_names AS varchar[])) AS requested(name)
+        ON CONFLICT (user_id, name) DO NOTHING
+        """
+    )
+
+    try:
+        db.session.execute(
+            grant_missing_permissions,
+            {"user_id": str(user_id), "permission_names": list(permission_names)},
+        )
         db.session.commit()
         return True
     except Exception as error:
+        db.session.rollback()
         print(
             f"There is an error occured while inserting new permissions into the database: {error}"
         )
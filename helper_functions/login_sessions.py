@@ -0,0 +1,145 @@
+# this is a store that keeps the logins that are waiting for the OTP verification, keyed by a random session id that is sent to the client in a cookie
+# the store can keep the sessions in the memory of the process or in the database (pending_login table) so they can be shared by every worker
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from helper_functions.otp_engine import TimingWheel
+
+
+# a backend that keeps the pending logins in the memory of this process only
+# the sessions expire with a timing wheel (like the OTP codes) -> no full scan of the sessions on every login
+class LocalMemoryLoginSessionBackend:
+    def __init__(self) -> None:
+        # session id -> (expiration time, data)
+        self.__sessions = {}
+        self.__wheel = TimingWheel()
+        self.__lock = threading.Lock()
+
+    # a private method that removes the sessions whose expiration time has passed, return the number of sessions removed
+    def __expire(self, now) -> int:
+        expired_count = 0
+        for session_id in self.__wheel.advance(now):
+            session = self.__sessions.get(session_id)
+            # the session may have been deleted or set again since it was scheduled
+            if session is not None and session[0] <= now:
+                del self.__sessions[session_id]
+                expired_count += 1
+        return expired_count
+
+    def set(self, session_id, data, ttl_seconds) -> None:
+        now = time.time()
+        with self.__lock:
+            self.__expire(now)
+            self.__sessions[session_id] = (now + ttl_seconds, data)
+            self.__wheel.schedule(session_id, now + ttl_seconds)
+
+    def get(self, session_id):
+        with self.__lock:
+            session = self.__sessions.get(session_id)
+            if session is None:
+                return None
+
+            expiration_time, data = session
+            if expiration_time <= time.time():
+                del self.__sessions[session_id]
+                return None
+            return data
+
+    def delete(self, session_id) -> None:
+        with self.__lock:
+            self.__sessions.pop(session_id, None)
+
+    def prune(self) -> int:
+        with self.__lock:
+            return self.__expire(time.time())
+
+
+# a backend that keeps the pending logins in the database so every worker process can read them
+class DatabaseLoginSessionBackend:
+    def __init__(self, db, PendingLogin) -> None:
+        self.db = db
+        self.PendingLogin = PendingLogin
+
+    def set(self, session_id, data, ttl_seconds) -> None:
+        now = datetime.utcnow()
+        try:
+            self.db.session.add(
+                self.PendingLogin(
+                    session_id=session_id,
+                    data=data,
+                    expires_at=now + timedelta(seconds=ttl_seconds),
+                )
+            )
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+
+    def get(self, session_id):
+        pending_login = self.PendingLogin.query.filter(
+            self.PendingLogin.session_id == session_id,
+            self.PendingLogin.expires_at > datetime.utcnow(),
+        ).first()
+        return pending_login.data if pending_login else None
+
+    def delete(self, session_id) -> None:
+        try:
+            self.PendingLogin.query.filter(
+                self.PendingLogin.session_id == session_id
+            ).delete(synchronize_session=False)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+
+    # remove the sessions that expired (a scheduled job), the logins don't pay for it
+    def prune(self) -> int:
+        with self.db.engine.begin() as connection:
+            result = connection.execute(
+                text(
+                    f"DELETE FROM {self.PendingLogin.__tablename__} WHERE expires_at <= :now"
+                ),
+                {"now": datetime.utcnow()},
+            )
+        return result.rowcount
+
+
+# a function that creates the backend that is chosen in the environment variables
+def create_login_session_backend(backend_name, db=None, PendingLogin=None):
+    if backend_name == "memory":
+        return LocalMemoryLoginSessionBackend()
+    elif backend_name == "database":
+        return DatabaseLoginSessionBackend(db=db, PendingLogin=PendingLogin)
+    else:
+        raise ValueError(f"Unknown login session backend: {backend_name}")
+
+
+class PendingLoginStore:
+    def __init__(self, backend, ttl_seconds=600) -> None:
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    # store a new pending login and return the session id for the client's cookie
+    def create(self, data) -> str:
+        session_id = secrets.token_urlsafe(32)
+        self.backend.set(session_id, data, self.ttl_seconds)
+        return session_id
+
+    # get the pending login, return None if it doesn't exist or it has expired
+    def get(self, session_id):
+        if not session_id:
+            return None
+        return self.backend.get(session_id)
+
+    # remove the pending login once the user has been verified
+    def delete(self, session_id) -> None:
+        if session_id:
+            self.backend.delete(session_id)
+
+    # remove the pending logins that expired, return the number of logins removed
+    def prune(self) -> int:
+        return self.backend.prune()
@@ -1,43 +1,93 @@
 # this is a middleware function that take a request and response to validate the token from the request to grant users access to protected resources that required authentication
 import json
 from functools import wraps
+from http import HTTPStatus
 
 import jwt
-from flask import Response, request
+from flask import Response, g, request
 
+from get_env import token_cache_size
+from helper_functions.permission_registry import permission_registry
+from helper_functions.token_cache import TokenClaimsCache
+from helper_functions.token_revocation import (
+    token_revocation_list,
+    user_revocation_id,
+)
 
+# the error bodies never change -> serialize them once instead of on every request
+_token_missing_json = json.dumps({"message": "Token is missing in cookies"})
+_token_invalid_json = json.dumps({"message": "Token is invalid!"})
+_unauthorized_json = json.dumps({"message": "Unauthorized accessed!"})
+_token_revoked_json = json.dumps(
+    {"message": "Token has been revoked! Please sign in again!"}
+)
+
+# claims of the tokens that have already been verified, shared by every protected endpoint in this process
+verified_token_cache = TokenClaimsCache(max_size=token_cache_size)
+
+
+# the verified claims are published on flask.g as g.token_claims so the resources don't need to decode the token again
+# NOTE: read g.token_claims before pushing a new app context (with current_app.app_context()), a new app context comes with a new g
 def token_required(permission_list, secret_key):
+    # compile the required permissions into a mask once when the endpoint is decorated
+    required_mask = permission_registry.encode(permission_list)
+
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             token = request.cookies.get("token")
             if not token:
-                response_data = {"message": "Token is missing in cookies"}
-                response_json = json.dumps(response_data)
-                response = Response(
-                    response=response_json, status=401, mimetype="application/json"
+                return Response(
+                    response=_token_missing_json,
+                    status=HTTPStatus.UNAUTHORIZED,
+                    mimetype="application/json",
                 )
-                return response
 
             try:
-                data = jwt.decode(token, secret_key, algorithms=["HS256"])
-                for permission in permission_list:
-                    if permission not in data["permissions"]:
-                        response_data = {"message": "Unauthorized accessed!"}
-                        response_json = json.dumps(response_data)
-                        response = Response(
-                            response=response_json,
-                            status=403,
-                            mimetype="application/json",
-                        )
-            except:
-                response_data = {"message": "Token is invalid!"}
-                response_json = json.dumps(response_data)
-                response = Response(
-                    response=response_json, status=400, mimetype="application/json"
+                # a token that has been verified before skips the signature verification until it expires
+                data = verified_token_cache.get(token)
+                if data is None:
+                    data = jwt.decode(token, secret_key, algorithms=["HS256"])
+                    verified_token_cache.put(token, data)
+                # old tokens carry a list of permission names, the new ones a mask
+                granted_mask = permission_registry.mask_from_claims(data)
+                # the cached tokens are checked too -> a token that has been revoked after it was cached is rejected
+                # the tokens minted before the token ids were added have no jti and can't be revoked one by one
+                token_id = data.get("jti")
+                is_revoked = token_id is not None and token_revocation_list.is_revoked(
+                    token_id
+                )
+                # every token of a deleted account is revoked at once
+                user_id = data.get("id")
+                is_revoked = is_revoked or (
+                    user_id is not None
+                    and token_revocation_list.is_revoked(user_revocation_id(user_id))
+                )
+            except Exception:
+                return Response(
+                    response=_token_invalid_json,
+                    status=HTTPStatus.BAD_REQUEST,
+                    mimetype="application/json",
                 )
-                return response
-            return f(*args, *kwargs)
+
+            if is_revoked:
+                verified_token_cache.discard(token)
+                return Response(
+                    response=_token_revoked_json,
+                    status=HTTPStatus.UNAUTHORIZED,
+                    mimetype="application/json",
+                )
+
+            # every required permission has to be granted in the token
+            if (granted_mask & required_mask) != required_mask:
+                return Response(
+                    response=_unauthorized_json,
+                    status=HTTPStatus.FORBIDDEN,
+                    mimetype="application/json",
+                )
+
+            g.token_claims = data
+            return f(*args, **kwargs)
 
         return decorated_function
 
@@ -0,0 +1,259 @@
+# this is the OTP engine of the backend: it generates, stores, expires and verifies the login OTP codes without the round trips to AWS Lambda and DynamoDB
+# the codes are stored as HMACs (never in plain text) in a store: in memory (expired with a timing wheel) or in the database (otp_code table)
+# the old AWS Lambda flow is still available as another engine with the same interface (OTP_BACKEND=lambda)
+import hmac
+import hashlib
+import math
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from http import HTTPStatus
+
+from sqlalchemy import text
+
+
+################################# TIMING WHEEL #################################
+# a hashed timing wheel -> scheduling a key and expiring the keys of one tick are O(1) per key, no sorting or full scans
+class TimingWheel:
+    def __init__(self, tick_seconds=1.0, slot_count=1024) -> None:
+        self.tick_seconds = tick_seconds
+        self.__slots = [dict() for _ in range(slot_count)]  # key -> tick
+        self.__last_tick = math.floor(time.time() / tick_seconds)
+
+    def schedule(self, key, expires_at) -> None:
+        tick = math.ceil(expires_at / self.tick_seconds)
+        self.__slots[tick % len(self.__slots)][key] = tick
+
+    # return the keys whose tick has passed, a key that is scheduled again keeps only its latest tick in a slot
+    def advance(self, now) -> list:
+        current_tick = math.floor(now / self.tick_seconds)
+        expired_keys = []
+        # after a long pause every slot has to be visited once
+        ticks = range(
+            max(self.__last_tick + 1, current_tick - len(self.__slots) + 1),
+            current_tick + 1,
+        )
+        for tick in ticks:
+            slot = self.__slots[tick % len(self.__slots)]
+            for key, key_tick in list(slot.items()):
+                if key_tick <= current_tick:
+                    del slot[key]
+                    expired_keys.append(key)
+        self.__last_tick = max(self.__last_tick, current_tick)
+        return expired_keys
+
+
+################################# STORES #################################
+# every store keeps one active code per destination (email address or phone number)
+# verify returns "valid", "invalid", "expired" or "not_found", a valid code is consumed so it can only be used once
+
+
+class MemoryOTPStore:
+    def __init__(self) -> None:
+        self.__codes = (
+            {}
+        )  # destination -> [code hash, expiration time, failed attempts]
+        self.__wheel = TimingWheel()
+        self.__lock = threading.Lock()
+
+    # a private method that removes the codes whose expiration time has passed, return the number of codes removed
+    def __expire(self, now) -> int:
+        expired_count = 0
+        for destination in self.__wheel.advance(now):
+            code = self.__codes.get(destination)
+            # the destination may have received a new code since this one was scheduled
+            if code is not None and code[1] <= now:
+                del self.__codes[destination]
+                expired_count += 1
+        return expired_count
+
+    def save(self, destination, code_hash, ttl_seconds) -> None:
+        now = time.time()
+        with self.__lock:
+            self.__expire(now)
+            self.__codes[destination] = [code_hash, now + ttl_seconds, 0]
+            self.__wheel.schedule(destination, now + ttl_seconds)
+
+    def verify(self, destination, code_hash, max_attempts) -> str:
+        now = time.time()
+        with self.__lock:
+            self.__expire(now)
+            code = self.__codes.get(destination)
+            if code is None:
+                return "not_found"
+            if code[1] <= now:
+                del self.__codes[destination]
+                return "expired"
+            if hmac.compare_digest(code[0], code_hash):
+                del self.__codes[destination]
+                return "valid"
+
+            # too many wrong codes -> the code can't be used anymore
+            code[2] += 1
+            if code[2] >= max_attempts:
+                del self.__codes[destination]
+            return "invalid"
+
+    # remove the codes that expired while no code was saved or verified
+    def prune(self) -> int:
+        with self.__lock:
+            return self.__expire(time.time())
+
+
+class DatabaseOTPStore:
+    def __init__(self, db, OTPCode) -> None:
+        self.db = db
+        self.table_name = OTPCode.__tablename__
+
+    # one upsert per code, the codes that expired are removed by prune()
+    def save(self, destination, code_hash, ttl_seconds) -> None:
+        with self.db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    f"""
+                    INSERT INTO {self.table_name} (destination, code_hash, expires_at, attempts)
+                    VALUES (:destination, :code_hash, :expires_at, 0)
+                    ON CONFLICT (destination) DO UPDATE
+                    SET code_hash = EXCLUDED.code_hash, expires_at = EXCLUDED.expires_at, attempts = 0
+                    """
+                ),
+                {
+                    "destination": destination,
+                    "code_hash": code_hash,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds),
+                },
+            )
+
+    def verify(self, destination, code_hash, max_attempts) -> str:
+        now = datetime.utcnow()
+        with self.db.engine.begin() as connection:
+            # consume the code if it matches and hasn't expired -> a single statement in the common case
+            consumed = connection.execute(
+                text(
+                    f"""
+                    DELETE FROM {self.table_name}
+                    WHERE destination = :destination AND code_hash = :code_hash AND expires_at > :now
+                    RETURNING destination
+                    """
+                ),
+                {"destination": destination, "code_hash": code_hash, "now": now},
+            ).first()
+            if consumed is not None:
+                return "valid"
+
+            # count the wrong attempt and find out why the code was rejected
+            code = connection.execute(
+                text(
+                    f"""
+                    UPDATE {self.table_name} SET attempts = attempts + 1
+                    WHERE destination = :destination
+                    RETURNING attempts, expires_at
+                    """
+                ),
+                {"destination": destination},
+            ).first()
+            if code is None:
+                return "not_found"
+            if code.expires_at <= now or code.attempts >= max_attempts:
+                connection.execute(
+                    text(
+                        f"DELETE FROM {self.table_name} WHERE destination = :destination"
+                    ),
+                    {"destination": destination},
+                )
+            return "expired" if code.expires_at <= now else "invalid"
+
+    # remove the codes that expired (a scheduled job)
+    def prune(self) -> int:
+        with self.db.engine.begin() as connection:
+            result = connection.execute(
+                text(f"DELETE FROM {self.table_name} WHERE expires_at <= :now"),
+                {"now": datetime.utcnow()},
+            )
+        return result.rowcount
+
+
+# a function that creates the store that is chosen in the environment variables
+def create_otp_store(backend_name, db=None, OTPCode=None):
+    if backend_name == "memory":
+        return MemoryOTPStore()
+    elif backend_name == "database":
+        return DatabaseOTPStore(db=db, OTPCode=OTPCode)
+    else:
+        raise ValueError(f"Unknown OTP store: {backend_name}")
+
+
+################################# ENGINES #################################
+# the messages and status codes are the same as the ones of the AWS Lambda functions
+_verification_results = {
+    "valid": (HTTPStatus.OK, "The OTP code has been verified!"),
+    "invalid": (HTTPStatus.BAD_REQUEST, "Invalid OTP"),
+    "expired": (HTTPStatus.NOT_FOUND, "This OTP code is expired"),
+    "not_found": (HTTPStatus.NOT_FOUND, "No such OTP was sent!"),
+}
+
+
+class OTPEngine:
+    def __init__(
+        self,
+        store,
+        deliver,
+        secret_key,
+        ttl_seconds=600,
+        code_length=6,
+        max_attempts=5,
+    ) -> None:
+        self.store = store
+        self.deliver = deliver  # a function (destination, otp_code, user_id) -> bool
+        self.secret_key = (secret_key or "").encode("utf-8")
+        self.ttl_seconds = ttl_seconds
+        self.code_length = code_length
+        self.max_attempts = max_attempts
+
+    # a private method that hashes the code with the secret key of the server
+    def __hash_code(self, destination, otp_code) -> str:
+        message = f"{destination}:{otp_code}".encode("utf-8")
+        return hmac.new(self.secret_key, message, hashlib.sha256).hexdigest()
+
+    # generate a new code for the destination, store it and send it, return True if it has been sent
+    def issue(self, destination, token=None, user_id=None) -> bool:
+        otp_code = str(secrets.randbelow(10**self.code_length)).zfill(
+            self.code_length
+        )
+        self.store.save(
+            destination, self.__hash_code(destination, otp_code), self.ttl_seconds
+        )
+        return self.deliver(destination, otp_code, user_id=user_id)
+
+    # verify the code that the user entered, return the status code and the message for the response
+    def verify(self, destination, otp_code, token=None):
+        otp_code = str(otp_code).zfill(self.code_length)
+        result = self.store.verify(
+            destination, self.__hash_code(destination, otp_code), self.max_attempts
+        )
+        return _verification_results[result]
+
+
+# the old flow: AWS Lambda generates the code into DynamoDB and sends it with SES, another Lambda verifies it
+class AWSLambdaOTPEngine:
+    def __init__(self, http_client, sending_otp_url, verify_otp_url) -> None:
+        self.http_client = http_client
+        self.sending_otp_url = sending_otp_url
+        self.verify_otp_url = verify_otp_url
+
+    def issue(self, destination, token=None, user_id=None) -> bool:
+        headers = {"Authorization": f"Bearer {token}"}
+        response = self.http_client.get(url=self.sending_otp_url, headers=headers)
+        return response.status_code == HTTPStatus.OK
+
+    def verify(self, destination, otp_code, token=None):
+        headers = {"Authorization": f"Bearer {token}"}
+        response = self.http_client.get(
+            self.verify_otp_url + f"{otp_code}", headers=headers
+        )
+        try:
+            message = response.json()
+        except ValueError:
+            message = response.text
+        return response.status_code, message
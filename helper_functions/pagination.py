@@ -0,0 +1,36 @@
+# these are helper functions for keyset (cursor) pagination: a page starts right after the (created_at, id) of the last row of the previous page
+# the cursor is opaque for the client (url safe base64 of json), so the database never has to skip rows like with OFFSET
+import base64
+import json
+from datetime import datetime
+
+from werkzeug.exceptions import BadRequest
+
+
+# encode the position of the last row of a page into the cursor of the next page
+def encode_cursor(created_at, row_id) -> str:
+    position = json.dumps([created_at.isoformat(), str(row_id)])
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+
+# decode a cursor into (created_at, id), raise BadRequest if the client changed it
+def decode_cursor(cursor):
+    try:
+        position = base64.urlsafe_b64decode(cursor.encode("ascii"))
+        created_at, row_id = json.loads(position)
+        return datetime.fromisoformat(created_at), row_id
+    except (ValueError, TypeError) as error:
+        raise BadRequest(f"Invalid cursor: {error}")
+
+
+# the page size that the client asked for, bounded by the maximum page size
+def parse_page_size(value, default_page_size, max_page_size) -> int:
+    if value is None:
+        return default_page_size
+    try:
+        page_size = int(value)
+    except ValueError:
+        raise BadRequest("The page size must be a number!")
+    if page_size < 1:
+        raise BadRequest("The page size must be at least 1!")
+    return min(page_size, max_page_size)
@@ -0,0 +1,292 @@
+# this is a service that runs bcrypt in a small pool of worker processes so the request threads don't burn 100-300 ms of CPU for every login or registration
+# the number of jobs waiting for a worker is limited, when the pool is saturated the request is rejected right away instead of piling up
+import multiprocessing
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    TimeoutError,
+    wait,
+)
+
+import bcrypt
+from werkzeug.exceptions import ServiceUnavailable
+
+from get_env import (
+    bcrypt_rounds,
+    password_hash_max_queue,
+    password_hash_timeout,
+    password_hash_workers,
+    password_hasher_name,
+)
+
+
+# raised when every worker is busy and the waiting queue is full
+class PasswordHashingBusy(ServiceUnavailable):
+    description = (
+        "The server is busy verifying passwords! Please try again in a moment!"
+    )
+
+
+# the functions below run inside the worker processes, they return when the job started so the waiting time in the queue can be measured
+def _hash_password_job(password, rounds):
+    started_at = time.time()
+    hashed_password = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return hashed_password, started_at, time.time() - started_at
+
+
+def _hash_password_batch_job(passwords, rounds):
+    return [bcrypt.hashpw(password, bcrypt.gensalt(rounds)) for password in passwords]
+
+
+def _check_password_job(password, hashed_password):
+    started_at = time.time()
+    is_valid = bcrypt.checkpw(password, hashed_password)
+    return is_valid, started_at, time.time() - started_at
+
+
+def _start_worker_job():
+    return None
+
+
+# every hashing service of this process, they are started together by start_password_hashing_services()
+_hashing_services = []
+
+
+class PasswordHashingService:
+    def __init__(self, max_workers=2, max_queue_depth=32, timeout=10) -> None:
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.timeout = timeout
+
+        self.__executor = None
+        self.__lock = threading.Lock()
+        self.__in_flight = 0
+        self.__metrics = {
+            "submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "queue_wait_total_seconds": 0.0,
+            "queue_wait_max_seconds": 0.0,
+            "hash_time_total_seconds": 0.0,
+            "hash_time_max_seconds": 0.0,
+        }
+        _hashing_services.append(self)
+
+    # a private method that creates the worker processes
+    # the workers are forked: a spawned worker would import the main module again (app.py) and connect to the database
+    # forking a process that runs other threads can deadlock the child -> the server forks them in start() before it starts any thread
+    def __get_executor(self) -> ProcessPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("fork"),
+            )
+        return self.__executor
+
+    # fork every worker process now (the fork executor starts all of them with the first job)
+    def start(self) -> None:
+        with self.__lock:
+            executor = self.__get_executor()
+        executor.submit(_start_worker_job).result()
+
+    # a private method that is called when a job of the request threads is done (finished, failed or cancelled)
+    def __release(self, future) -> None:
+        with self.__lock:
+            self.__in_flight -= 1
+
+    # a private method that runs one job in the pool and records how long it waited and how long it ran
+    def __run(self, job, *args):
+        with self.__lock:
+            # fast rejection -> every worker is busy and the queue is full
+            if self.__in_flight >= self.max_workers + self.max_queue_depth:
+                self.__metrics["rejected"] += 1
+                raise PasswordHashingBusy
+            self.__in_flight += 1
+            self.__metrics["submitted"] += 1
+            executor = self.__get_executor()
+
+        submitted_at = time.time()
+        try:
+            future = executor.submit(job, *args)
+        except Exception:
+            with self.__lock:
+                self.__in_flight -= 1
+                self.__metrics["failed"] += 1
+            raise
+        # a job stays in flight until a worker is done with it, even after the request stopped waiting for it
+        future.add_done_callback(self.__release)
+        try:
+            result, started_at, hash_time = future.result(timeout=self.timeout)
+        except TimeoutError as timeout_error:
+            # the pool is saturated -> the request gets the same 503 as the fast rejection, the job is dropped if it is still waiting for a worker
+            future.cancel()
+            with self.__lock:
+                self.__metrics["failed"] += 1
+            raise PasswordHashingBusy from timeout_error
+        except Exception:
+            # a job that is still waiting for a worker is dropped
+            future.cancel()
+            with self.__lock:
+                self.__metrics["failed"] += 1
+            raise
+
+        queue_wait = max(started_at - submitted_at, 0.0)
+        with self.__lock:
+            self.__metrics["completed"] += 1
+            self.__metrics["queue_wait_total_seconds"] += queue_wait
+            self.__metrics["queue_wait_max_seconds"] = max(
+                self.__metrics["queue_wait_max_seconds"], queue_wait
+            )
+            self.__metrics["hash_time_total_seconds"] += hash_time
+            self.__metrics["hash_time_max_seconds"] = max(
+                self.__metrics["hash_time_max_seconds"], hash_time
+            )
+        return result
+
+    # hash a new password with a new salt and return the hash as a string for the database
+    def hash_password(self, password, rounds=12) -> str:
+        hashed_password = self.__run(
+            _hash_password_job, password.encode("utf-8"), rounds
+        )
+        return hashed_password.decode("utf-8")
+
+    # hash a batch of new passwords (bulk import) on the pool of the request threads, in small chunks
+    # at most half of the workers hash chunks of the batch at the same time -> the logins and registrations keep the other half
+    # the batch is one caller's job: it doesn't go through the fast rejection of the request threads
+    def hash_passwords(self, passwords, rounds=12, chunk_size=8) -> list:
+        chunks = [
+            [
+                password.encode("utf-8")
+                for password in passwords[start : start + chunk_size]
+            ]
+            for start in range(0, len(passwords), chunk_size)
+        ]
+        max_chunks_in_flight = max(self.max_workers // 2, 1)
+        with self.__lock:
+            executor = self.__get_executor()
+
+        futures = []
+        for chunk in chunks:
+            running = [future for future in futures if not future.done()]
+            if len(running) >= max_chunks_in_flight:
+                wait(running, return_when=FIRST_COMPLETED)
+            futures.append(executor.submit(_hash_password_batch_job, chunk, rounds))
+
+        hashed_passwords = []
+        for future in futures:
+            hashed_passwords.extend(
+                hashed_password.decode("utf-8") for hashed_password in future.result()
+            )
+        with self.__lock:
+            self.__metrics["completed"] += len(passwords)
+        return hashed_passwords
+
+    # check if the password matches the hash that is stored in the database
+    def check_password(self, password, hashed_password) -> bool:
+        return self.__run(
+            _check_password_job,
+            password.encode("utf-8"),
+            hashed_password.encode("utf-8"),
+        )
+
+    # queue wait and hash time metrics of the pool
+    def stats(self) -> dict:
+        with self.__lock:
+            metrics = dict(self.__metrics)
+            metrics["in_flight"] = self.__in_flight
+        completed = metrics["completed"]
+        metrics["queue_wait_average_seconds"] = (
+            metrics["queue_wait_total_seconds"] / completed if completed else 0.0
+        )
+        metrics["hash_time_average_seconds"] = (
+            metrics["hash_time_total_seconds"] / completed if completed else 0.0
+        )
+        return metrics
+
+    def shutdown(self) -> None:
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=True)
+                self.__executor = None
+
+
+# the shared pool of this process
+password_hashing_service = PasswordHashingService(
+    max_workers=password_hash_workers,
+    max_queue_depth=password_hash_max_queue,
+    timeout=password_hash_timeout,
+)
+
+
+# fork the workers of every hashing service
+# call it when the server starts, before the background threads are started
+def start_password_hashing_services() -> None:
+    for hashing_service in _hashing_services:
+        hashing_service.start()
+
+
+# a password hasher hashes and verifies the passwords that are stored in the users table
+# needs_rehash tells if a stored hash was made with other settings than the configured ones, so it can be replaced when the user logs in
+class PasswordHasher(ABC):
+    @abstractmethod
+    def hash(self, password) -> str:
+        pass
+
+    # hash many passwords at once (bulk import)
+    def hash_many(self, passwords) -> list:
+        return [self.hash(password) for password in passwords]
+
+    @abstractmethod
+    def verify(self, password, hashed_password) -> bool:
+        pass
+
+    @abstractmethod
+    def needs_rehash(self, hashed_password) -> bool:
+        pass
+
+
+class BcryptPasswordHasher(PasswordHasher):
+    def __init__(self, rounds=12, hashing_service=password_hashing_service) -> None:
+        self.rounds = rounds
+        self.hashing_service = hashing_service
+
+    def hash(self, password) -> str:
+        return self.hashing_service.hash_password(password, rounds=self.rounds)
+
+    def hash_many(self, passwords) -> list:
+        return self.hashing_service.hash_passwords(passwords, rounds=self.rounds)
+
+    def verify(self, password, hashed_password) -> bool:
+        return self.hashing_service.check_password(password, hashed_password)
+
+    # the cost is stored in the hash itself -> $2b$<cost>$<salt and hash>
+    def needs_rehash(self, hashed_password) -> bool:
+        try:
+            return int(hashed_password.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+# the hashers that can be chosen with the PASSWORD_HASHER environment variable
+password_hashers = {
+    "bcrypt": lambda hashing_service: BcryptPasswordHasher(
+        rounds=bcrypt_rounds, hashing_service=hashing_service
+    ),
+}
+
+
+# the hashing service can be another pool than the one of the request threads
+def create_password_hasher(
+    name, hashing_service=password_hashing_service
+) -> PasswordHasher:
+    if name not in password_hashers:
+        raise ValueError(f"Unknown password hasher: {name}")
+    return password_hashers[name](hashing_service)
+
+
+# the hasher that is used by the registration and the login
+password_hasher = create_password_hasher(password_hasher_name)
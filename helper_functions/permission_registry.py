@@ -0,0 +1,102 @@
+# this is the registry that gives every permission a bit, so a token carries its permissions as one integer mask ("pm" claim) instead of a list of long names
+# the registry is versioned ("pv" claim): a new version can only add permissions at the end, so the bits of the existing permissions never move
+# the tokens that were minted before the registry carry the old "permissions" list, they are still accepted and converted to a mask
+
+
+# version -> permission names, the permission at index i is bit i of the mask
+permission_registry_versions = {
+    1: (
+        "can_verify_otp",
+        "can_view_dashboard",
+        "can_use_geolocation_api",
+        "can_view_profile",
+        "can_change_profile",
+        "can_view_study_preferences",
+        "can_change_study_preferences",
+        "can_view_availability_schedule",
+        "can_change_availability_schedule",
+    ),
+    # the bulk user import of the partner universities
+    2: (
+        "can_verify_otp",
+        "can_view_dashboard",
+        "can_use_geolocation_api",
+        "can_view_profile",
+        "can_change_profile",
+        "can_view_study_preferences",
+        "can_change_study_preferences",
+        "can_view_availability_schedule",
+        "can_change_availability_schedule",
+        "can_import_users",
+    ),
+}
+current_permission_version = 2
+
+
+class PermissionRegistry:
+    def __init__(self, versions, current_version) -> None:
+        self.current_version = current_version
+        # version -> permission name -> bit
+        self.__bits = {
+            version: {name: 1 << index for index, name in enumerate(names)}
+            for version, names in versions.items()
+        }
+        # the masks of the older versions are translated to the current version bit by bit
+        self.__translations = {
+            version: [
+                (bit, self.__bits[current_version][name])
+                for name, bit in bits.items()
+                if name in self.__bits[current_version]
+            ]
+            for version, bits in self.__bits.items()
+            if version != current_version
+        }
+
+    # the mask of a list of permissions, an unknown permission is an error (it can't be granted or required)
+    def encode(self, permission_names) -> int:
+        bits = self.__bits[self.current_version]
+        mask = 0
+        for name in permission_names:
+            if name not in bits:
+                raise ValueError(f"Unknown permission: {name}")
+            mask |= bits[name]
+        return mask
+
+    # the names of the permissions in a mask of the current version
+    def decode(self, mask) -> list:
+        return [
+            name
+            for name, bit in self.__bits[self.current_version].items()
+            if mask & bit
+        ]
+
+    # the claims to put in a new token
+    def to_claims(self, permission_names) -> dict:
+        return {"pm": self.encode(permission_names), "pv": self.current_version}
+
+    # the mask (of the current version) of the permissions that are granted in the claims of a token
+    def mask_from_claims(self, claims) -> int:
+        if "pm" in claims:
+            mask, version = claims["pm"], claims.get("pv", self.current_version)
+            if version == self.current_version:
+                return mask
+
+            translated_mask = 0
+            for old_bit, bit in self.__translations[version]:
+                if mask & old_bit:
+                    translated_mask |= bit
+            return translated_mask
+
+        # an old token -> the permissions are a list of names, the names that are not registered anymore are ignored
+        bits = self.__bits[self.current_version]
+        mask = 0
+        for name in claims["permissions"]:
+            mask |= bits.get(name, 0)
+        return mask
+
+
+# the registry that is used to mint and check the tokens
+permission_registry = PermissionRegistry(
+    versions=permission_registry_versions,
+    current_version=current_permission_version,
+)
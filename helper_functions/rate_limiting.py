@@ -0,0 +1,312 @@
+# this is a rate limiting middleware function that rejects abusive traffic (with 429 + Retry-After) before the request reaches bcrypt, SendGrid or AWS
+# each rule has a policy (token bucket or sliding window) and a key (per ip, per username or per endpoint)
+# the state of the policies is kept in a store: sharded in memory (one process) or in the database (shared by every worker)
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from http import HTTPStatus
+
+from flask import Response, request
+from sqlalchemy import text
+
+from database.users_models import RateLimitBucket, db
+from get_env import rate_limit_backend
+
+
+################################# POLICIES #################################
+# every policy takes the previous state of a key (None for a new key) and returns (new state, allowed, retry after in seconds)
+# refund gives back a request that was allowed at now, when another rule rejected the same request
+# the states are small lists so they can be stored in memory or as json in the database
+
+
+# token bucket -> allow bursts up to the capacity, then refill_rate requests per second
+class TokenBucketPolicy:
+    def __init__(self, capacity, refill_rate) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        # a bucket that has been idle this long is full again -> its state can be forgotten
+        self.idle_ttl = capacity / refill_rate
+
+    def consume(self, state, now):
+        if state is None:
+            tokens, updated_at = self.capacity, now
+        else:
+            tokens, updated_at = state
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+
+        if tokens >= 1:
+            return [tokens - 1, now], True, 0
+
+        retry_after = (1 - tokens) / self.refill_rate
+        return [tokens, now], False, retry_after
+
+    def refund(self, state, now):
+        tokens, updated_at = state
+        return [min(self.capacity, tokens + 1), updated_at]
+
+
+# sliding window counter -> at most limit requests in any window of window_seconds
+# the previous fixed window is weighted by how much of it still overlaps the sliding window, so only 2 counters are kept per key
+class SlidingWindowPolicy:
+    def __init__(self, limit, window_seconds) -> None:
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.idle_ttl = window_seconds * 2
+
+    def consume(self, state, now):
+        window_start = now - (now % self.window_seconds)
+        if state is None:
+            previous_count, current_count = 0, 0
+        else:
+            state_window_start, previous_count, current_count = state
+            if window_start - state_window_start >= 2 * self.window_seconds:
+                previous_count, current_count = 0, 0
+            elif window_start - state_window_start >= self.window_seconds:
+                previous_count, current_count = current_count, 0
+
+        elapsed = now - window_start
+        overlap = 1 - elapsed / self.window_seconds
+        estimated_count = previous_count * overlap + current_count
+
+        if estimated_count + 1 <= self.limit:
+            return [window_start, previous_count, current_count + 1], True, 0
+
+        # find when the weighted count leaves room for one more request
+        if current_count + 1 <= self.limit and previous_count > 0:
+            room = (self.limit - current_count - 1) / previous_count
+            retry_after = self.window_seconds * (1 - room) - elapsed
+        else:
+            retry_after = self.window_seconds - elapsed
+            if current_count > 0:
+                retry_after += max(
+                    self.window_seconds * (1 - (self.limit - 1) / current_count), 0
+                )
+        return [window_start, previous_count, current_count], False, retry_after
+
+    def refund(self, state, now):
+        window_start = now - (now % self.window_seconds)
+        state_window_start, previous_count, current_count = state
+        # the request was counted in the current window of the state, or in its previous one if another request started a new window since
+        if state_window_start == window_start:
+            current_count = max(current_count - 1, 0)
+        elif state_window_start - self.window_seconds == window_start:
+            previous_count = max(previous_count - 1, 0)
+        return [state_window_start, previous_count, current_count]
+
+
+################################# STORES #################################
+# keeps the states in memory, split into shards with their own lock so the requests don't wait for each other
+class ShardedMemoryRateLimitStore:
+    def __init__(self, shard_count=16) -> None:
+        self.__shards = [(threading.Lock(), OrderedDict()) for _ in range(shard_count)]
+
+    def hit(self, key, policy, now):
+        lock, states = self.__shards[hash(key) % len(self.__shards)]
+        with lock:
+            entry = states.get(key)
+            state = None
+            if entry is not None and entry[0] > now:
+                state = entry[1]
+
+            new_state, allowed, retry_after = policy.consume(state, now)
+            states[key] = (now + policy.idle_ttl, new_state)
+            states.move_to_end(key)
+
+            self.__forget_idle_keys(states, now)
+
+        return allowed, retry_after
+
+    # a private method that forgets the keys of a shard that have been idle long enough, return the number of keys forgotten
+    # the least recently hit keys are at the front
+    def __forget_idle_keys(self, states, now) -> int:
+        forgotten_count = 0
+        while states:
+            oldest_key, (expires_at, _) = next(iter(states.items()))
+            if expires_at > now:
+                break
+            del states[oldest_key]
+            forgotten_count += 1
+        return forgotten_count
+
+    def refund(self, key, policy, now) -> None:
+        lock, states = self.__shards[hash(key) % len(self.__shards)]
+        with lock:
+            entry = states.get(key)
+            if entry is not None:
+                states[key] = (entry[0], policy.refund(entry[1], now))
+
+    # forget the idle keys of every shard (the shards that are not hit anymore keep them otherwise)
+    def prune(self, now=None) -> int:
+        now = now if now is not None else time.time()
+        forgotten_count = 0
+        for lock, states in self.__shards:
+            with lock:
+                forgotten_count += self.__forget_idle_keys(states, now)
+        return forgotten_count
+
+
+# keeps the states in the rate_limit_bucket table so every worker process shares the same limits
+# each hit is one short transaction on its own connection (the request's session is not touched): lock the row, update it, commit
+class DatabaseRateLimitStore:
+    def __init__(self, db, RateLimitBucket) -> None:
+        self.db = db
+        self.table_name = RateLimitBucket.__tablename__
+
+    def hit(self, key, policy, now):
+        with self.db.engine.begin() as connection:
+            row = connection.execute(
+                text(
+                    f"SELECT state, expires_at FROM {self.table_name} WHERE key = :key FOR UPDATE"
+                ),
+                {"key": key},
+            ).first()
+            state = None
+            if row is not None and row.expires_at > now:
+                state = json.loads(row.state)
+
+            new_state, allowed, retry_after = policy.consume(state, now)
+            connection.execute(
+                text(
+                    f"""
+                    INSERT INTO {self.table_name} (key, state, expires_at)
+                    VALUES (:key, :state, :expires_at)
+                    ON CONFLICT (key) DO UPDATE
+                    SET state = EXCLUDED.state, expires_at = EXCLUDED.expires_at
+                    """
+                ),
+                {
+                    "key": key,
+                    "state": json.dumps(new_state),
+                    "expires_at": now + policy.idle_ttl,
+                },
+            )
+        return allowed, retry_after
+
+    def refund(self, key, policy, now) -> None:
+        with self.db.engine.begin() as connection:
+            row = connection.execute(
+                text(
+                    f"SELECT state FROM {self.table_name} WHERE key = :key FOR UPDATE"
+                ),
+                {"key": key},
+            ).first()
+            if row is None:
+                return
+            connection.execute(
+                text(f"UPDATE {self.table_name} SET state = :state WHERE key = :key"),
+                {
+                    "key": key,
+                    "state": json.dumps(policy.refund(json.loads(row.state), now)),
+                },
+            )
+
+    # remove the rows that have been idle long enough, call it from a scheduled job
+    def prune(self, now=None) -> int:
+        with self.db.engine.begin() as connection:
+            result = connection.execute(
+                text(f"DELETE FROM {self.table_name} WHERE expires_at <= :now"),
+                {"now": now if now is not None else time.time()},
+            )
+        return result.rowcount
+
+
+# a function that creates the store that is chosen in the environment variables
+def create_rate_limit_store(backend_name, db=None, RateLimitBucket=None):
+    if backend_name == "memory":
+        return ShardedMemoryRateLimitStore()
+    elif backend_name == "database":
+        return DatabaseRateLimitStore(db=db, RateLimitBucket=RateLimitBucket)
+    else:
+        raise ValueError(f"Unknown rate limit backend: {backend_name}")
+
+
+################################# KEYS #################################
+# every key function returns the part of the key that identifies the client, or None to skip the rule for this request
+def key_by_ip():
+    return request.remote_addr
+
+
+def key_by_endpoint():
+    route = request.url_rule.rule if request.url_rule else request.path
+    return f"{request.method}:{route}"
+
+
+def key_by_form_field(field_name):
+    def key_function():
+        json_data = request.get_json(silent=True) or {}
+        value = json_data.get(field_name) or request.values.get(field_name)
+        return value.strip().lower() if isinstance(value, str) and value else None
+
+    return key_function
+
+
+class RateLimitRule:
+    def __init__(self, name, policy, key_function) -> None:
+        self.name = name
+        self.policy = policy
+        self.key_function = key_function
+
+
+################################# MIDDLEWARE #################################
+class RateLimiter:
+    def __init__(self, store) -> None:
+        self.store = store
+
+    # check the rules in order, return None if the request is allowed or the retry after (in seconds) of the first rule that rejects it
+    # a rejected request is given back to the rules that already counted it -> a client that is blocked by one rule (its ip)
+    # doesn't use the quota of the other rules (the username of someone else)
+    def check(self, rules):
+        now = time.time()
+        charged_keys = []
+        for rule in rules:
+            client_key = rule.key_function()
+            if client_key is None:
+                continue
+            key = f"{rule.name}:{client_key}"
+            allowed, retry_after = self.store.hit(key, rule.policy, now)
+            if not allowed:
+                for charged_key, policy in charged_keys:
+                    self.store.refund(charged_key, policy, now)
+                return retry_after
+            charged_keys.append((key, rule.policy))
+        return None
+
+    # remove the idle states of the store, call it from a scheduled job
+    def prune(self) -> int:
+        return self.store.prune()
+
+    def limit(self, *rules):
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                retry_after = self.check(rules)
+                if retry_after is not None:
+                    retry_after_seconds = max(math.ceil(retry_after), 1)
+                    response_data = {
+                        "message": f"Too many requests! Please try again in {retry_after_seconds} seconds!"
+                    }
+                    response_json = json.dumps(response_data)
+                    response = Response(
+                        response=response_json,
+                        status=HTTPStatus.TOO_MANY_REQUESTS,
+                        mimetype="application/json",
+                    )
+                    response.headers["Retry-After"] = str(retry_after_seconds)
+                    return response
+
+                return f(*args, **kwargs)
+
+            return decorated_function
+
+        return decorator
+
+
+# the rate limiter of this process, the rules are declared next to the endpoints they protect
+rate_limiter = RateLimiter(
+    store=create_rate_limit_store(
+        rate_limit_backend, db=db, RateLimitBucket=RateLimitBucket
+    )
+)
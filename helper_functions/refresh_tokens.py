@@ -0,0 +1,187 @@
+# this is a store of the refresh tokens that let the clients get a new access token without signing in again (password + OTP)
+# a refresh token can only be used once: using it returns a new access token and a new refresh token of the same family
+# only the sha256 of a refresh token is stored, if a used token comes back (it was stolen or replayed) its whole family is revoked
+# a family ends family_lifetime after the login whatever the rotations, and the user must still exist and be active to rotate a token
+import hashlib
+import json
+import secrets
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from werkzeug.exceptions import Unauthorized
+
+from database.users_models import Permission, RefreshToken, Users, db
+from get_env import refresh_token_family_lifetime, refresh_token_ttl
+from helper_functions.permission_registry import permission_registry
+
+
+# raised when the refresh token is unknown, expired, already used or revoked
+class InvalidRefreshToken(Unauthorized):
+    description = "The refresh token is invalid or expired! Please sign in again!"
+
+
+class RefreshTokenStore:
+    def __init__(
+        self,
+        db,
+        RefreshToken,
+        Users,
+        Permission,
+        ttl_seconds=1209600,
+        family_lifetime_seconds=2592000,
+    ) -> None:
+        self.db = db
+        self.table_name = RefreshToken.__tablename__
+        self.users_table = Users.__tablename__
+        self.permissions_table = Permission.__tablename__
+        self.ttl_seconds = ttl_seconds
+        self.family_lifetime_seconds = family_lifetime_seconds
+
+    # a private method that hashes the refresh token, the token is random enough so a fast hash is fine
+    def __hash_token(self, refresh_token) -> str:
+        return hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+
+    # a private method that inserts a new refresh token of a family and returns the token
+    # the token expires after the ttl, or when its family ends if that comes first
+    def __insert(
+        self, connection, user_id, claims, family_id, family_expires_at
+    ) -> str:
+        refresh_token = secrets.token_urlsafe(32)
+        connection.execute(
+            text(
+                f"""
+                INSERT INTO {self.table_name} (token_hash, family_id, user_id, claims, expires_at, family_expires_at, used)
+                VALUES (:token_hash, :family_id, :user_id, :claims, :expires_at, :family_expires_at, false)
+                """
+            ),
+            {
+                "token_hash": self.__hash_token(refresh_token),
+                "family_id": str(family_id),
+                "user_id": str(user_id),
+                "claims": json.dumps(claims),
+                "expires_at": min(
+                    datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+                    family_expires_at,
+                ),
+                "family_expires_at": family_expires_at,
+            },
+        )
+        return refresh_token
+
+    # create the first refresh token of a login, claims are the claims of the access tokens that it can mint (without exp)
+    def issue(self, user_id, claims) -> str:
+        family_expires_at = datetime.utcnow() + timedelta(
+            seconds=self.family_lifetime_seconds
+        )
+        with self.db.engine.begin() as connection:
+            return self.__insert(
+                connection, user_id, claims, uuid.uuid4(), family_expires_at
+            )
+
+    # use a refresh token -> return (the claims for the new access token, the next refresh token)
+    def rotate(self, refresh_token):
+        if not refresh_token:
+            raise InvalidRefreshToken
+
+        token_hash = self.__hash_token(refresh_token)
+        with self.db.engine.begin() as connection:
+            # mark the token as used with one lookup of the primary key, only if its user is still active and not deleted
+            row = connection.execute(
+                text(
+                    f"""
+                    UPDATE {self.table_name} AS token SET used = true
+                    FROM {self.users_table} AS users
+                    WHERE token.token_hash = :token_hash AND token.used = false AND token.expires_at > :now
+                    AND users.user_id = token.user_id AND users.is_active AND users.deleted_at IS NULL
+                    RETURNING token.family_id, token.user_id, token.claims, token.family_expires_at
+                    """
+                ),
+                {"token_hash": token_hash, "now": datetime.utcnow()},
+            ).first()
+
+            if row is not None:
+                # the permissions are read again -> the new access token has the permissions that the user has now
+                permissions = [
+                    permission.name
+                    for permission in connection.execute(
+                        text(
+                            f"SELECT name FROM {self.permissions_table} WHERE user_id = :user_id"
+                        ),
+                        {"user_id": str(row.user_id)},
+                    )
+                ]
+                claims = {
+                    **json.loads(row.claims),
+                    **permission_registry.to_claims(permissions),
+                }
+                next_refresh_token = self.__insert(
+                    connection,
+                    row.user_id,
+                    claims,
+                    row.family_id,
+                    row.family_expires_at,
+                )
+                return claims, next_refresh_token
+
+            # the token was already used -> somebody else has a copy of it, revoke every token of its family
+            connection.execute(
+                text(
+                    f"""
+                    DELETE FROM {self.table_name}
+                    WHERE family_id IN (
+                        SELECT family_id FROM {self.table_name}
+                        WHERE token_hash = :token_hash AND used = true
+                    )
+                    """
+                ),
+                {"token_hash": token_hash},
+            )
+        raise InvalidRefreshToken
+
+    # revoke every refresh token of the family of this token (logout)
+    def revoke(self, refresh_token) -> None:
+        if not refresh_token:
+            return
+        with self.db.engine.begin() as connection:
+            connection.execute(
+                text(
+                    f"""
+                    DELETE FROM {self.table_name}
+                    WHERE family_id IN (
+                        SELECT family_id FROM {self.table_name} WHERE token_hash = :token_hash
+                    )
+                    """
+                ),
+                {"token_hash": self.__hash_token(refresh_token)},
+            )
+
+    # remove the refresh tokens that expired (a scheduled job)
+    def prune(self) -> int:
+        with self.db.engine.begin() as connection:
+            result = connection.execute(
+                text(f"DELETE FROM {self.table_name} WHERE expires_at <= :now"),
+                {"now": datetime.utcnow()},
+            )
+        return result.rowcount
+
+
+# the refresh tokens of the logins (password + OTP, Google) and of the access tokens minted after the profile is created
+refresh_tokens = RefreshTokenStore(
+    db=db,
+    RefreshToken=RefreshToken,
+    Users=Users,
+    Permission=Permission,
+    ttl_seconds=refresh_token_ttl,
+    family_lifetime_seconds=refresh_token_family_lifetime,
+)
+
+
+# set the refresh token in a cookie that the javascript of the page can't read
+def set_refresh_token_cookie(response, refresh_token) -> None:
+    response.set_cookie(
+        "refresh_token",
+        value=refresh_token,
+        max_age=refresh_token_ttl,
+        httponly=True,
+    )
@@ -1,141 +1,161 @@
 # This is a helper function to validate the registration form
-# new_user = [username, password, password_confirmation, email, phone_number]
+# the rules of the registration and of the password change are compiled once into schemas of the validation engine
+from helper_functions.validation_engine import (
+    Field,
+    ValidationSchema,
+    differs_from_field,
+    equals_field,
+    matches,
+    max_length,
+    min_length,
+    one_of,
+    required,
+    satisfies,
+)
+
+verification_methods = ("Email", "Phone number", "Device Push Notification")
+
+# the rules of an email address, in the order of the error messages of the form
+email_rules = (
+    satisfies(
+        lambda value, record: value.count("@") == 1,
+        f"Email address must contain a single '@' symbol!",
+    ),
+    matches(
+        r"^[^@]+@", f"Email address must contain a username before the '@' symbol!"
+    ),
+    matches(r"@.*\.", f"Email must contain a domain name with a '.' symbol!"),
+    matches(
+        r"@[^.]+\.",
+        f"Email address must contain a domain name before the '.' symbol.",
+    ),
+)
+
+# the rules of a new password, the username is in the same record
+password_rules = (
+    required(f"Please enter your password!"),
+    min_length(8, f"The length of the password must be longer than 8 characters!"),
+    matches(r"[0-9]", f"Password must contain at least 1 number!"),
+    matches(r"[^\W\d_]", f"Password must contain at least 1 character!"),
+    satisfies(
+        lambda value, record: value.lower() != value,
+        f"Password must contain at least 1 uppercase letter!",
+    ),
+    satisfies(
+        lambda value, record: value.upper() != value,
+        f"Password must contain at least 1 lowercase letter!",
+    ),
+    matches(
+        r"[!@#$%^&*():,.?/<>\[\]]",
+        f"Password must contain at least 1 special character: !@#$%^&*():,.?/<>[]",
+    ),
+    differs_from_field("username", f"Password must be different from the username!"),
+)
+
+password_confirmation_rules = (
+    required(f"Please enter the confirmation of the password!"),
+    equals_field("password", f"Password confirmation must be the same as password!"),
+)
+
+# record = {username, password, password_confirmation, verification_method, verification}
+registration_schema = ValidationSchema(
+    [
+        Field(
+            "username",
+            [
+                required(f"Please enter your username!"),
+                min_length(
+                    8, f"The length of the username must be longer than 8 characters!"
+                ),
+            ],
+        ),
+        Field("password", password_rules),
+        Field(
+            "password_confirmation",
+            password_confirmation_rules,
+            error_key="password-confirmation",
+        ),
+        Field(
+            "verification_method",
+            [
+                one_of(
+                    verification_methods,
+                    f"Please choose one of the following methods to confirm your account!",
+                )
+            ],
+            error_key="verification_id",
+        ),
+        Field(
+            "verification",
+            (required(f"Please enter your email address!"),) + email_rules,
+            error_key="verification-input",
+            when=lambda record: record.get("verification_method") == "Email",
+        ),
+        Field(
+            "verification",
+            [
+                satisfies(
+                    lambda value, record: len(value) == 10,
+                    f"Phone number must be 10 digits long!",
+                ),
+                matches(r"^[0-9]+$", f"Phone number must contain only digits!"),
+            ],
+            error_key="verification-input",
+            when=lambda record: record.get("verification_method") == "Phone number",
+        ),
+        Field(
+            "verification",
+            [
+                required(f"Please enter the token of your device!"),
+                max_length(500, f"The device token is too long!"),
+            ],
+            error_key="verification-input",
+            when=lambda record: record.get("verification_method")
+            == "Device Push Notification",
+        ),
+    ]
+)
+
+# record = {username, password, password_confirmation}
+password_change_schema = ValidationSchema(
+    [
+        Field("password", password_rules),
+        Field(
+            "password_confirmation",
+            password_confirmation_rules,
+            error_key="password-confirmation",
+        ),
+    ]
+)
+
+
+# the verification that is stored for the user: the phone numbers are stored with their area code
+def registered_verification(verification_method, verification, areacode_id) -> str:
+    if verification_method == "Phone number":
+        return (areacode_id or "") + verification
+    return verification
+
+
+# new_user = [username, password, password_confirmation, verification]
+# return the validated fields (the verification as it is stored) or an empty list when the errors of the form are put in errors
 def validate_registration_form(new_user, errors, verification_id, areacode_id) -> list:
-    # create an empty list for users fields that are already validated
-    validated_new_user = []
-    for i, data in enumerate(new_user):
-        case = {
-            0: lambda: checkusername(
-                username=data, errors=errors, validate_new_user=validated_new_user
-            ),
-            1: lambda: checkpassword(
-                username=new_user[0],
-                password=data,
-                errors=errors,
-                validate_new_user=validated_new_user,
-            ),
-            2: lambda: checkpasswordconfirm(
-                confirmed_password=data,
-                password=new_user[1],
-                errors=errors,
-                validate_new_user=validated_new_user,
-            ),
-            3: lambda: check_verification(
-                verification_method=data,
-                verification_id=verification_id,
-                errors=errors,
-                validate_new_user=validated_new_user,
-                areaCodeID=areacode_id,
-            ),
-        }
-        case[i]()
-
-    return validated_new_user
-
-
-# function check the username input to see if the username is valid to the constraints from the database
-def checkusername(username, errors, validate_new_user) -> None:
-    if len(username) == 0:
-        errors["username"] = f"Please enter your username!"
-
-    elif len(username) < 8:
-        errors[
-            "username"
-        ] = f"The length of the username must be longer than 8 characters!"
-
-    else:
-        validate_new_user.append(username)
-
-
-# function check the password input to see if the password is valid to the constraints from the database
-def checkpassword(username, password, errors, validate_new_user) -> None:
-    length = len(password)
-    if any(char.isdigit() for char in password):
-        has_digit = True
-    if any(char.isalpha() for char in password):
-        has_alpha = True
-    if any(char.isupper() for char in password):
-        has_upper_char = True
-    if any(char.islower() for char in password):
-        has_lower_char = True
-    if any(char in "!@#$%^&*():,.?/<>[]" for char in password):
-        has_special_char = True
-    if password != username:
-        diff_username = True
-
-    # switch through each case to handle the errors
-    switch = {
-        length < 8: f"The length of the password must be longer than 8 characters!",
-        not has_digit: f"Password must contain at least 1 number!",
-        not has_alpha: f"Password must contain at least 1 character!",
-        not has_upper_char: f"Password must contain at least 1 uppercase letter!",
-        not has_lower_char: f"Password must contain at least 1 lowercase letter!",
-        not has_special_char: f"Password must contain at least 1 special character: !@#$%^&*():,.?/<>[]",
-        not diff_username: f"Password must be different from the username!",
-    }
-
-    error_message = switch.get(True, None)
-    if error_message is not None:
-        errors["password"] = error_message
-    else:
-        validate_new_user.append(password)
-
-
-# function check if the confirmed password is the same as password
-def checkpasswordconfirm(
-    confirmed_password, password, errors, validate_new_user
-) -> None:
-    if len(confirmed_password) == 0:
-        errors[
-            "password-confirmation"
-        ] = f"Please enter the confirmation of the password!"
-    elif confirmed_password != password:
-        errors[
-            "password-confirmation"
-        ] = f"Password confirmation must be the same as password!"
-    else:
-        validate_new_user.append(confirmed_password)
-
-
-# function check the email input to see if the email is valid to the constraints database
-def check_verification(
-    verification_method, verification_id, errors, validate_new_user, areaCodeID
-) -> None:
-    # Case 0: user don't choose any method for authentication
-    if verification_id == "--select--":
-        errors[
-            "verification_id"
-        ] = f"Please choose one of the following methods to confirm your account!"
-
-    # Case 1: user choose first method for authentication -> email
-    # fix email validation regular expression
-    elif verification_id == "Email":
-        split_email = verification_method.split("@")
-
-        switch = {
-            len(split_email) != 2: f"Email address must contain a single '@' symbol!",
-            len(
-                split_email[0]
-            ): f"Email address must contain a username before the '@' symbol!",
-            "."
-            not in split_email[
-                1
-            ]: f"Email must contain a domain name with a '.' symbol!",
-            len(split_email[1].split(".")[0])
-            == 0: f"Email address must contain a domain name before the '.' symbol.",
-        }
-
-        error_message = switch.get(True, None)
-        if error_message is not None:
-            errors["verification-input"] = error_message
-        else:
-            validate_new_user.append(verification_method)
-
-    # Case 2: user choose second method for authentication -> phone number
-    elif verification_id == "Phone number":
-        if len(verification_method) != 10:
-            errors["verification-input"] = f"Phone number must be 10 digits long!"
-        elif not verification_method.isdigit():
-            errors["verification-input"] = f"Phone number must contain only digits!"
-        else:
-            validate_new_user.append(areaCodeID + verification_method)
+    username, password, password_confirmation, verification = new_user
+    errors.update(
+        registration_schema.validate(
+            {
+                "username": username,
+                "password": password,
+                "password_confirmation": password_confirmation,
+                "verification_method": verification_id,
+                "verification": verification,
+            }
+        )
+    )
+    if errors:
+        return []
+    return [
+        username,
+        password,
+        password_confirmation,
+        registered_verification(verification_id, verification, areacode_id),
+    ]
@@ -0,0 +1,65 @@
+# this is the scheduler of the maintenance jobs that every worker process runs in the background (the prune of the expired rows)
+# the email outbox and the account purge have their own threads, the small periodic jobs share this one
+# a job runs in an app context of the app (db.engine and db.session need one), an error is printed and the job runs again at its next time
+import threading
+import time
+
+
+class JobScheduler:
+    def __init__(self) -> None:
+        # [name, function, interval in seconds, next run time]
+        self.__jobs = []
+        self.__app = None
+        self.__worker = None
+        self.__lock = threading.Lock()
+        self.__metrics = {}
+
+    # add a job that runs every interval_seconds, the first run is one interval after the start
+    def add(self, name, function, interval_seconds) -> None:
+        with self.__lock:
+            self.__jobs.append(
+                [name, function, interval_seconds, time.monotonic() + interval_seconds]
+            )
+            self.__metrics[name] = {"runs": 0, "errors": 0}
+
+    # start the background thread, the jobs run in an app context of app
+    def start(self, app) -> None:
+        with self.__lock:
+            self.__app = app
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__run, daemon=True)
+                self.__worker.start()
+
+    # a private method that runs the jobs that are due, return the time until the next job
+    def __run_due_jobs(self) -> float:
+        with self.__lock:
+            jobs = list(self.__jobs)
+        for job in jobs:
+            name, function, interval_seconds, next_run_time = job
+            if next_run_time > time.monotonic():
+                continue
+            try:
+                with self.__app.app_context():
+                    function()
+            except Exception as error:
+                print(f"There was an error in the scheduled job {name}: {error}")
+                self.__metrics[name]["errors"] += 1
+            self.__metrics[name]["runs"] += 1
+            job[3] = time.monotonic() + interval_seconds
+
+        next_run_times = [job[3] for job in jobs]
+        return max(min(next_run_times) - time.monotonic(), 0) if jobs else 60.0
+
+    # a private method that runs in the background thread
+    def __run(self) -> None:
+        while True:
+            time.sleep(self.__run_due_jobs())
+
+    # the number of runs and errors of each job
+    def stats(self) -> dict:
+        with self.__lock:
+            return {name: dict(counts) for name, counts in self.__metrics.items()}
+
+
+# the scheduler of this process
+scheduled_jobs = JobScheduler()
@@ -0,0 +1,77 @@
+# this is an in-process cache of the claims of the tokens that have already been verified, so the same token cookie that is sent again and again doesn't have to be decoded with jwt.decode every time
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenClaimsCache:
+    def __init__(self, max_size=10000) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # digest of the token -> (expiration time, claims), the least recently used entry is at the front
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    # a private method that turns the token into a fixed size key so the raw token is never kept in memory
+    def __digest(self, token) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    # get the cached claims of the token, return None if the token was never cached or it has expired
+    def get(self, token):
+        key = self.__digest(token)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expiration_time, claims = entry
+            # evict the entry once the token has expired -> jwt.decode will raise the expired error for it
+            if expiration_time <= time.time():
+                del self.__entries[key]
+                self.misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    # store the claims of a token that has just been verified
+    def put(self, token, claims) -> None:
+        expiration_time = claims.get("exp")
+        # only cache the tokens that will expire, the others are always verified again
+        if expiration_time is None or self.max_size <= 0:
+            return
+
+        key = self.__digest(token)
+        with self.__lock:
+            self.__entries[key] = (expiration_time, claims)
+            self.__entries.move_to_end(key)
+            # evict the least recently used entries when the cache is full
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    # remove the cached claims of a token
+    def discard(self, token) -> None:
+        with self.__lock:
+            self.__entries.pop(self.__digest(token), None)
+
+    # hit and miss counters of the cache for monitoring
+    def stats(self) -> dict:
+        with self.__lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.__entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,207 @@
+# this is the list of the access tokens that have been revoked (logout) before their expiration time, keyed by the token id (jti claim)
+# the list is kept in the revoked_token table and mirrored into a Bloom filter in the memory of each process
+# token_required only queries the table when the Bloom filter says the token id may have been revoked, the other requests don't touch the database
+# the filter is rebuilt from the table periodically (so the revocations of the other worker processes are picked up) and the rows of the tokens that have expired anyway are pruned at the same time
+# every access token of a user (a deleted account) is revoked with one row under the id given by user_revocation_id
+import hashlib
+import math
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+
+from database.users_models import RevokedToken, db
+from get_env import (
+    token_revocation_capacity,
+    token_revocation_error_rate,
+    token_revocation_rebuild_interval,
+)
+
+
+# a function that creates the id (jti claim) of a new access token
+def create_token_id() -> str:
+    return uuid.uuid4().hex
+
+
+# a function that returns the id under which every access token of a user is revoked (it can't collide with a jti, which is hexadecimal)
+def user_revocation_id(user_id) -> str:
+    return f"user:{user_id}"
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate) -> None:
+        capacity = max(capacity, 1)
+        # the number of bits and hash functions that keep the false positive rate under error_rate for capacity items
+        self.bit_count = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(round(self.bit_count / capacity * math.log(2)), 1)
+        self.__bits = bytearray(math.ceil(self.bit_count / 8))
+
+    # a private method that returns the positions of an item, the hash functions are derived from one sha256 (double hashing)
+    def __positions(self, item):
+        digest = hashlib.sha256(item.encode("utf-8")).digest()
+        first_hash = int.from_bytes(digest[:8], "big")
+        second_hash = int.from_bytes(digest[8:16], "big") | 1
+        return (
+            (first_hash + i * second_hash) % self.bit_count
+            for i in range(self.hash_count)
+        )
+
+    def add(self, item) -> None:
+        for position in self.__positions(item):
+            self.__bits[position >> 3] |= 1 << (position & 7)
+
+    # False -> the item has never been added, True -> the item has probably been added
+    def __contains__(self, item) -> bool:
+        return all(
+            self.__bits[position >> 3] & (1 << (position & 7))
+            for position in self.__positions(item)
+        )
+
+
+class TokenRevocationList:
+    def __init__(
+        self,
+        db,
+        RevokedToken,
+        rebuild_interval=30,
+        capacity=100000,
+        error_rate=0.001,
+    ) -> None:
+        self.db = db
+        self.table_name = RevokedToken.__tablename__
+        self.rebuild_interval = rebuild_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        self.__bloom_filter = None
+        self.__built_at = 0.0
+        self.__lock = threading.Lock()
+        self.__rebuilding = False
+        self.__local_revocations = {}  # token id -> when it was revoked by this process
+        self.__metrics = {"checks": 0, "bloom_hits": 0, "revoked": 0, "rebuilds": 0}
+
+    # a private method that prunes the expired revocations and builds a new filter from the rest of the table
+    def __rebuild(self, engine) -> None:
+        started_at = time.monotonic()
+        now = datetime.utcnow()
+        with engine.begin() as connection:
+            connection.execute(
+                text(f"DELETE FROM {self.table_name} WHERE expires_at <= :now"),
+                {"now": now},
+            )
+            token_ids = [
+                row.jti
+                for row in connection.execute(
+                    text(f"SELECT jti FROM {self.table_name} WHERE expires_at > :now"),
+                    {"now": now},
+                )
+            ]
+
+        # leave room for the revocations that come before the next rebuild
+        bloom_filter = BloomFilter(
+            max(self.capacity, len(token_ids) * 2), self.error_rate
+        )
+        for token_id in token_ids:
+            bloom_filter.add(token_id)
+
+        with self.__lock:
+            # the revocations of this process that happened during the rebuild may not be in the rows that were read
+            for token_id, revoked_at in list(self.__local_revocations.items()):
+                if revoked_at >= started_at:
+                    bloom_filter.add(token_id)
+                else:
+                    del self.__local_revocations[token_id]
+            self.__bloom_filter = bloom_filter
+            self.__built_at = time.monotonic()
+            self.__metrics["rebuilds"] += 1
+
+    # a private method that rebuilds the filter in a background thread, the requests keep using the old filter meanwhile
+    def __rebuild_in_background(self) -> None:
+        with self.__lock:
+            if self.__rebuilding:
+                return
+            self.__rebuilding = True
+
+        # the background thread has no app context -> get the engine in the request thread
+        engine = self.db.engine
+
+        def rebuild():
+            try:
+                self.__rebuild(engine)
+            except Exception as error:
+                print(f"Cannot rebuild the token revocation filter: {error}")
+            finally:
+                with self.__lock:
+                    self.__rebuilding = False
+
+        threading.Thread(target=rebuild, daemon=True).start()
+
+    # a private method that returns the current filter, only the first call waits for the table to be loaded
+    def __get_bloom_filter(self) -> BloomFilter:
+        if self.__bloom_filter is None:
+            self.__rebuild(self.db.engine)
+        elif time.monotonic() - self.__built_at > self.rebuild_interval:
+            self.__rebuild_in_background()
+        return self.__bloom_filter
+
+    # revoke a token until its expiration time (unix time of the exp claim)
+    # with a session the revocation is written in its transaction, a rolled back revocation left in the filter is only a false positive
+    def revoke(self, token_id, expires_at, session=None) -> None:
+        statement = text(
+            f"""
+            INSERT INTO {self.table_name} (jti, expires_at)
+            VALUES (:jti, :expires_at)
+            ON CONFLICT (jti) DO UPDATE SET expires_at = EXCLUDED.expires_at
+            """
+        )
+        parameters = {
+            "jti": token_id,
+            "expires_at": datetime.utcfromtimestamp(expires_at),
+        }
+        if session is not None:
+            session.execute(statement, parameters)
+        else:
+            with self.db.engine.begin() as connection:
+                connection.execute(statement, parameters)
+        # the other processes see the revocation after their next rebuild
+        bloom_filter = self.__get_bloom_filter()
+        with self.__lock:
+            self.__local_revocations[token_id] = time.monotonic()
+            bloom_filter.add(token_id)
+
+    def is_revoked(self, token_id) -> bool:
+        self.__metrics["checks"] += 1
+        if token_id not in self.__get_bloom_filter():
+            return False
+
+        # the filter can give false positives -> confirm with the table
+        self.__metrics["bloom_hits"] += 1
+        with self.db.engine.connect() as connection:
+            row = connection.execute(
+                text(
+                    f"SELECT 1 FROM {self.table_name} WHERE jti = :jti AND expires_at > :now"
+                ),
+                {"jti": token_id, "now": datetime.utcnow()},
+            ).first()
+        if row is not None:
+            self.__metrics["revoked"] += 1
+            return True
+        return False
+
+    # how often the requests had to query the table
+    def stats(self) -> dict:
+        metrics = dict(self.__metrics)
+        metrics["false_positives"] = metrics["bloom_hits"] - metrics["revoked"]
+        return metrics
+
+
+# the revocation list of this process, checked by token_required
+token_revocation_list = TokenRevocationList(
+    db=db,
+    RevokedToken=RevokedToken,
+    rebuild_interval=token_revocation_rebuild_interval,
+    capacity=token_revocation_capacity,
+    error_rate=token_revocation_error_rate,
+)
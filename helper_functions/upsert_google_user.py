@@ -0,0 +1,96 @@
+# this is a helper function that saves the user who signs in with Google and grants their permissions in one transaction with 2 statements
+# 1. INSERT ... ON CONFLICT (google_id) DO UPDATE ... RETURNING -> creates the user the first time, refreshes the name and picture the next times
+# 2. one bulk INSERT of the missing permissions that also returns every permission of the user for the token
+# an account that is marked for deletion is not updated -> (None, []) is returned and nothing is written
+# the email of a new Google user that already verifies another account (registered with a password) is never linked to it -> Conflict (409)
+import uuid
+from datetime import datetime
+
+import pytz
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import Conflict
+
+
+def upsert_google_user(
+    google_id,
+    google_user_name,
+    google_profile_image,
+    email,
+    permission_names,
+    db,
+    Users,
+    Permission,
+):
+    now = datetime.now(pytz.timezone("EST"))
+    upsert_user = text(
+        f"""
+        INSERT INTO {Users.__tablename__} (
+            user_id, google_id, google_user_name, google_profile_image, verification_method,
+            verification, account_verified, is_active, created_at, updated_at
+        )
+        VALUES (
+            CAST(:user_id AS uuid), :google_id, :google_user_name, :google_profile_image, 'Email',
+            :verification, true, true, :now, :now
+        )
+        ON CONFLICT (google_id) DO UPDATE
+        SET google_user_name = EXCLUDED.google_user_name,
+            google_profile_image = EXCLUDED.google_profile_image,
+            updated_at = EXCLUDED.updated_at
+        WHERE {Users.__tablename__}.deleted_at IS NULL
+        RETURNING user_id
+        """
+    )
+    # the rows inserted by the CTE are not visible to the SELECT of the same statement -> add them with UNION
+    grant_and_list_permissions = text(
+        f"""
+        WITH granted AS (
+            INSERT INTO {Permission.__tablename__} (name, user_id)
+            SELECT DISTINCT requested.name, CAST(:user_id AS uuid)
+            FROM unnest(CAST(:permission_names AS varchar[])) AS requested(name)
+            ON CONFLICT (user_id, name) DO NOTHING
+            RETURNING name
+        )
+        SELECT name FROM {Permission.__tablename__} WHERE user_id = CAST(:user_id AS uuid)
+        UNION
+        SELECT name FROM granted
+        """
+    )
+
+    try:
+        user_id = db.session.execute(
+            upsert_user,
+            {
+                "user_id": str(uuid.uuid4()),
+                "google_id": google_id,
+                "google_user_name": google_user_name,
+                "google_profile_image": google_profile_image,
+                "verification": email,
+                "now": now,
+            },
+        ).scalar()
+        if user_id is None:
+            db.session.rollback()
+            return None, []
+        permissions = [
+            row.name
+            for row in db.session.execute(
+                grant_and_list_permissions,
+                {"user_id": str(user_id), "permission_names": list(permission_names)},
+            )
+        ]
+        db.session.commit()
+        return user_id, permissions
+    except IntegrityError as integrity_error:
+        db.session.rollback()
+        constraint_name = getattr(
+            getattr(integrity_error.orig, "diag", None), "constraint_name", None
+        )
+        if constraint_name == "uq_users_verification":
+            raise Conflict(
+                "This email has been registered in our system! Please sign in with your username and password!"
+            )
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
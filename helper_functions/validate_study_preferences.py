@@ -0,0 +1,43 @@
+# the rules of the study preferences form, shared by the study preferences routes and the bulk import
+from database.users_models import StudyPreferences
+from helper_functions.validation_engine import (
+    Field,
+    ValidationSchema,
+    item_count,
+    one_of,
+)
+
+# the rules of the study preferences, compiled once: every option must be one of the options of its column
+# the fields are optional so the same rules check the POST form and the partial PATCH form
+study_preferences_schema = ValidationSchema(
+    [
+        Field(
+            name,
+            [
+                one_of(
+                    StudyPreferences.__table__.c[name].type.enums,
+                    f"Student must choose one of the following options for {name}",
+                )
+            ],
+            optional=True,
+        )
+        for name in (
+            "study_env_preferences",
+            "study_time_preferences",
+            "time_management_preferences",
+            "study_techniques_preferences",
+            "communication_preferences",
+        )
+    ]
+    + [
+        Field(
+            "courses_preferences",
+            [
+                item_count(
+                    ", ", 1, 8, f"Student must choose at most 8 favorite courses."
+                )
+            ],
+            optional=True,
+        )
+    ]
+)
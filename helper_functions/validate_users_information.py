@@ -4,6 +4,17 @@ import re
 from flask import request
 from werkzeug.utils import secure_filename
 
+from database.users_models import UserInformation
+from helper_functions.registerformValidation import email_rules
+from helper_functions.validation_engine import (
+    Field,
+    ValidationSchema,
+    at_least,
+    one_of,
+    required,
+    satisfies,
+)
+
 # declare a path to save folders
 UPLOAD_FOLDER = "Files_upload/"
 
@@ -47,7 +58,126 @@ def validate_files_size(file) -> bool:
         return False
 
 
-# function to validate all the fields of the users input
+# the options of a select field of the profile (the options of its column without "--select--")
+def _profile_options(column_name) -> list:
+    return [
+        option
+        for option in UserInformation.__table__.c[column_name].type.enums
+        if option != "--select--"
+    ]
+
+
+# function to validate the extension of a file of the form or of the path of a file
+def _has_allowed_extension(value) -> bool:
+    if hasattr(value, "filename"):
+        return validate_files_upload(value)
+    return "." in value and value.rsplit(".", 1)[1].lower() in allowed_extensions
+
+
+# function to validate the size of a file of the form (a path has been checked when the file was uploaded)
+def _has_allowed_size(value) -> bool:
+    if hasattr(value, "content_length"):
+        return validate_files_size(value)
+    return True
+
+
+# the rules of an uploaded file
+def _file_rules(error_message_size) -> tuple:
+    return (
+        satisfies(
+            lambda value, record: _has_allowed_extension(value),
+            f"Invalid file. Allowed file types are .png, .jpg, .jpeg, .pdf!",
+        ),
+        satisfies(lambda value, record: _has_allowed_size(value), error_message_size),
+    )
+
+
+# the rules of the user's profile, compiled once
+user_information_schema = ValidationSchema(
+    [
+        Field("first_name", [required(f"Please enter your first name!")]),
+        Field("last_name", [required(f"Please enter your last name!")]),
+        Field(
+            "age",
+            [
+                required(f"Please enter your age!"),
+                at_least(
+                    18,
+                    f"Sorry! You must be at least 18 to register for this service!!!",
+                ),
+            ],
+        ),
+        Field("birthday", [required(f"Please enter your birthday!")]),
+        Field(
+            "gender",
+            [one_of(_profile_options("gender"), f"Please select your gender!")],
+        ),
+        Field(
+            "profile_image",
+            _file_rules(
+                f"File is too large! Please try again! The maximum size allowed is 10MB!"
+            ),
+            error_key="profile-image",
+            optional=True,
+        ),
+        Field(
+            "education_institutions",
+            [
+                one_of(
+                    _profile_options("education_institutions"),
+                    f"Please select your university or college!",
+                )
+            ],
+        ),
+        Field(
+            "education_majors",
+            [
+                one_of(
+                    _profile_options("education_majors"),
+                    f"Please select your majors!",
+                )
+            ],
+        ),
+        Field(
+            "education_degrees",
+            [
+                one_of(
+                    _profile_options("education_degrees"),
+                    f"Please select your degree level!",
+                )
+            ],
+        ),
+        Field("graduation_date", [required(f"Please enter your graduation date!")]),
+        Field(
+            "identification_option",
+            [
+                one_of(
+                    _profile_options("identification_option"),
+                    f"Please choose which your method of student verification!",
+                )
+            ],
+        ),
+        # the student's email address or an uploaded proof of enrollment
+        Field(
+            "identification_material",
+            (required(f"Please enter your student's email address!"),) + email_rules,
+            when=lambda record: record.get("identification_option")
+            == "Student Email Address",
+        ),
+        Field(
+            "identification_material",
+            (required(f"Please upload your proof of enrollment!"),)
+            + _file_rules(
+                f"File is too large! Please try again! The maximum size allowed is 10MB"
+            ),
+            when=lambda record: record.get("identification_option")
+            != "Student Email Address",
+        ),
+    ]
+)
+
+
+# function to validate all the fields of the users input, the errors are put in errors
 def validate_users_information(
     errors,
     fname,
@@ -63,101 +193,24 @@ def validate_users_information(
     identification_option,
     identification_material,
 ) -> None:
-    # check if the users input the username and password
-    if not fname or not lname:
-        errors[fname] = f"Please enter your first name!"
-        errors[lname] = f"Please enter your last name!"
-
-    # check if the users input the correct age (must be at least 18) and birthday is associated with the age
-    if not age or not birthDay:
-        errors["age"] = f"Please enter your age!"
-        errors["birthday"] = f"Please enter your birthday!"
-    elif int(age) < 18:
-        errors[
-            "age"
-        ] = f"Sorry! You must be at least 18 to register for this service!!!"
-        errors[
-            "birthday"
-        ] = f"Sorry! You must be at least 18 to register for this service!!!"
-
-    # gender validation
-    if gender == "--select--":
-        errors["gender"] = f"Please select your gender!"
-
-    # validate user's profile picture
-    if profile_picture is not None:
-        if not validate_files_upload(profile_picture):
-            errors[
-                "profile-image"
-            ] = f"Invalid file. Allowed file types are .png, .jpg, .jpeg, .pdf!"
-        if not validate_files_size(profile_picture):
-            errors[
-                "profile-image"
-            ] = f"File is too large! Please try again! The maximum size allowed is 10MB!"
-
-    # validate user's education institutions
-    if education_institutions == "--select--":
-        errors["education_institutions"] = f"Please select your university or college!"
-
-    # validate user's education majors
-    if education_majors == "--select--":
-        errors["education_majors"] = f"Please select your majors!"
-
-    # validate user's education degrees
-    if education_degrees == "--select--":
-        errors["education_degrees"] = f"Please select your degree level!"
-
-    # validate user's graduation date
-    if graduation_date is None:
-        errors["graduation_date"] = f"Please enter your graduation date!"
-
-    # validate user's identification option
-    if identification_option == "--select--":
-        errors[
-            "identification_option"
-        ] = f"Please choose which your method of student verification!"
-
-    # validate user's identification material if the user's choose to upload the image
-    if (
-        identification_option != "Student Email Address"
-        and identification_option is not None
-    ):
-        if not validate_files_upload(identification_material):
-            errors[
-                "identification_material"
-            ] = f"Invalid file. Allowed file types are .png, .jpg, .jpeg, .pdf!"
-        if not validate_files_size(identification_material):
-            errors[
-                "identification_material"
-            ] = f"File is too large! Please try again! The maximum size allowed is 10MB"
-
-    # validate the user's email
-    else:
-        if identification_material is None:
-            errors[
-                "identification_material"
-            ] = f"Please enter your student's email address!"
-        else:
-            # start email address regex
-            split_email = identification_material.split("@")
-
-            switch = {
-                len(split_email)
-                != 2: f"Email address must contain a single '@' symbol!",
-                len(
-                    split_email[0]
-                ): f"Email address must contain a username before the '@' symbol!",
-                "."
-                not in split_email[
-                    1
-                ]: f"Email must contain a domain name with a '.' symbol",
-                len(split_email[1].split(".")[0])
-                == 0: f"Email address must contain a domain name before the '.' symbol.",
+    errors.update(
+        user_information_schema.validate(
+            {
+                "first_name": fname,
+                "last_name": lname,
+                "age": age,
+                "birthday": birthDay,
+                "gender": gender,
+                "profile_image": profile_picture,
+                "education_institutions": education_institutions,
+                "education_majors": education_majors,
+                "education_degrees": education_degrees,
+                "graduation_date": graduation_date,
+                "identification_option": identification_option,
+                "identification_material": identification_material,
             }
-
-            errors = switch.get(True, None)
-            if errors is not None:
-                errors["identification_material"] = errors
+        )
+    )
 
 
 # This is a helper function that handle upload files and save them to the folder
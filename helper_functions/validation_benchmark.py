@@ -0,0 +1,170 @@
+# this is a command that measures the validation of registration records with the compiled schema against the previous validation functions
+# the previous functions built a dict of lambdas and boolean-keyed "switch" dicts on every call, they are kept here only for the comparison
+# usage: python -m helper_functions.validation_benchmark --records 10000 --samples 5
+import argparse
+import statistics
+import time
+
+from helper_functions.registerformValidation import registration_schema
+
+
+################################# PREVIOUS VALIDATION #################################
+def _previous_checkusername(username, errors, validate_new_user) -> None:
+    if len(username) == 0:
+        errors["username"] = f"Please enter your username!"
+    elif len(username) < 8:
+        errors[
+            "username"
+        ] = f"The length of the username must be longer than 8 characters!"
+    else:
+        validate_new_user.append(username)
+
+
+def _previous_checkpassword(username, password, errors, validate_new_user) -> None:
+    length = len(password)
+    has_digit = any(char.isdigit() for char in password)
+    has_alpha = any(char.isalpha() for char in password)
+    has_upper_char = any(char.isupper() for char in password)
+    has_lower_char = any(char.islower() for char in password)
+    has_special_char = any(char in "!@#$%^&*():,.?/<>[]" for char in password)
+    diff_username = password != username
+
+    switch = {
+        length < 8: f"The length of the password must be longer than 8 characters!",
+        not has_digit: f"Password must contain at least 1 number!",
+        not has_alpha: f"Password must contain at least 1 character!",
+        not has_upper_char: f"Password must contain at least 1 uppercase letter!",
+        not has_lower_char: f"Password must contain at least 1 lowercase letter!",
+        not has_special_char: f"Password must contain at least 1 special character: !@#$%^&*():,.?/<>[]",
+        not diff_username: f"Password must be different from the username!",
+    }
+    error_message = switch.get(True, None)
+    if error_message is not None:
+        errors["password"] = error_message
+    else:
+        validate_new_user.append(password)
+
+
+def _previous_checkpasswordconfirm(
+    confirmed_password, password, errors, validate_new_user
+) -> None:
+    if len(confirmed_password) == 0:
+        errors[
+            "password-confirmation"
+        ] = f"Please enter the confirmation of the password!"
+    elif confirmed_password != password:
+        errors[
+            "password-confirmation"
+        ] = f"Password confirmation must be the same as password!"
+    else:
+        validate_new_user.append(confirmed_password)
+
+
+def _previous_check_verification(
+    verification_method, verification_id, errors, validate_new_user
+) -> None:
+    split_email = verification_method.split("@")
+    switch = {
+        len(split_email) != 2: f"Email address must contain a single '@' symbol!",
+        len(split_email[0])
+        == 0: f"Email address must contain a username before the '@' symbol!",
+        "."
+        not in split_email[1]: f"Email must contain a domain name with a '.' symbol!",
+        len(split_email[1].split(".")[0])
+        == 0: f"Email address must contain a domain name before the '.' symbol.",
+    }
+    error_message = switch.get(True, None)
+    if error_message is not None:
+        errors["verification-input"] = error_message
+    else:
+        validate_new_user.append(verification_method)
+
+
+def _previous_validate_registration_form(new_user, errors, verification_id) -> list:
+    validated_new_user = []
+    for i, data in enumerate(new_user):
+        case = {
+            0: lambda: _previous_checkusername(data, errors, validated_new_user),
+            1: lambda: _previous_checkpassword(
+                new_user[0], data, errors, validated_new_user
+            ),
+            2: lambda: _previous_checkpasswordconfirm(
+                data, new_user[1], errors, validated_new_user
+            ),
+            3: lambda: _previous_check_verification(
+                data, verification_id, errors, validated_new_user
+            ),
+        }
+        case[i]()
+    return validated_new_user
+
+
+################################# BENCHMARK #################################
+# registration records like the ones of an import: mostly valid, every 10th has a weak password
+def create_records(count) -> list:
+    records = []
+    for i in range(count):
+        password = f"StudyHub-{i}$Pass" if i % 10 else f"studyhub{i}"
+        records.append(
+            {
+                "username": f"student{i:06d}",
+                "password": password,
+                "password_confirmation": password,
+                "verification_method": "Email",
+                "verification": f"student{i}@uwaterloo.ca",
+            }
+        )
+    return records
+
+
+# measure the time (in milliseconds) of validating every record, once per sample
+def measure(validate_records, records, samples) -> list:
+    timings = []
+    for _ in range(samples):
+        start_time = time.perf_counter()
+        validate_records(records)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare the compiled registration schema with the previous validation functions"
+    )
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+
+    records = create_records(args.records)
+    candidates = {
+        "previous functions": lambda records: [
+            _previous_validate_registration_form(
+                [
+                    record["username"],
+                    record["password"],
+                    record["password_confirmation"],
+                    record["verification"],
+                ],
+                {},
+                record["verification_method"],
+            )
+            for record in records
+        ],
+        "compiled schema": lambda records: [
+            registration_schema.validate(record) for record in records
+        ],
+    }
+
+    results = {}
+    print(f"{'validator':<26} {'median ms':>10} {'records/s':>12} {'speedup':>8}")
+    for name, validate_records in candidates.items():
+        results[name] = statistics.median(
+            measure(validate_records, records, args.samples)
+        )
+        print(
+            f"{name:<26} {results[name]:>10.1f} {args.records / results[name] * 1000:>12.0f} {results['previous functions'] / results[name]:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# this is the validation engine of the forms (registration, password change, user's profile and study preferences) and of the bulk import
+# a schema is declared once as a list of fields with their rules, the rules are compiled when the schema is created:
+# the regular expressions are compiled, the catalogs of options become frozensets, and every rule becomes one function of (value, record)
+# validating a record runs the rules of each field in order and stops at the first rule that fails (one error message per field)
+import re
+
+
+# a compiled rule: a function (value, record) -> bool and the error message when it returns False
+class Rule:
+    __slots__ = ("check", "message")
+
+    def __init__(self, check, message) -> None:
+        self.check = check
+        self.message = message
+
+
+################################# RULES #################################
+def required(message) -> Rule:
+    return Rule(lambda value, record: value is not None and value != "", message)
+
+
+def min_length(length, message) -> Rule:
+    return Rule(lambda value, record: len(value) >= length, message)
+
+
+def max_length(length, message) -> Rule:
+    return Rule(lambda value, record: len(value) <= length, message)
+
+
+# the value contains a match of the pattern anywhere (use ^ and $ to match the whole value)
+def matches(pattern, message) -> Rule:
+    search = re.compile(pattern).search
+    return Rule(lambda value, record: search(value) is not None, message)
+
+
+def one_of(options, message) -> Rule:
+    options = frozenset(options)
+    return Rule(lambda value, record: value in options, message)
+
+
+def not_one_of(options, message) -> Rule:
+    options = frozenset(options)
+    return Rule(lambda value, record: value not in options, message)
+
+
+def equals_field(field_name, message) -> Rule:
+    return Rule(lambda value, record: value == record.get(field_name), message)
+
+
+def differs_from_field(field_name, message) -> Rule:
+    return Rule(lambda value, record: value != record.get(field_name), message)
+
+
+# the value is an integer (or a string of an integer) that is at least minimum
+def at_least(minimum, message) -> Rule:
+    return Rule(lambda value, record: int(value) >= minimum, message)
+
+
+# the number of items of a value separated by separator is between minimum and maximum
+def item_count(separator, minimum, maximum, message) -> Rule:
+    return Rule(
+        lambda value, record: minimum <= len(value.split(separator)) <= maximum,
+        message,
+    )
+
+
+# any other check, a function (value, record) -> bool
+def satisfies(check, message) -> Rule:
+    return Rule(check, message)
+
+
+################################# SCHEMA #################################
+# a field of a schema: the name of the value in the record, the key of its error and its rules
+# an optional field is not checked when its value is missing, a field with a condition (when) is only checked when the condition is true for the record
+class Field:
+    def __init__(self, name, rules, error_key=None, optional=False, when=None) -> None:
+        self.name = name
+        self.rules = tuple(rules)
+        self.error_key = error_key or name
+        self.optional = optional
+        self.when = when
+
+
+class ValidationSchema:
+    def __init__(self, fields) -> None:
+        self.fields = tuple(fields)
+        # (name, error key, optional, condition, ((check, message), ...)) -> no attribute lookups while validating
+        self.__compiled_fields = tuple(
+            (
+                field.name,
+                field.error_key,
+                field.optional,
+                field.when,
+                tuple((rule.check, rule.message) for rule in field.rules),
+            )
+            for field in self.fields
+        )
+
+    # validate one record (a dict), return the errors by error key (empty when the record is valid)
+    def validate(self, record) -> dict:
+        errors = {}
+        for name, error_key, optional, when, rules in self.__compiled_fields:
+            # a field that already failed (two fields with the same error key) is not checked again
+            if error_key in errors:
+                continue
+            if when is not None and not when(record):
+                continue
+            value = record.get(name)
+            if optional and (value is None or value == ""):
+                continue
+            for check, message in rules:
+                try:
+                    is_valid = check(value, record)
+                # a value of the wrong type (a number instead of a string in an import) fails the rule
+                except (TypeError, ValueError, AttributeError):
+                    is_valid = False
+                if not is_valid:
+                    errors[error_key] = message
+                    break
+        return errors
+
+    # validate many records (bulk import), return the errors of each record in the same order
+    # a convenience wrapper: every record is validated with validate(), it does no work across the records and is not faster per record
+    def validate_many(self, records) -> list:
+        validate = self.validate
+        return [validate(record) for record in records]
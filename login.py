@@ -2,10 +2,8 @@
 import json
 from datetime import datetime, timedelta
 
-import bcrypt
 import jwt
 import pytz
-import requests
 from flask import (
     Blueprint,
     Flask,
@@ -18,14 +16,25 @@ from flask import (
 )
 from flask_restful import Resource, fields, reqparse, abort
 from http import HTTPStatus
-from werkzeug.exceptions import Forbidden, BadRequest, NotFound
+from werkzeug.exceptions import (
+    Forbidden,
+    BadRequest,
+    Conflict,
+    NotFound,
+    ServiceUnavailable,
+    TooManyRequests,
+    Unauthorized,
+)
 from jwt.exceptions import ExpiredSignatureError, InvalidSignatureError
 
 # oauth2.0 libraries
 from oauthlib.oauth2 import WebApplicationClient
 
 # import the users models from the models.py
-from database.users_models import Permission, Users, db
+from API.google_oauth import GoogleProviderConfig
+from API.http_client import outbound_http
+from API.push_notifications import send_otp_push
+from database.users_models import OTPCode, PendingLogin, Permission, Users, db
 from get_env import (
     aws_sending_otp,
     aws_verify_otp,
@@ -33,8 +42,37 @@ from get_env import (
     google_client_id,
     google_client_secret,
     google_discovery_url,
+    google_discovery_ttl,
+    login_session_backend,
+    login_session_ttl,
+    otp_backend,
+    otp_max_attempts,
+    otp_store_backend,
+    otp_ttl,
+)
+from helper_functions.grant_permission import grant_permissions_to_user
+from helper_functions.otp_engine import AWSLambdaOTPEngine, OTPEngine, create_otp_store
+from helper_functions.password_hashing import password_hasher
+from helper_functions.permission_registry import permission_registry
+from helper_functions.refresh_tokens import refresh_tokens, set_refresh_token_cookie
+from helper_functions.middleware_functions import verified_token_cache
+from helper_functions.token_revocation import create_token_id, token_revocation_list
+from helper_functions.upsert_google_user import upsert_google_user
+from helper_functions.rate_limiting import (
+    RateLimitRule,
+    SlidingWindowPolicy,
+    TokenBucketPolicy,
+    key_by_endpoint,
+    key_by_form_field,
+    key_by_ip,
+    rate_limiter,
 )
-from helper_functions.grant_permission import grant_permission_to_verified_users
+from helper_functions.login_sessions import (
+    PendingLoginStore,
+    create_login_session_backend,
+)
+from Twilio.twilio_send_email import sendgrid_otp_email
+from Twilio.twilio_send_sms import send_otp_sms
 
 # register the app instance with the endpoints we are using for this app
 login_routes = Blueprint("login_routes", __name__)
@@ -51,39 +89,89 @@ user_resource_fields = {
     "permissions": fields.List(fields.String),
 }
 
-# create a resource for REST API to handle the POST request that handle the form data when the user sign in with their username and pass
-# global the token and user's email so the token and email from the POST request can also be used to handle the GET request
-token = None
-user_email = None
+# the logins that are waiting for the OTP verification, the client keeps the session id in the "login_session" cookie
+pending_logins = PendingLoginStore(
+    backend=create_login_session_backend(
+        login_session_backend, db=db, PendingLogin=PendingLogin
+    ),
+    ttl_seconds=login_session_ttl,
+)
 
+# the engines that send and verify the login OTP codes of each verification method
+otp_store = create_otp_store(otp_store_backend, db=db, OTPCode=OTPCode)
+if otp_backend == "lambda":
+    otp_engine = AWSLambdaOTPEngine(
+        http_client=outbound_http,
+        sending_otp_url=aws_sending_otp,
+        verify_otp_url=aws_verify_otp,
+    )
+else:
+    otp_engine = OTPEngine(
+        store=otp_store,
+        deliver=sendgrid_otp_email,
+        secret_key=secret_key,
+        ttl_seconds=otp_ttl,
+        max_attempts=otp_max_attempts,
+    )
+# the SMS are queued and sent in batches by a background thread
+sms_otp_engine = OTPEngine(
+    store=otp_store,
+    deliver=send_otp_sms,
+    secret_key=secret_key,
+    ttl_seconds=otp_ttl,
+    max_attempts=otp_max_attempts,
+)
+# the notifications are sent to every device of the user in batches by a background thread
+push_otp_engine = OTPEngine(
+    store=otp_store,
+    deliver=send_otp_push,
+    secret_key=secret_key,
+    ttl_seconds=otp_ttl,
+    max_attempts=otp_max_attempts,
+)
+otp_engines = {
+    "Email": otp_engine,
+    "Phone number": sms_otp_engine,
+    "Device Push Notification": push_otp_engine,
+}
 
-class SignInResource(Resource):
-    # this is a function to handle the GET request to get the token
-    def get(self) -> None:
-        with current_app.app_context():
-            try:
-                global token
-                response_data = {"token": token, "user_email": user_email}
-                response_json = json.dumps(response_data)
-                response = Response(
-                    response=response_json,
-                    status=HTTPStatus.OK,
-                    mimetype="application/json",
-                )
-                return response
+# rate limits of the sign in (bcrypt + OTP email) and the OTP verification (AWS) endpoints
+signin_rate_limits = [
+    # 10 attempts in a burst per ip, then 1 every 6 seconds
+    RateLimitRule(
+        "signin-ip", TokenBucketPolicy(capacity=10, refill_rate=1 / 6), key_by_ip
+    ),
+    # 5 attempts per username in any 5 minutes
+    RateLimitRule(
+        "signin-username",
+        SlidingWindowPolicy(limit=5, window_seconds=300),
+        key_by_form_field("signIn_username"),
+    ),
+    # 50 sign ins per second for the whole endpoint
+    RateLimitRule(
+        "signin-endpoint",
+        TokenBucketPolicy(capacity=100, refill_rate=50),
+        key_by_endpoint,
+    ),
+]
+
+verify_otp_rate_limits = [
+    # 5 OTP codes per ip in any minute
+    RateLimitRule(
+        "verify-otp-ip", SlidingWindowPolicy(limit=5, window_seconds=60), key_by_ip
+    ),
+    RateLimitRule(
+        "verify-otp-endpoint",
+        TokenBucketPolicy(capacity=100, refill_rate=50),
+        key_by_endpoint,
+    ),
+]
 
-            # catch the errors if found
-            except Exception as error:
-                response_data = {"message": f"Server error: {error}"}
-                response_json = json.dumps(response_data)
-                response = Response(
-                    response=response_json,
-                    status=HTTPStatus.INTERNAL_SERVER_ERROR,
-                    mimetype="application/json",
-                )
-                return response
 
+# create a resource for REST API to handle the POST request that handle the form data when the user sign in with their username and pass
+class SignInResource(Resource):
     # this is a function to handle the POST request from the login form data and validate them against the registration table to see if the user is already registered in the system
+    @rate_limiter.limit(*signin_rate_limits)
     def post(self) -> None:
         with current_app.app_context():
             try:
@@ -110,32 +198,33 @@ class SignInResource(Resource):
                 signin_errors = {}
 
                 # Query user record from database
-                user = Users.query.filter(Users.username == signIn_username).first()
+                # the accounts marked for deletion are waiting for the purge -> they don't exist anymore
+                user = Users.query.filter(
+                    Users.username == signIn_username, Users.deleted_at.is_(None)
+                ).first()
 
                 # Validate user credentials
                 if user:
                     # if the username and password is correct
-                    if bcrypt.checkpw(
-                        signIn_password.encode("utf-8"),
-                        user.password.encode("utf-8"),
-                    ):
+                    if password_hasher.verify(signIn_password, user.password):
                         # User credentials are valid
+                        # rehash the stored password if it was hashed with another cost than the configured one
+                        if password_hasher.needs_rehash(user.password):
+                            user.password = password_hasher.hash(signIn_password)
+                            db.session.commit()
+
                         # verified if the user's verification method has been verified with StudyHub system
                         if user.account_verified == False:
                             # abort if the user did not verify their email or sms or device push notification
                             raise Forbidden
 
                         # grant the permission for the user
-                        permissions_list = ["can_verify_otp"]
-                        for permission in permissions_list:
-                            grant_permission_response = (
-                                grant_permission_to_verified_users(
-                                    permission_name=permission,
-                                    db=db,
-                                    Users=Users,
-                                    Permission=Permission,
-                                )
-                            )
+                        grant_permission_response = grant_permissions_to_user(
+                            user_id=user.user_id,
+                            permission_names=["can_verify_otp"],
+                            db=db,
+                            Permission=Permission,
+                        )
 
                         # if grant permission return successfully
                         if grant_permission_response:
@@ -144,37 +233,42 @@ class SignInResource(Resource):
                             permissions = [
                                 permission.name for permission in user.permissions
                             ]
-                            global token
-                            global user_email
-                            user_email = user.verification
                             token = jwt.encode(
                                 {
                                     "id": str(user.user_id),
                                     "username": user.username,
                                     "verification_id": user.verification_method,
                                     "verification_endpoint": user.verification,
+                                    "jti": create_token_id(),
                                     "exp": datetime.now(pytz.timezone("EST"))
                                     + timedelta(minutes=10),
-                                    "permissions": permissions,
+                                    **permission_registry.to_claims(permissions),
                                 },
                                 secret_key,
                                 algorithm="HS256",
                             )
 
-                            # if the user's verification option is an email address, then redirect the user to the enpoint of lambda functions to send OTP Verification code
-                            if user.verification_method == "Email":
-                                # store the token into the request header and send it to aws lambda function
-                                headers = {"Authorization": f"Bearer {token}"}
-
-                                response = requests.get(
-                                    url=aws_sending_otp, headers=headers
-                                )
+                            # keep the pending login on the server until the user verifies the OTP code
+                            login_session_id = pending_logins.create(
+                                {
+                                    "token": token,
+                                    "user_id": str(user.user_id),
+                                    "user_email": user.verification,
+                                }
+                            )
 
-                                # if the GET request towards AWS API Gateway successfully
-                                if response.status_code == HTTPStatus.OK:
+                            # send the OTP Verification code to the user's email address, phone number or devices
+                            user_otp_engine = otp_engines.get(user.verification_method)
+                            if user_otp_engine is not None:
+                                # if the OTP code has been sent (or queued for the SMS) successfully
+                                if user_otp_engine.issue(
+                                    user.verification,
+                                    token=token,
+                                    user_id=user.user_id,
+                                ):
                                     # object serialize for REST API
                                     response_data = {
-                                        "message": f"An OTP code to verify {user.user_id} with email: {user.verification} has been sent successfully!",
+                                        "message": f"An OTP code to verify {user.user_id} with {user.verification_method.lower()}: {user.verification} has been sent successfully!",
                                         "user_id": str(user.user_id),
                                         "username": user.username,
                                         "verification_method": user.verification_method,
@@ -189,14 +283,20 @@ class SignInResource(Resource):
                                         status=HTTPStatus.OK,
                                         mimetype="application/json",
                                     )
+                                    response.set_cookie(
+                                        "login_session",
+                                        value=login_session_id,
+                                        max_age=login_session_ttl,
+                                        httponly=True,
+                                    )
 
                                     return response
 
-                                # if there is an error while sending the request to AWS Lambda function url
+                                # if the OTP code can't be sent (no provider configured, full queue or an error of the provider)
                                 else:
-                                    raise Exception
+                                    raise ServiceUnavailable("Cannot send the OTP code")
 
-                            # Store the token in cookie local storage if the user choose sms for verification
+                            # Store the token in cookie local storage if the user's verification method has no OTP delivery
                             response = make_response()
                             response.set_cookie(
                                 "token",
@@ -204,6 +304,12 @@ class SignInResource(Resource):
                                 expires=datetime.now(pytz.timezone("EST"))
                                 + timedelta(minutes=30),
                             )
+                            response.set_cookie(
+                                "login_session",
+                                value=login_session_id,
+                                max_age=login_session_ttl,
+                                httponly=True,
+                            )
 
                             # Redirect to the dashboard and some restricted resource
                             return response
@@ -250,6 +356,22 @@ class SignInResource(Resource):
                 db.session.rollback()
                 abort(HTTPStatus.FORBIDDEN, message=f"{forbidden_error}")
 
+            # handle the error when the phone number received too many OTP codes
+            except TooManyRequests as too_many_requests_error:
+                db.session.rollback()
+                abort(
+                    HTTPStatus.TOO_MANY_REQUESTS,
+                    message=f"{too_many_requests_error}",
+                )
+
+            # handle the error when the password hashing workers are saturated or the SMS are unavailable
+            except ServiceUnavailable as service_unavailable_error:
+                db.session.rollback()
+                abort(
+                    HTTPStatus.SERVICE_UNAVAILABLE,
+                    message=f"{service_unavailable_error}",
+                )
+
             # handle any internal server error
             except Exception as server_error:
                 db.session.rollback()
@@ -262,39 +384,60 @@ class verifyOTP(Resource):
         super().__init__()
 
     # a GET request along with the OTP code and the token
+    @rate_limiter.limit(*verify_otp_rate_limits)
     def get(self, otp_code):
-        # get request to get the token from the aws sending otp lambda function
-        get_token_url = "http://127.0.0.1:5000/studyhub/validateuser/"
-
-        response = requests.get(get_token_url)
-
-        # if response is unsuccessful
-        if response.status_code != HTTPStatus.OK:
-            response_data = {"message": f"Fail to send request to AWS Client"}
+        # get the pending login that was stored when the user signed in
+        login_session_id = request.cookies.get("login_session")
+        pending_login = pending_logins.get(login_session_id)
+
+        # if the user didn't sign in or the login session has expired
+        if pending_login is None:
+            response_data = {
+                "message": f"No pending login found! Please sign in again to get a new OTP code!"
+            }
             response_json = json.dumps(response_data)
             response = Response(
                 response=response_json,
-                status=HTTPStatus.INTERNAL_SERVER_ERROR,
+                status=HTTPStatus.UNAUTHORIZED,
                 mimetype="application/json",
             )
             return response
 
+        # the response when verify() itself rejects the otp_code (not a number)
+        verification_status = HTTPStatus.BAD_REQUEST
+        verification_message = "The OTP code is invalid!"
+
         try:
             # get the token
-            response_content = response.content
-            response_dict = json.loads(response_content)
-            user_token = response_dict["token"]
-            user_email = response_dict["user_email"]
+            user_token = pending_login["token"]
 
-            # query the database to get the user with the user's email
-            user = Users.query.filter_by(verification=user_email).first()
+            # query the database to get the user with the user's id
+            # the accounts marked for deletion (or already purged) since the sign in can't finish their login
+            user = Users.query.filter(
+                Users.user_id == pending_login["user_id"], Users.deleted_at.is_(None)
+            ).first()
+            if user is None:
+                pending_logins.delete(login_session_id)
+                response_data = {
+                    "message": f"This account doesn't exist anymore! Please sign in again!"
+                }
+                response_json = json.dumps(response_data)
+                response = Response(
+                    response=response_json,
+                    status=HTTPStatus.UNAUTHORIZED,
+                    mimetype="application/json",
+                )
+                response.delete_cookie("login_session")
+                return response
 
-            # perform a GET request to the AWS Lambda function with the token and the otp_code
-            headers = {"Authorization": f"Bearer {user_token}"}
-            response = requests.get(aws_verify_otp + f"{otp_code}", headers=headers)
+            # verify the otp_code against the code that was sent to the user
+            user_otp_engine = otp_engines.get(user.verification_method, otp_engine)
+            verification_status, verification_message = user_otp_engine.verify(
+                user.verification, otp_code, token=user_token
+            )
 
-            # if the request was made successfully
-            if response.status_code == HTTPStatus.OK:
+            # if the otp_code is correct
+            if verification_status == HTTPStatus.OK:
                 # give the users permission to view the dashboard, use geolocation api, view and change their profile for the algorithms
                 permission_lists = [
                     "can_view_dashboard",
@@ -302,43 +445,45 @@ class verifyOTP(Resource):
                     "can_view_profile",
                     "can_change_profile",
                 ]
-                for permission in permission_lists:
-                    # query the database to see if the user with this email id already has these permissions
-                    grant_permission = Permission.query.filter_by(
-                        user_id=user.user_id, name=permission
-                    ).first()
-                    # if they are not in then add the permissions in
-                    if not grant_permission:
-                        grant_permission = Permission(
-                            name=permission, user_id=user.user_id
-                        )
-                        db.session.add(grant_permission)
-
-                db.session.commit()
+                # only the permissions that the user doesn't have yet are inserted
+                if not grant_permissions_to_user(
+                    user_id=user.user_id,
+                    permission_names=permission_lists,
+                    db=db,
+                    Permission=Permission,
+                ):
+                    raise Exception("Cannot grant the permissions to the user")
 
                 # query the permissions list in the user table with the user id
                 permissions = [permission.name for permission in user.permissions]
 
                 # generate a new jwt token with new permissions to authenticate the user if the user has the permission to visit some certain protected resources using a middleware function
+                access_token_claims = {
+                    "id": str(user.user_id),
+                    **permission_registry.to_claims(permissions),
+                }
                 new_token = jwt.encode(
                     {
-                        "id": str(user.user_id),
-                        "permissions": permissions,
+                        **access_token_claims,
+                        "jti": create_token_id(),
+                        # set the token to be expired after 30 minutes
                         "exp": datetime.now(pytz.timezone("EST"))
-                        + timedelta(
-                            minutes=30
-                        ),  # set the token to be expired after 30 minutes
+                        + timedelta(minutes=30),
                     },
                     secret_key,
                     algorithm="HS256",
                 )
+                # the refresh token mints new access tokens with the permissions of the user when this one expires
+                refresh_token = refresh_tokens.issue(user.user_id, access_token_claims)
 
-                response_dict = json.loads(response.content.decode("utf-8"))
-                response_data = {"aws_message": response_dict}
+                response_data = {"message": verification_message}
 
                 response_json = json.dumps(response_data)
                 # response = Response(response_json, status=200, mimetype='application/json')
 
+                # the pending login has been verified -> remove it
+                pending_logins.delete(login_session_id)
+
                 # store the token into cookies
                 token_in_cookies = make_response(response_json)
                 token_in_cookies.set_cookie(
@@ -346,19 +491,20 @@ class verifyOTP(Resource):
                     value=new_token,
                     expires=datetime.now(pytz.timezone("EST")) + timedelta(minutes=30),
                 )
+                set_refresh_token_cookie(token_in_cookies, refresh_token)
+                token_in_cookies.delete_cookie("login_session")
 
                 return token_in_cookies
 
             else:
                 raise ValueError
 
-        except ValueError:  # if there is an error with AWS Lambda Client
-            response_dict = json.loads(response.content.decode("utf-8"))
-            response_data = {"message": f"{response_dict}!"}
+        except ValueError:  # if the otp_code is invalid or expired
+            response_data = {"message": verification_message}
             response_json = json.dumps(response_data)
             response = Response(
                 response=response_json,
-                status=response.status_code,
+                status=verification_status,
                 mimetype="application/json",
             )
             return response
@@ -370,15 +516,88 @@ class verifyOTP(Resource):
             abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"Server error: {error}")
 
 
+# rate limits of the refresh token endpoint
+refresh_token_rate_limits = [
+    # 20 refreshes in a burst per ip, then 1 every 3 seconds
+    RateLimitRule(
+        "refresh-token-ip",
+        TokenBucketPolicy(capacity=20, refill_rate=1 / 3),
+        key_by_ip,
+    ),
+]
+
+
+# create a resource for the Rest API to handle the POST request that exchanges a refresh token for a new access token (and a new refresh token)
+class RefreshTokenResource(Resource):
+    @rate_limiter.limit(*refresh_token_rate_limits)
+    def post(self):
+        try:
+            # browsers send the refresh token in its cookie, the other clients can send it in the body
+            json_data = request.get_json(silent=True) or {}
+            refresh_token = request.cookies.get("refresh_token") or json_data.get(
+                "refresh_token"
+            )
+
+            # the refresh token can only be used once -> it is exchanged for the next one
+            access_token_claims, next_refresh_token = refresh_tokens.rotate(
+                refresh_token
+            )
+
+            new_token = jwt.encode(
+                {
+                    **access_token_claims,
+                    "jti": create_token_id(),
+                    # set the token to be expired after 30 minutes
+                    "exp": datetime.now(pytz.timezone("EST")) + timedelta(minutes=30),
+                },
+                secret_key,
+                algorithm="HS256",
+            )
+
+            response_data = {
+                "message": "The access token has been refreshed successfully!",
+                "token": new_token,
+                "refresh_token": next_refresh_token,
+            }
+            response_json = json.dumps(response_data)
+            response = Response(
+                response=response_json,
+                status=HTTPStatus.OK,
+                mimetype="application/json",
+            )
+            response.set_cookie(
+                "token",
+                value=new_token,
+                expires=datetime.now(pytz.timezone("EST")) + timedelta(minutes=30),
+            )
+            set_refresh_token_cookie(response, next_refresh_token)
+            return response
+
+        # the refresh token is unknown, expired, already used or revoked
+        except Unauthorized as unauthorized_error:
+            abort(HTTPStatus.UNAUTHORIZED, message=f"{unauthorized_error}")
+
+        except Exception as server_error:
+            abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{server_error}")
+
+
 ######################### GOOGLE OAUTH 2.0 LOGIN #########################
 # OAuth2.0 client setup
 client = WebApplicationClient(google_client_id)
 
 
-# a helper get request function to retrieve Google's provider configuration
+# Google's discovery document and signing keys are cached and refreshed in the background when they are older than the ttl
+google_provider = GoogleProviderConfig(
+    discovery_url=google_discovery_url,
+    client_id=google_client_id,
+    ttl_seconds=google_discovery_ttl,
+)
+
+
+# a helper function to retrieve Google's provider configuration from the cache
 def get_google_provider_cfg():
     try:
-        return requests.get(google_discovery_url).json()
+        return google_provider.get_config()
     except Exception as server_error:
         abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{server_error}")
 
@@ -417,7 +636,7 @@ def callback():
         code=google_authorization_code,
     )
 
-    token_response = requests.post(
+    token_response = outbound_http.post(
         token_url,
         headers=headers,
         data=body,
@@ -425,50 +644,25 @@ def callback():
     )
 
     # parse the token
-    client.parse_request_body_response(json.dumps(token_response.json()))
-
-    # hit the URL from Google when it returns the user's profile information
-    user_info_endpoint = google_provider_cfg["userinfo_endpoint"]
-    uri, headers, body = client.add_token(user_info_endpoint)
-    user_info_response = requests.get(
-        uri, headers=headers, data=body
-    )  # GET request to get the response includes the user profile
+    token_response_json = token_response.json()
+    client.parse_request_body_response(json.dumps(token_response_json))
 
-    # information that google gives -> subject, email, picture, given_name (first and last name)
+    # information that google gives in the id_token -> subject, email, picture, given_name (first and last name)
     # verify user's email through google
     try:
-        if user_info_response.json().get("email_verified"):
-            unique_id = user_info_response.json()["sub"]
-            user_email = user_info_response.json()["email"]
-            user_picture = user_info_response.json()["picture"]
-            user_names = user_info_response.json()["given_name"]
+        # verify the id_token locally with Google's cached signing keys instead of calling the userinfo endpoint
+        user_info = google_provider.verify_id_token(token_response_json["id_token"])
+
+        if user_info.get("email_verified"):
+            unique_id = user_info["sub"]
+            user_email = user_info["email"]
+            user_picture = user_info["picture"]
+            user_names = user_info["given_name"]
 
         # if user is not verified with Google
         else:
             raise BadRequest
 
-        # create a user instance in the database with the information provided by Google
-        # see if user has been in the database
-        user = Users.query.filter_by(google_id=unique_id).first()
-
-        # if user did not exist in the database -> create user
-        if not user:
-            new_user = Users(
-                google_id=unique_id,
-                google_user_name=user_names,
-                google_profile_image=user_picture,
-                verification_method="Email",
-                verification=user_email,
-                account_verified=True,
-                is_active=True,
-            )
-
-            db.session.add(new_user)
-            db.session.commit()
-
-        # log user in
-        # query the database to get the new user if this is the first time user use google to sign in with studyhub
-        find_user_query = Users.query.filter_by(google_id=unique_id).first()
         # give user permissions to view dashboard, use geolocation api, view and change their profile
         permission_lists = [
             "can_view_dashboard",
@@ -476,34 +670,38 @@ def callback():
             "can_view_profile",
             "can_change_profile",
         ]
-        for permission in permission_lists:
-            # query the database to see if the user with this google id
-            grant_permission = Permission.query.filter_by(
-                user_id=find_user_query.user_id, name=permission
-            ).first()
-            # if the permissions are not in yet => add the permissions in
-            if not grant_permission:
-                grant_permission = Permission(
-                    name=permission, user_id=find_user_query.user_id
-                )
-                db.session.add(grant_permission)
-
-        db.session.commit()
-
-        # query the permissions list in the user table with the user id
-        permissions = [permission.name for permission in find_user_query.permissions]
+        # create the user the first time (or update their name and picture), grant the missing permissions and get every permission of the user in one transaction
+        user_id, permissions = upsert_google_user(
+            google_id=unique_id,
+            google_user_name=user_names,
+            google_profile_image=user_picture,
+            email=user_email,
+            permission_names=permission_lists,
+            db=db,
+            Users=Users,
+            Permission=Permission,
+        )
+        # the account of this Google user is marked for deletion
+        if user_id is None:
+            raise Forbidden("This account has been deleted!")
 
         # generate a jwt token with new permissions to authenticate the user by using the  middleware function
+        access_token_claims = {
+            "id": str(user_id),
+            **permission_registry.to_claims(permissions),
+        }
         jwt_token = jwt.encode(
             {
-                "id": str(find_user_query.user_id),
-                "permissions": permissions,
-                "exp": datetime.now(pytz.timezone("EST"))
-                + timedelta(minutes=30),  # set the token to be expired after 30 minutes
+                **access_token_claims,
+                "jti": create_token_id(),
+                # set the token to be expired after 30 minutes
+                "exp": datetime.now(pytz.timezone("EST")) + timedelta(minutes=30),
             },
             secret_key,
             algorithm="HS256",
         )
+        # the refresh token mints new access tokens with the permissions of the user when this one expires
+        refresh_token = refresh_tokens.issue(user_id, access_token_claims)
 
         response_data = {"google_name": user_names, "google_picture": user_picture}
 
@@ -521,12 +719,24 @@ def callback():
             value=jwt_token,
             expires=datetime.now(pytz.timezone("EST")) + timedelta(minutes=30),
         )
+        set_refresh_token_cookie(response, refresh_token)
 
         return response, HTTPStatus.CREATED
 
     except BadRequest as bad_request_message:
         abort(HTTPStatus.BAD_REQUEST, message=f"{bad_request_message}")
 
+    except Forbidden as forbidden_error:
+        abort(HTTPStatus.FORBIDDEN, message=f"{forbidden_error}")
+
+    # the email of the Google user verifies an account that was registered with a password
+    except Conflict as conflict_error:
+        abort(HTTPStatus.CONFLICT, message=f"{conflict_error}")
+
+    # the id_token from Google is invalid or expired
+    except jwt.InvalidTokenError as invalid_token_error:
+        abort(HTTPStatus.UNAUTHORIZED, message=f"{invalid_token_error}")
+
     except Exception as server_error:
         abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{server_error}")
 
@@ -542,9 +752,28 @@ def logout():
         if not token:
             raise NotFound("No token found!")
 
+        # revoke the token until it expires so a copy of it can't be used anymore, an expired token doesn't need to be revoked
+        try:
+            claims = jwt.decode(token, secret_key, algorithms=["HS256"])
+        except ExpiredSignatureError:
+            claims = {}
+        if "jti" in claims:
+            token_revocation_list.revoke(claims["jti"], claims["exp"])
+        verified_token_cache.discard(token)
+
+        # revoke the refresh tokens of this login too
+        refresh_tokens.revoke(request.cookies.get("refresh_token"))
+
         # set the token to be expired
-        response = make_response(redirect(url_for("login")))
-        response.set_cookie("token", value=token, expires=0, httponly=True)
+        response_data = {"message": "Logged out successfully!"}
+        response_json = json.dumps(response_data)
+        response = Response(
+            response=response_json,
+            status=HTTPStatus.OK,
+            mimetype="application/json",
+        )
+        response.set_cookie("token", value="", expires=0, httponly=True)
+        response.delete_cookie("refresh_token")
 
         return response
 
@@ -552,6 +781,10 @@ def logout():
     except NotFound as not_found_error:
         abort(HTTPStatus.NOT_FOUND, message=f"{not_found_error}")
 
+    # catch the invalid token error
+    except jwt.InvalidTokenError as invalid_token_error:
+        abort(HTTPStatus.BAD_REQUEST, message=f"{invalid_token_error}")
+
     # catch the server error
     except Exception as server_error:
         abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{server_error}")
@@ -0,0 +1,147 @@
+"""add hot lookup indexes and drop the redundant unique constraints
+
+Revision ID: 8d4a1c6e2f90
+Revises: 5b8e2f6a1d47
+Create Date: 2026-10-18 15:12:26.907341
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8d4a1c6e2f90"
+down_revision = "5b8e2f6a1d47"
+branch_labels = None
+depends_on = None
+
+# the unique constraints that repeat a primary key (or a salted password hash) -> (table, constraint, columns)
+redundant_unique_constraints = [
+    ("users", "users_user_id_key", ["user_id"]),
+    ("users", "users_password_key", ["password"]),
+    ("user_information", "user_information_id_key", ["id"]),
+    ("study_preferences", "study_preferences_id_key", ["id"]),
+    ("availability_schedule", "availability_schedule_id_key", ["id"]),
+    ("permission", "permission_id_key", ["id"]),
+]
+
+
+# drop a unique constraint if it exists
+# the foreign keys that were created against its index are dropped and created again after it -> they use the primary key instead
+def drop_unique_constraint(table_name, constraint_name):
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            foreign_key record;
+            foreign_keys text[] := ARRAY[]::text[];
+            statement text;
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint
+                WHERE conname = '{constraint_name}' AND conrelid = '{table_name}'::regclass
+            ) THEN
+                RETURN;
+            END IF;
+
+            FOR foreign_key IN
+                SELECT conrelid::regclass::text AS table_name, conname, pg_get_constraintdef(oid) AS definition
+                FROM pg_constraint
+                WHERE contype = 'f' AND conindid = (
+                    SELECT conindid FROM pg_constraint
+                    WHERE conname = '{constraint_name}' AND conrelid = '{table_name}'::regclass
+                )
+            LOOP
+                EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', foreign_key.table_name, foreign_key.conname);
+                foreign_keys := foreign_keys || format(
+                    'ALTER TABLE %s ADD CONSTRAINT %I %s',
+                    foreign_key.table_name, foreign_key.conname, foreign_key.definition
+                );
+            END LOOP;
+
+            ALTER TABLE {table_name} DROP CONSTRAINT {constraint_name};
+
+            FOREACH statement IN ARRAY foreign_keys LOOP
+                EXECUTE statement;
+            END LOOP;
+        END $$;
+        """
+    )
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    for table_name, constraint_name, columns in redundant_unique_constraints:
+        drop_unique_constraint(table_name, constraint_name)
+
+    # the verification comes first so the lookups by the verification alone use the constraint
+    with op.batch_alter_table("users", schema=None) as batch_op:
+        batch_op.drop_constraint("uq_users_verification", type_="unique")
+        batch_op.create_unique_constraint(
+            "uq_users_verification", ["verification", "verification_method"]
+        )
+
+    with op.batch_alter_table("user_information", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_user_information_user_id"), ["user_id"], unique=False
+        )
+
+    with op.batch_alter_table("study_preferences", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_study_preferences_user_id"), ["user_id"], unique=False
+        )
+
+    with op.batch_alter_table("permission", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_permission_user_id_name", ["user_id", "name"], unique=False
+        )
+
+    with op.batch_alter_table("email_outbox", schema=None) as batch_op:
+        batch_op.drop_index("ix_email_outbox_status_next_attempt_at")
+        batch_op.create_index(
+            "ix_email_outbox_due_next_attempt_at",
+            ["next_attempt_at"],
+            unique=False,
+            postgresql_where=sa.text("status IN ('pending', 'sending')"),
+        )
+        batch_op.create_index(
+            "ix_email_outbox_sent_at",
+            ["sent_at"],
+            unique=False,
+            postgresql_where=sa.text("status = 'sent'"),
+        )
+
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table("email_outbox", schema=None) as batch_op:
+        batch_op.drop_index("ix_email_outbox_sent_at")
+        batch_op.drop_index("ix_email_outbox_due_next_attempt_at")
+        batch_op.create_index(
+            "ix_email_outbox_status_next_attempt_at",
+            ["status", "next_attempt_at"],
+            unique=False,
+        )
+
+    with op.batch_alter_table("permission", schema=None) as batch_op:
+        batch_op.drop_index("ix_permission_user_id_name")
+
+    with op.batch_alter_table("study_preferences", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_study_preferences_user_id"))
+
+    with op.batch_alter_table("user_information", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_user_information_user_id"))
+
+    with op.batch_alter_table("users", schema=None) as batch_op:
+        batch_op.drop_constraint("uq_users_verification", type_="unique")
+        batch_op.create_unique_constraint(
+            "uq_users_verification", ["verification_method", "verification"]
+        )
+
+    for table_name, constraint_name, columns in reversed(redundant_unique_constraints):
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.create_unique_constraint(constraint_name, columns)
+
+    # ### end Alembic commands ###
@@ -1,24 +1,46 @@
 ############### REGISTER PAGE FOR USERS TO CREATE THEIR USERNAME AND PASSWORD FOR THE APPLICATION
 # import libraries
+import itertools
 import json
 import random
 import time
 
-import bcrypt
 import jwt
 from flask import Blueprint, Flask, Response, request, current_app
 from flask_migrate import Migrate
 from flask_restful import Resource, fields, marshal_with, reqparse, abort
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select, tuple_
+from sqlalchemy.exc import IntegrityError
 from http import HTTPStatus
-from werkzeug.exceptions import Conflict, NotFound, BadRequest, Forbidden, Unauthorized
+from werkzeug.exceptions import (
+    NotFound,
+    BadRequest,
+    Forbidden,
+    Unauthorized,
+    ServiceUnavailable,
+)
 
 # import from files
+from API.push_notifications import send_verification_push
 from database.users_models import Users, db
-from get_env import secret_key
-from helper_functions.registerformValidation import checkpassword, checkpasswordconfirm
+from get_env import secret_key, user_list_max_page_size, user_list_page_size
+from helper_functions.account_purge import account_purger
+from helper_functions.email_outbox import email_outbox
+from helper_functions.pagination import decode_cursor, encode_cursor, parse_page_size
+from helper_functions.password_hashing import password_hasher
+from helper_functions.rate_limiting import (
+    RateLimitRule,
+    SlidingWindowPolicy,
+    TokenBucketPolicy,
+    key_by_endpoint,
+    key_by_form_field,
+    key_by_ip,
+    rate_limiter,
+)
+from helper_functions.registerformValidation import password_change_schema
 from helper_functions.registerformValidation import validate_registration_form
-from Twilio.twilio_send_email import sendgrid_verification_email
+from Twilio.twilio_send_email import create_verification_token
+from Twilio.twilio_send_sms import send_verification_sms
 
 # register the app instance with the endpoints we are using for this app
 registration_routes = Blueprint("registration_routes", __name__)
@@ -37,34 +59,106 @@ validated_fields = {
     "verification_method": "",
 }
 
-# initialize the errors dictionary in order to store the errors for each input fields
-register_errors = {}
-
 # define a resource fields to serialize the object (user's login information) to make sure that all the identifications have been inserted success
 _user_resource_fields = {
     "username": fields.String,
     "verification_method": fields.String,
 }
 
+# rate limits of the account endpoints that hash passwords and send emails (POST, PATCH, DELETE)
+user_account_rate_limits = [
+    # 10 requests per ip in any hour
+    RateLimitRule(
+        "user-account-ip", SlidingWindowPolicy(limit=10, window_seconds=3600), key_by_ip
+    ),
+    # 3 requests per username in any 15 minutes
+    RateLimitRule(
+        "user-account-username",
+        SlidingWindowPolicy(limit=3, window_seconds=900),
+        key_by_form_field("username"),
+    ),
+    # 20 requests per second for each method of the endpoint
+    RateLimitRule(
+        "user-account-endpoint",
+        TokenBucketPolicy(capacity=50, refill_rate=20),
+        key_by_endpoint,
+    ),
+]
+
 
 # create a resource for rest api to handle the post request
 class RegistrationResource(Resource):
+    # a private method that streams one page of users as json, the cursor of the next page is written after the last user
+    def __stream_users_page(self, first_row, rows, page_size):
+        yield '{"users": ['
+        last_row = None
+        next_cursor = None
+        for index, row in enumerate(itertools.chain([first_row], rows)):
+            # one more row than the page size -> there is a next page that starts after the last row of this one
+            if index == page_size:
+                next_cursor = encode_cursor(last_row.created_at, last_row.user_id)
+                break
+            user = {field: row[field] for field in _user_resource_fields}
+            yield ("," if index else "") + json.dumps(user)
+            last_row = row
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
     # this is a method to handle the GET request from the database after inserting the user's login information into the database
-    @marshal_with(_user_resource_fields)
+    # the users are listed page by page (?page_size=&cursor=) in the order of (created_at, user_id), only the returned columns are selected
     def get(self) -> None:
         with current_app.app_context():
-            # get all the usernames and verification method from the database
+            connection = None
             try:
-                all_users = Users.query.all()
-                if all_users:
-                    return all_users
-                else:
+                page_size = parse_page_size(
+                    request.args.get("page_size"),
+                    user_list_page_size,
+                    user_list_max_page_size,
+                )
+                cursor = request.args.get("cursor")
+
+                # only the columns of the response and of the cursor are selected (no password or temp_token)
+                users_page_query = select(
+                    [Users.user_id, Users.created_at]
+                    + [getattr(Users, field) for field in _user_resource_fields]
+                )
+                if cursor:
+                    created_at, user_id = decode_cursor(cursor)
+                    users_page_query = users_page_query.where(
+                        tuple_(Users.created_at, Users.user_id)
+                        > tuple_(created_at, user_id)
+                    )
+                users_page_query = users_page_query.order_by(
+                    Users.created_at, Users.user_id
+                ).limit(page_size + 1)
+
+                # the rows are read from a server side cursor while the response is streamed
+                # the connection doesn't belong to the session (closed with this app context) -> it is closed when the response is closed
+                connection = db.engine.connect().execution_options(stream_results=True)
+                rows = connection.execute(users_page_query)
+                first_row = rows.fetchone()
+                if first_row is None and not cursor:
                     raise NotFound
 
+                response = Response(
+                    self.__stream_users_page(first_row, rows, page_size)
+                    if first_row is not None
+                    else iter(['{"users": [], "next_cursor": null}']),
+                    status=HTTPStatus.OK,
+                    mimetype="application/json",
+                )
+                response.call_on_close(connection.close)
+                return response
+
+            except BadRequest as bad_request_error:
+                abort(HTTPStatus.BAD_REQUEST, message=f"{bad_request_error}")
+
             except NotFound as not_found_error:
+                connection.close()
                 abort(HTTPStatus.NOT_FOUND, message=f"{not_found_error}")
 
             except Exception as internal_server_error:
+                if connection is not None:
+                    connection.close()
                 abort(
                     HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{internal_server_error}"
                 )
@@ -76,8 +170,30 @@ class RegistrationResource(Resource):
             otp += str(random.randint(0, 9))
         return otp
 
+    # a private method that turns the unique constraint that rejected the new user into the error message of the field
+    def __registration_conflict_errors(self, integrity_error, verification_method):
+        constraint_name = getattr(
+            getattr(integrity_error.orig, "diag", None), "constraint_name", None
+        )
+        if constraint_name == "uq_users_verification":
+            switch = {
+                "Email": f"Sorry! This email has been registered in our system!",
+                "Phone number": f"Sorry! This phone number has been registered in our system!",
+                "Device Push Notification": f"Sorry! This device has been registered in our system!",
+            }
+            return {
+                "verification": switch.get(
+                    verification_method,
+                    "Sorry! This verification has been registered!",
+                )
+            }
+        return {"username": f"Sorry! This username already exists!"}
+
     # this is a function to handle the POST request from the registration form and insert the registration fields into the database
+    @rate_limiter.limit(*user_account_rate_limits)
     def post(self) -> None:
+        # the errors of the input fields of this request only (a module level dictionary would keep the errors of the previous requests)
+        register_errors = {}
         with current_app.app_context():
             try:
                 # get the registration form data and validate them before inserting into the database
@@ -129,132 +245,121 @@ class RegistrationResource(Resource):
 
                 # handle appropriate validated_registration -> check if the username and password already existed
                 if len(validated_registration) == 4 and not register_errors:
-                    # genrate the salt for the hashed_password
-                    salt = bcrypt.gensalt()
-                    # hash the password using bcrypt hashing algorithm
-                    hashed_password = bcrypt.hashpw(password.encode("utf-8"), salt)
+                    # hash the password with the configured password hasher (bcrypt in the password hashing workers)
+                    decoded_hashed_password = password_hasher.hash(password)
 
-                    decoded_hashed_password = hashed_password.decode("utf-8")
-
-                    # query each field to make sure each of them is unique
-                    username_taken = (
-                        Users.query.filter(Users.username == username).first()
-                        is not None
+                    # the verification token is created first so it is stored with the new user in the same INSERT
+                    temp_token = create_verification_token(
+                        validated_registration[3], self.__generate_otp()
                     )
 
-                    password_taken = (
-                        Users.query.filter(
-                            Users.password == decoded_hashed_password
-                        ).first()
-                        is not None
+                    # create an instance to add the new user into the database
+                    new_user = Users(
+                        username=validated_registration[0],
+                        password=decoded_hashed_password,
+                        verification_method=verification_method,
+                        verification=validated_registration[3],
+                        temp_token=temp_token,
                     )
+                    # add new user to the registration model
+                    # the unique constraints on the username and on the verification reject the duplicates -> IntegrityError (409)
+                    db.session.add(new_user)
+                    db.session.flush()
+
+                    # send a confirmation email to the user to verify their account using Twillio
+                    # the email is added to the outbox in the same transaction as the new user and sent by the dispatcher after the commit
+                    if verification_method == "Email":
+                        email_outbox.add(
+                            db.session, new_user.verification, "post", temp_token
+                        )
 
-                    verification_method_taken = (
-                        Users.query.filter(
-                            Users.verification_method == verification_method,
-                            Users.verification == verification,
-                        ).first()
-                        is not None
-                    )
+                        # commit the change to the database
+                        db.session.commit()
+                        email_outbox.notify()
 
-                    # check if there is the users input already in the database
-                    if username_taken:
-                        register_errors[
-                            "username"
-                        ] = f"Sorry! This username already exists!"
-                        response_data = {"message": register_errors}
+                        response_data = {
+                            "message": f"Successfully!",
+                        }
                         response_json = json.dumps(response_data)
                         response = Response(
                             response=response_json,
-                            status=HTTPStatus.CONFLICT,
+                            status=HTTPStatus.CREATED,
                             mimetype="application/json",
                         )
                         return response
 
-                    elif password_taken:
-                        register_errors[
-                            "password"
-                        ] = f"Sorry! This password already exists!"
-                        response_data = {"message": register_errors}
+                    # send a text message with the verification link to the user's phone number (queued, sent in batches in the background)
+                    elif verification_method == "Phone number":
+                        (
+                            response_status,
+                            response_message,
+                            temp_token,
+                        ) = send_verification_sms(
+                            phone_number=new_user.verification, token=temp_token
+                        )
+
+                        # the phone number received too many SMS or the SMS are unavailable -> don't create the account
+                        if response_status != HTTPStatus.CREATED:
+                            db.session.rollback()
+                            response_data = {"message": response_message}
+                            response_json = json.dumps(response_data)
+                            response = Response(
+                                response=response_json,
+                                status=response_status,
+                                mimetype="application/json",
+                            )
+                            return response
+
+                        db.session.commit()
+
+                        response_data = {
+                            "message": f"Successfully!",
+                        }
                         response_json = json.dumps(response_data)
                         response = Response(
                             response=response_json,
-                            status=HTTPStatus.CONFLICT,
+                            status=HTTPStatus.CREATED,
                             mimetype="application/json",
                         )
                         return response
 
-                    elif verification_method_taken:
-                        switch = {
-                            verification_method
-                            == "Email": f"Sorry! This email has been registered in our system!",
-                            verification_method
-                            == "Phone number": f"Sorry! This phone number has been registered in our system!",
-                            verification_method
-                            == "Device Push Notification": f"Sorry! This device has been registered in our system!",
-                        }
+                    # send a push notification with the verification link to the user's device (queued, sent in batches in the background)
+                    elif verification_method == "Device Push Notification":
+                        (
+                            response_status,
+                            response_message,
+                            temp_token,
+                        ) = send_verification_push(
+                            user_id=new_user.user_id,
+                            device_token=new_user.verification,
+                            token=temp_token,
+                            session=db.session,
+                        )
 
-                        error_message = switch.get(True, "None")
-                        if error_message is not None:
-                            register_errors["verification"] = error_message
-                            response_data = {"message": register_errors}
+                        # the device belongs to another account or the notification can't be queued -> don't create the account
+                        if response_status != HTTPStatus.CREATED:
+                            db.session.rollback()
+                            response_data = {"message": response_message}
                             response_json = json.dumps(response_data)
                             response = Response(
                                 response=response_json,
-                                status=HTTPStatus.CONFLICT,
+                                status=response_status,
                                 mimetype="application/json",
                             )
                             return response
 
-                    else:  # if no field existed before
-                        # create an instance to add the new user into the database
-                        new_user = Users(
-                            username=validated_registration[0],
-                            password=decoded_hashed_password,
-                            verification_method=verification_method,
-                            verification=validated_registration[3],
-                        )
-                        # add new user to the registration model
-                        db.session.add(new_user)
-
-                        # send a confirmation email to the user to verify their account using Twillio
-                        if verification_method == "Email":
-                            (
-                                response_status,
-                                response_message,
-                                temp_token,
-                            ) = sendgrid_verification_email(
-                                user_email=new_user.verification,
-                                studyhub_code=self.__generate_otp(),
-                                request_type="post",
-                            )
+                        db.session.commit()
 
-                            # store the user's temporary token into the database
-                            new_user.temp_token = temp_token
-                            # commit the change to the database
-                            db.session.commit()
-
-                            # check if the response_message is True -> verification sent successfully!
-                            if (
-                                response_status == HTTPStatus.OK
-                                or response_status == HTTPStatus.CREATED
-                            ):
-                                response_data = {
-                                    "message": f"Successfully!",
-                                }
-                                response_json = json.dumps(response_data)
-                                response = Response(
-                                    response=response_json,
-                                    status=HTTPStatus.CREATED,
-                                    mimetype="application/json",
-                                )
-                                return response
-
-                            # raise and Exception error if Twilio cannot be sent
-                            else:
-                                raise Exception(f"{response_message}")
-
-                        # handle the response if the verification method is not Email -> this will be done later
+                        response_data = {
+                            "message": f"Successfully!",
+                        }
+                        response_json = json.dumps(response_data)
+                        response = Response(
+                            response=response_json,
+                            status=HTTPStatus.CREATED,
+                            mimetype="application/json",
+                        )
+                        return response
 
                 else:  # if there is an invalid input from the form data
                     raise BadRequest
@@ -264,12 +369,37 @@ class RegistrationResource(Resource):
                 db.session.rollback()
                 abort(HTTPStatus.BAD_REQUEST, message=f"{bad_request_error}")
 
+            # catch the duplicate username or verification rejected by the unique constraints -> 409
+            except IntegrityError as integrity_error:
+                db.session.rollback()
+                response_data = {
+                    "message": self.__registration_conflict_errors(
+                        integrity_error, verification_method
+                    )
+                }
+                response_json = json.dumps(response_data)
+                response = Response(
+                    response=response_json,
+                    status=HTTPStatus.CONFLICT,
+                    mimetype="application/json",
+                )
+                return response
+
+            # catch the error when the password hashing workers are saturated
+            except ServiceUnavailable as service_unavailable_error:
+                db.session.rollback()
+                abort(
+                    HTTPStatus.SERVICE_UNAVAILABLE,
+                    message=f"{service_unavailable_error}",
+                )
+
             # handle the errors if there is any errors when validating the inputs on the form
             except Exception as server_error:
                 db.session.rollback()
                 abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{server_error}")
 
     # this is a function that update the user information if the user forgot their username or password
+    @rate_limiter.limit(*user_account_rate_limits)
     def patch(self):
         with current_app.app_context():
             try:
@@ -301,88 +431,56 @@ class RegistrationResource(Resource):
                 if not find_user_query:
                     raise NotFound
 
-                # initialize a validate fields for validate the new password
-                validate_new_user = []
-                errors = {}
-
                 # if user is found in the database
                 # validate the password and password confirmation before change them in the database
-                checkpassword(
-                    username=username,
-                    password=password,
-                    errors=errors,
-                    validate_new_user=validate_new_user,
-                )
-                checkpasswordconfirm(
-                    confirmed_password=password_confirmation,
-                    password=password,
-                    errors=errors,
-                    validate_new_user=validate_new_user,
+                errors = password_change_schema.validate(
+                    {
+                        "username": username,
+                        "password": password,
+                        "password_confirmation": password_confirmation,
+                    }
                 )
 
                 # if there is no error in the errors dictionary -> handle appropriate form data
-                if len(validate_new_user) == 2 and not errors:
-                    # genrate the salt for the hashed_password
-                    salt = bcrypt.gensalt()
-                    # hash the password using bcrypt hashing algorithm
-                    hashed_password = bcrypt.hashpw(password.encode("utf-8"), salt)
-
-                    decoded_hashed_password = hashed_password.decode("utf-8")
-
-                    # query the database to check if the password is not none
-                    password_taken = (
-                        Users.query.filter(
-                            Users.password == decoded_hashed_password
-                        ).first()
-                        is not None
-                    )
-
-                    # raise conflict if the password already exists in the userdatabase
-                    if password_taken:
-                        raise Conflict
+                if not errors:
+                    # hash the password with the configured password hasher (bcrypt in the password hashing workers)
+                    decoded_hashed_password = password_hasher.hash(password)
 
-                    # if no user took this password in the database
+                    # the hashes are salted -> a new hash never matches the hash of another user, there is no need to look it up
                     # abort forbidden if the user hasn't verified their email or sms
                     if find_user_query.account_verified == False:
                         raise Forbidden
 
                     # send an otp to user's email to verify if the authenticated user made this change
                     if find_user_query.verification_method == "Email":
-                        (
-                            response_status,
-                            response_message,
-                            temp_token,
-                        ) = sendgrid_verification_email(
-                            user_email=find_user_query.verification,
-                            studyhub_code=self.__generate_otp(),
-                            request_type="patch",
+                        temp_token = create_verification_token(
+                            find_user_query.verification,
+                            self.__generate_otp(),
                             new_password=decoded_hashed_password,
                         )
 
-                        # store the user's temporary token into the database
+                        # store the user's temporary token into the database and add the email to the outbox in the same transaction
                         find_user_query.temp_token = temp_token
+                        email_outbox.add(
+                            db.session,
+                            find_user_query.verification,
+                            "patch",
+                            temp_token,
+                        )
                         # commit the change to the database
                         db.session.commit()
+                        email_outbox.notify()
 
-                        # check if the response_message is True -> verification sent successfully!
-                        if (
-                            response_status == HTTPStatus.OK
-                            or response_status == HTTPStatus.CREATED
-                        ):
-                            response_data = {
-                                "message": f"Sending email successfully!",
-                            }
-                            response_json = json.dumps(response_data)
-                            response = Response(
-                                response=response_json,
-                                status=HTTPStatus.CREATED,
-                                mimetype="application/json",
-                            )
-                            return response
-
-                        # raise and Exception error if Twilio cannot be sent
-                        else:
-                            raise Exception(f"{response_message}")
+                        response_data = {
+                            "message": f"Sending email successfully!",
+                        }
+                        response_json = json.dumps(response_data)
+                        response = Response(
+                            response=response_json,
+                            status=HTTPStatus.CREATED,
+                            mimetype="application/json",
+                        )
+                        return response
 
                 else:
                     raise BadRequest
@@ -392,11 +490,6 @@ class RegistrationResource(Resource):
                 db.session.rollback()
                 abort(HTTPStatus.NOT_FOUND, message=f"{not_found_error}")
 
-            # catch the conflict error
-            except Conflict as conflict_error:
-                db.session.rollback()
-                abort(HTTPStatus.CONFLICT, message=f"{conflict_error}")
-
             # catch the forbidden error
             except Forbidden as forbidden_error:
                 db.session.rollback()
@@ -407,12 +500,21 @@ class RegistrationResource(Resource):
                 db.session.rollback()
                 abort(HTTPStatus.BAD_REQUEST, message=json.dumps(errors))
 
+            # catch the error when the password hashing workers are saturated
+            except ServiceUnavailable as service_unavailable_error:
+                db.session.rollback()
+                abort(
+                    HTTPStatus.SERVICE_UNAVAILABLE,
+                    message=f"{service_unavailable_error}",
+                )
+
             # catch the server error
             except Exception as server_error:
                 db.session.rollback()
                 abort(HTTPStatus.INTERNAL_SERVER_ERROR, message=f"{server_error}")
 
     # a delete method for user to delete the account, this method
+    @rate_limiter.limit(*user_account_rate_limits)
     def delete(self):
         with current_app.app_context():
             try:
@@ -425,8 +527,10 @@ class RegistrationResource(Resource):
                 user_account_delete_form.parse_args()
                 username = user_account_delete_form["username"]
 
-                # query the database to get the user
-                find_user_query = Users.query.filter_by(username=username).first()
+                # query the database to get the user (an account marked for deletion is already deleted)
+                find_user_query = Users.query.filter_by(
+                    username=username, deleted_at=None
+                ).first()
 
                 # abort if user not found in the database
                 if not find_user_query:
@@ -439,41 +543,31 @@ class RegistrationResource(Resource):
 
                 # send a verification to user's information to see if the user created this action
                 if find_user_query.verification_method == "Email":
-                    (
-                        response_status,
-                        response_message,
-                        temp_token,
-                    ) = sendgrid_verification_email(
-                        user_email=find_user_query.verification,
-                        studyhub_code=self.__generate_otp(),
-                        request_type="delete",
+                    temp_token = create_verification_token(
+                        find_user_query.verification,
+                        self.__generate_otp(),
                         user_id=find_user_query.user_id,
                     )
 
-                    # store the user's temporary token into the database
+                    # store the user's temporary token into the database and add the email to the outbox in the same transaction
                     find_user_query.temp_token = temp_token
+                    email_outbox.add(
+                        db.session, find_user_query.verification, "delete", temp_token
+                    )
                     # commit the change to the database
                     db.session.commit()
-
-                    # check if the response_message is True -> verification sent successfully!
-                    if (
-                        response_status == HTTPStatus.OK
-                        or response_status == HTTPStatus.CREATED
-                    ):
-                        response_data = {
-                            "message": f"Sending email successfully!",
-                        }
-                        response_json = json.dumps(response_data)
-                        response = Response(
-                            response=response_json,
-                            status=HTTPStatus.CREATED,
-                            mimetype="application/json",
-                        )
-                        return response
-
-                    # raise and Exception error if Twilio cannot be sent
-                    else:
-                        raise Exception(f"{response_message}")
+                    email_outbox.notify()
+
+                    response_data = {
+                        "message": f"Sending email successfully!",
+                    }
+                    response_json = json.dumps(response_data)
+                    response = Response(
+                        response=response_json,
+                        status=HTTPStatus.CREATED,
+                        mimetype="application/json",
+                    )
+                    return response
 
             # catch the forbidden error
             except Forbidden as forbidden_error:
@@ -630,10 +724,11 @@ def confirm_account_deletion():
             result = Users.query.filter_by(verification=user_email).first()
 
             if result.temp_token == token:
-                # procceed to account deletion
-                db.session.query(Users).filter(Users.user_id == user_id).delete()
+                # procceed to account deletion: the account is marked and the purge deletes it with its profile, preferences and files
+                account_purger.mark(db.session, user_id)
                 # commit the change to the database
                 db.session.commit()
+                account_purger.notify()
 
                 # return the json response to the client
                 response_data = {"message": f"Successfully deleted user!"}
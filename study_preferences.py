@@ -6,7 +6,7 @@ from http import HTTPStatus
 from werkzeug.exceptions import Conflict, BadRequest, NotFound
 
 import jwt
-from flask import Flask, Response, jsonify, request, current_app
+from flask import Flask, Response, jsonify, request, current_app, g
 from flask_migrate import Migrate
 from flask_restful import Resource, inputs, reqparse, fields, marshal_with, abort
 from sqlalchemy import create_engine
@@ -17,6 +17,7 @@ from marshmallow import Schema
 from database.users_models import StudyPreferences, db
 from get_env import secret_key
 from helper_functions.middleware_functions import token_required
+from helper_functions.validate_study_preferences import study_preferences_schema
 
 
 # resources fields to serialize the response object
@@ -99,19 +100,7 @@ class StudyPreferencesResource(Resource):
 
     # a private method to validate the user input data before inserting them into the database
     def __validate_form_data(self, errors, **kwargs) -> None:
-        for key, value in kwargs.items():
-            if key == "courses_preferences" and value:
-                # split the string into an array of string represents courses codes
-                course_count = value.split(", ")
-                if len(course_count) > 8:
-                    errors[key] = f"Student must choose at most 8 favorite courses."
-                elif len(course_count) < 1:
-                    errors[key] = f"Student must choose at least 1 favorite course."
-            else:
-                if value == "--select--":
-                    errors[
-                        key
-                    ] = f"Student must choose one of the following options for {key}"
+        errors.update(study_preferences_schema.validate(kwargs))
         return
 
     # a GET method to get the user study preferences from the database and return it to the client
@@ -127,12 +116,10 @@ class StudyPreferencesResource(Resource):
     )
     @marshal_with(_study_preferences_resource_fields)  # serialize the return object
     def get(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
         with current_app.app_context():
             try:
-                # get the token from cookies
-                token = request.cookies.get("token")
-                # decode the token to get the user information
-                decoded_token = jwt.decode(token, secret_key, algorithms=["HS256"])
                 user_information_id = decoded_token["user_information_id"]
                 # query the study preferences table to get the user with the user id
                 user_study_pref = StudyPreferences.query.filter_by(
@@ -166,12 +153,10 @@ class StudyPreferencesResource(Resource):
     )
     @marshal_with(_study_preferences_resource_fields)  # serialize the return object
     def post(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
         with current_app.app_context():
-            # get the token from cookies
             try:
-                token = request.cookies.get("token")
-                # decode the token to get the user information
-                decoded_token = jwt.decode(token, secret_key, algorithms=["HS256"])
                 user_information_id = decoded_token["user_information_id"]
                 # get the users input from the post form data
 
@@ -263,13 +248,10 @@ class StudyPreferencesResource(Resource):
         _study_preferences_resource_fields
     )  # serialize the response object to front-end
     def patch(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
         with current_app.app_context():
-            # get the token from cookies
             try:
-                token = request.cookies.get("token")
-                # decode the token to get the user's study preferences
-                decoded_token = jwt.decode(token, secret_key, algorithms=["HS256"])
-                # get the user_id from the token
                 user_information_id = decoded_token["user_information_id"]
                 # query the study preferences table to see if the user's study preferences record has already been in the database
                 user_study_pref = StudyPreferences.query.filter_by(
@@ -340,14 +322,10 @@ class StudyPreferencesResource(Resource):
     )
     @marshal_with(_study_preferences_resource_fields)
     def delete(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
         with current_app.app_context():
-            # get the token from cookies
             try:
-                token = request.cookies.get("token")
-                decoded_token = jwt.decode(
-                    token, secret_key, algorithms=["HS256"]
-                )  # decode the jwt token
-                # get the user id
                 user_information_id = decoded_token["user_information_id"]
 
                 # query the database to see if the user has the study preferences
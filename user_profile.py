@@ -5,7 +5,7 @@ from http import HTTPStatus
 
 import jwt
 import pytz
-from flask import Flask, Response, request, make_response, jsonify, current_app
+from flask import Flask, Response, request, make_response, jsonify, current_app, g
 from flask_migrate import Migrate
 from flask_restful import (
     Resource,
@@ -25,7 +25,11 @@ from marshmallow import Schema, fields as ma_fields
 from API.locationAPI import LocationValidator
 from database.users_models import Users, UserInformation, Permission, db
 from get_env import secret_key
+from helper_functions.grant_permission import grant_permissions_to_user
 from helper_functions.middleware_functions import token_required
+from helper_functions.permission_registry import permission_registry
+from helper_functions.refresh_tokens import refresh_tokens, set_refresh_token_cookie
+from helper_functions.token_revocation import create_token_id
 from helper_functions.validate_users_information import validate_users_information
 
 # resources fields to serialize the response object
@@ -241,11 +245,10 @@ class UserInformationResource(Resource):
     )
     @marshal_with(_user_information_resource_fields)  # serialize the instance object
     def get(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
         with current_app.app_context():
-            # get the token from cookies
             try:
-                token = request.cookies.get("token")
-                decoded_token = jwt.decode(token, secret_key, algorithms=["HS256"])
                 user_id = decoded_token["id"]  # get the user's id
                 # query the database to get the user with the user id
                 user = UserInformation.query.filter_by(user_id=user_id).first()
@@ -278,15 +281,11 @@ class UserInformationResource(Resource):
         secret_key=secret_key,
     )
     def post(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
         with current_app.app_context():
             try:
-                # get the token from cookies to get the user id
-                user_token = request.cookies.get("token")
-                # decode the token
-                decoded_user_token = jwt.decode(
-                    user_token, secret_key, algorithms=["HS256"]
-                )
-                user_id = decoded_user_token["id"]
+                user_id = decoded_token["id"]
                 # get the user's input from the form data
                 form_data = reqparse.RequestParser()
                 self.__form_data_add_arguments(
@@ -398,20 +397,14 @@ class UserInformationResource(Resource):
                         "can_view_availability_schedule",
                         "can_change_availability_schedule",
                     ]
-                    for permission in permission_lists:
-                        # get the user's permission list from the db
-                        give_permission = Permission.query.filter_by(
-                            user_id=user_id, name=permission
-                        ).first()
-                        # grant the permission if it is not in there yet
-                        if not give_permission:
-                            give_permission = Permission(
-                                name=permission, user_id=user_id
-                            )
-                            db.session.add(give_permission)
-
-                    # commit the change to the database -> 201 if successful
-                    db.session.commit()
+                    # grant the missing permissions and commit the new profile with them -> 201 if successful
+                    if not grant_permissions_to_user(
+                        user_id=user_id,
+                        permission_names=permission_lists,
+                        db=db,
+                        Permission=Permission,
+                    ):
+                        raise Exception("Cannot grant the permissions to the user")
 
                     find_user_information = UserInformation.query.filter_by(
                         user_id=user_id
@@ -423,13 +416,17 @@ class UserInformationResource(Resource):
                     permissions = [permission.name for permission in user.permissions]
 
                     # generate new jwt token with new permissions to authenticate the user if they can view and change study preferences
+                    access_token_claims = {
+                        "id": str(user_id),
+                        "user_information_id": str(
+                            find_user_information.id
+                        ),  # id of user_information model
+                        **permission_registry.to_claims(permissions),
+                    }
                     new_token = jwt.encode(
                         {
-                            "id": str(user_id),
-                            "user_information_id": str(
-                                find_user_information.id
-                            ),  # id of user_information model
-                            "permissions": permissions,
+                            **access_token_claims,
+                            "jti": create_token_id(),
                             "exp": datetime.now(pytz.timezone("EST"))
                             + timedelta(
                                 minutes=30
@@ -438,6 +435,8 @@ class UserInformationResource(Resource):
                         secret_key,
                         algorithm="HS256",
                     )
+                    # a new refresh token that mints access tokens with the new permissions
+                    refresh_token = refresh_tokens.issue(user_id, access_token_claims)
 
                     find_user_information_schema = UserInformationSchema()
                     user_information = find_user_information_schema.dump(
@@ -453,6 +452,7 @@ class UserInformationResource(Resource):
                         + timedelta(minutes=30),
                         httponly=True,
                     )
+                    set_refresh_token_cookie(new_token_in_cookies, refresh_token)
                     new_token_in_cookies.status_code = HTTPStatus.CREATED
 
                     # return new_token_in_cookies
@@ -488,12 +488,10 @@ class UserInformationResource(Resource):
     )
     @marshal_with(_user_information_resource_fields)
     def patch(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
         with current_app.app_context():
             try:
-                # get the token from cookies
-                token = request.cookies.get("token")
-                # decode the token
-                decoded_token = jwt.decode(token, secret_key, algorithms=["HS256"])
                 user_id = decoded_token["id"]
                 # query the user_information table to see if the user id already has profile
                 user_information = UserInformation.query.filter_by(
@@ -585,13 +583,10 @@ class UserInformationResource(Resource):
     )
     @marshal_with(_user_information_resource_fields)
     def delete(self):
+        # get the claims of the token that has been verified by the middleware function
+        decoded_token = g.token_claims
         with current_app.app_context():
-            # get the token from cookies
             try:
-                token = request.cookies.get("token")
-                decoded_token = jwt.decode(
-                    token, secret_key, algorithms=["HS256"]
-                )  # decode the jwt token
                 # get the user id
                 user_id = decoded_token["id"]
 